@@ -267,6 +267,23 @@ print "LAZYFLOW REQUEST WAIT:   %f seconds for %d iterations" % (t2-t1,mcount)
 print "                                %0.3fms latency" % ((t2-t1)*1e3/mcount,)
 
 
+def inline_waits():
+    for i in range(mcount):
+        # Waited for by its creator before anyone else sees it, so it executes inline.
+        Request(functools.partial(empty_func, b = 11)).wait()
+
+t1 = time.time()
+
+req = Request( inline_waits )
+req.submit()
+req.wait()
+
+t2 = time.time()
+print "\n\n"
+print "LAZYFLOW INLINE REQUEST WAIT:   %f seconds for %d iterations" % (t2-t1,mcount)
+print "                                %0.3fms latency" % ((t2-t1)*1e3/mcount,)
+
+
 t1 = time.time()
 
 pool = Pool()
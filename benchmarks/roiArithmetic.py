@@ -0,0 +1,55 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Micro-benchmarks for the roi arithmetic that the caches perform for every request.
+Prints the time per call (in microseconds) of each statement.
+"""
+import timeit
+
+setup = """
+from lazyflow.roi import TinyVector, TinyPoint, getIntersectingBlocks, getIntersectingBlockStarts
+start = TinyVector( (0, 100, 100, 10, 0) )
+stop = TinyVector( (1, 228, 228, 74, 1) )
+blockshape = (1, 64, 64, 64, 1)
+p = TinyPoint( (0, 64, 128, 0, 0) )
+"""
+
+statements = [ ("vector + tuple",
+                "start + blockshape"),
+               ("vector - scalar",
+                "stop - 1"),
+               ("vector < vector",
+                "(start < stop).all()"),
+               ("block range (OpBlockedArrayCache)",
+                "start // blockshape, (stop + blockshape - 1) // blockshape"),
+               ("point + tuple",
+                "p + blockshape"),
+               ("block starts as numpy rows, then tuples",
+                "map( tuple, getIntersectingBlocks( blockshape, (start, stop) ) )"),
+               ("block starts as TinyPoints",
+                "getIntersectingBlockStarts( blockshape, (start, stop) )") ]
+
+if __name__ == "__main__":
+    number = 20000
+    for name, stmt in statements:
+        t = min( timeit.repeat( stmt, setup, number=number, repeat=3 ) )
+        print "{:<42} {:8.2f} us".format( name, 1e6 * t / number )
@@ -38,6 +38,10 @@ expose_submodules.expose_submodules(submodule_dir)
 
 AVAILABLE_RAM_MB = 0 # 0 means "determine with psutil"
 
+# Clean cache blocks that are evicted from RAM can be written to disk (instead of being recomputed).
+SPILL_TO_DISK_MB = 0 # 0 means "don't spill"
+SPILL_DIRECTORY = None # None means "use the system's temp directory"
+
 import utility
 import roi
 import rtype
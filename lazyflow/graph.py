@@ -73,12 +73,122 @@ import numpy
 from lazyflow import rtype
 from lazyflow.request import Request
 from lazyflow.stype import ArrayLike
-from lazyflow.utility import slicingtools, Tracer, OrderedSignal, Singleton
+from lazyflow.utility import slicingtools, Tracer, OrderedSignal, Singleton, OperatorProfiler, DirtyRoiBatch
 from lazyflow.slot import InputSlot, OutputSlot, Slot
 from lazyflow.operator import Operator, InputDict, OutputDict, OperatorMetaClass
 from lazyflow.operatorWrapper import OperatorWrapper
 from lazyflow.metaDict import MetaDict
 
+def _downstreamOperators(op):
+    """
+    Return the operators that receive data or metadata directly from the given operator,
+    i.e. the owners of the input slots connected to its outputs (or to its inputs, for internal operators).
+    Output slots of parent operators that just forward an output are skipped.
+    """
+    downstream = collections.OrderedDict()
+    def visit(slot):
+        for subslot in slot._subSlots:
+            visit(subslot)
+        for partner in slot.partners:
+            if partner._type == "output":
+                visit(partner)
+            else:
+                partnerOp = partner.getRealOperator()
+                if partnerOp is not None and partnerOp is not op:
+                    downstream[partnerOp] = None
+    for slot in op.inputs.values() + op.outputs.values():
+        visit(slot)
+    return downstream.keys()
+
+def _topologicalOrder(operators):
+    """
+    Return the given operators and all operators downstream of them in topological order.
+    (Operators that are part of a cycle are appended at the end, in no particular order.)
+    """
+    # Find all affected operators and their connections
+    downstream = collections.OrderedDict()
+    queue = collections.deque(operators)
+    while queue:
+        op = queue.popleft()
+        if op not in downstream:
+            downstream[op] = _downstreamOperators(op)
+            queue.extend( downstream[op] )
+
+    in_degree = dict.fromkeys( downstream, 0 )
+    for children in downstream.values():
+        for child in children:
+            in_degree[child] += 1
+
+    # Kahn's algorithm
+    order = []
+    queue = collections.deque( op for op in downstream if in_degree[op] == 0 )
+    while queue:
+        op = queue.popleft()
+        order.append( op )
+        for child in downstream[op]:
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                queue.append( child )
+
+    if len(order) < len(downstream):
+        ordered = set(order)
+        order += [ remaining for remaining in downstream if remaining not in ordered ]
+    return order
+
+class _ConfigurationTransaction(object):
+    """
+    The operators whose setup was deferred by an open configuration transaction.
+    See ``Graph.configuration_transaction()``.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = collections.OrderedDict() # Used as an ordered set
+        self._local = threading.local()
+
+    def enter_setup(self):
+        """
+        Called when an operator's setupOutputs() starts.
+        Operators configured from within setupOutputs() (i.e. internal operators) are set up immediately.
+        """
+        self._local.setup_depth = getattr( self._local, 'setup_depth', 0 ) + 1
+
+    def exit_setup(self):
+        self._local.setup_depth -= 1
+
+    def defer_setup(self, op):
+        """
+        Called when the given operator needs to be set up.
+        Returns True if the setup was deferred until the transaction is committed,
+        or False if the operator must be set up immediately.
+        """
+        with self._lock:
+            if getattr( self._local, 'setup_depth', 0 ) > 0:
+                # It is set up now, so there's no need to set it up again later.
+                self._pending.pop( op, None )
+                return False
+            self._pending[op] = None
+            return True
+
+    def commit(self):
+        """
+        Set up all pending operators, in topological order.
+        Setting up an operator may change its outputs, which marks the operators downstream of it as pending,
+        so they're set up later in the same pass.
+        """
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                pending = self._pending.keys()
+
+            for op in _topologicalOrder( pending ):
+                with self._lock:
+                    if op not in self._pending:
+                        continue
+                    del self._pending[op]
+                if op.configured() and not op._cleaningUp:
+                    op._setupOutputs()
+
 class Graph(object):
     """
     A Graph instance is shared by all connected operators and contains any 
@@ -89,6 +199,145 @@ class Graph(object):
         self._sig_setup_complete = None
         self._lock = threading.Lock()
 
+        # Only created while profiling is enabled.  (Checked on every execute() call.)
+        self._profiler = None
+        self._profiler_stats = OperatorProfiler()
+
+        # Only exists while dirty notifications are batched.  (Checked on every setDirty() call.)
+        self._dirty_batch = None
+        self._dirty_batch_depth = 0
+
+        # Only exists while a configuration transaction is open.  See configuration_transaction()
+        self._configuration_transaction = None
+        self._configuration_transaction_depth = 0
+
+    def enable_profiling(self, enabled=True):
+        """
+        Start (or stop) recording execution statistics for every operator in this graph.
+        Statistics collected so far are kept.  See :py:meth:`profiling_report()`.
+        """
+        if enabled:
+            self._profiler_stats.activate()
+            self._profiler = self._profiler_stats
+        else:
+            self._profiler = None
+            self._profiler_stats.deactivate()
+
+    def profiling_report(self):
+        """
+        Return the execution statistics recorded while profiling was enabled.
+        See :py:meth:`lazyflow.utility.OperatorProfiler.report()` for the format.
+        """
+        return self._profiler_stats.report()
+
+    def reset_profiling(self):
+        """
+        Discard all execution statistics recorded so far.
+        """
+        self._profiler_stats.reset()
+
+    def batch_dirty_notifications(self):
+        """
+        Return a context manager that defers all dirty notifications (``Slot.setDirty()``) in this graph
+        until the outermost ``with`` block exits.  Then, the dirty rois of each slot are merged into
+        a few bounding boxes and propagated downstream, so many small changes (e.g. painting a brush stroke with
+        many calls to ``setInSlot()``) cost only a few invalidations of the downstream operators.
+
+        .. code-block:: python
+
+            with graph.batch_dirty_notifications():
+                for key, value in brush_dabs:
+                    opLabels.LabelInput[key] = value
+
+        .. note:: While the batch is open, notifications from *all* threads are deferred,
+                  so downstream caches may return stale data until it is closed.
+        """
+        return Graph.DirtyBatchContext(self)
+
+    class DirtyBatchContext(object):
+        """
+        A context manager to manage the "depth" of nested dirty notification batches.
+        When the depth reaches zero, the collected notifications are propagated.
+        """
+        def __init__(self, g):
+            self._graph = g
+
+        def __enter__(self):
+            with self._graph._lock:
+                if self._graph._dirty_batch_depth == 0:
+                    self._graph._dirty_batch = DirtyRoiBatch()
+                self._graph._dirty_batch_depth += 1
+
+        def __exit__(self, *args):
+            dirty_batch = None
+            with self._graph._lock:
+                self._graph._dirty_batch_depth -= 1
+                if self._graph._dirty_batch_depth == 0:
+                    dirty_batch = self._graph._dirty_batch
+                    # Reset before flushing, so the notifications are actually propagated.
+                    self._graph._dirty_batch = None
+            if dirty_batch is not None:
+                dirty_batch.flush()
+
+    def configuration_transaction(self):
+        """
+        Return a context manager that defers the ``setupOutputs()`` calls of all operators in this graph
+        until the outermost ``with`` block exits.  Then, each operator that needs to be (re)configured is
+        set up only once, in topological order (upstream operators first).
+        Without a transaction, an operator is set up again after each change of any of its inputs,
+        which can be very costly when connecting a big workflow.
+
+        .. code-block:: python
+
+            with graph.configuration_transaction():
+                for lane_op, data in zip(lane_ops, lane_data):
+                    lane_op.RawData.setValue( data )
+                    lane_op.Labels.connect( opLabels.Output )
+
+        .. note:: Within the ``with`` block, output metadata is not updated yet.
+                  (Operators' own ``setupOutputs()`` implementations are not affected:
+                  Internal operators configured from within ``setupOutputs()`` are still set up immediately.)
+        """
+        return Graph.ConfigurationTransactionContext(self)
+
+    class ConfigurationTransactionContext(object):
+        """
+        A context manager to manage the "depth" of nested configuration transactions.
+        When the depth reaches zero, the transaction is committed.
+        Also acts as a SetupDepthContext, so callbacks registered with call_when_setup_finished()
+        are called after the transaction was committed.
+        """
+        def __init__(self, g):
+            self._graph = g
+            self._setup_depth_context = Graph.SetupDepthContext(g)
+
+        def __enter__(self):
+            self._setup_depth_context.__enter__()
+            with self._graph._lock:
+                if self._graph._configuration_transaction_depth == 0:
+                    self._graph._configuration_transaction = _ConfigurationTransaction()
+                self._graph._configuration_transaction_depth += 1
+
+        def __exit__(self, *args):
+            try:
+                transaction = None
+                with self._graph._lock:
+                    if self._graph._configuration_transaction_depth == 1:
+                        # Keep the depth while committing, so transactions opened
+                        # during the commit don't replace this one.
+                        transaction = self._graph._configuration_transaction
+                    else:
+                        self._graph._configuration_transaction_depth -= 1
+                if transaction is not None:
+                    try:
+                        transaction.commit()
+                    finally:
+                        with self._graph._lock:
+                            self._graph._configuration_transaction_depth = 0
+                            self._graph._configuration_transaction = None
+            finally:
+                self._setup_depth_context.__exit__(*args)
+
     def call_when_setup_finished(self, fn):
         # The graph is considered in "setup" mode if any slot is executing a function that affects the state of the graph.
         # See slot.py for details.  Such operations typically invoke a chain reaction of setup operations.
@@ -99,6 +99,17 @@ class OperatorMetaClass(ABCMeta):
             if isinstance(v, OutputSlot):
                 v.name = k
                 cls.outputSlots.append(v)
+
+        # A passthroughOutputs declaration describes a particular execute() implementation.
+        # Subclasses that override execute() don't inherit it (unless they declare it again).
+        if 'execute' in classDict and 'passthroughOutputs' not in classDict:
+            cls.passthroughOutputs = ()
+        # The same goes for the roi mapping.
+        if 'execute' in classDict and 'mapRoiToInputs' not in classDict:
+            cls.mapRoiToInputs = Operator.mapRoiToInputs.im_func
+        # ...and for the pixel-wise stage that an operator contributes to a fused chain (see OpPixelOperator).
+        if 'execute' in classDict and '_elementwiseStage' not in classDict:
+            cls._elementwiseStage = None
         return cls
 
     def __call__(cls, *args, **kwargs):
@@ -170,6 +181,14 @@ class Operator(object):
     description = ""
     category = "lazyflow"
 
+    # Names of output slots whose data is just (a view of) data from an input slot.
+    # When such an output is requested without a destination, execute() is called with result=None,
+    # and must return a view of the upstream result instead of writing into a freshly allocated array.
+    # (When a destination is given, execute() should forward it upstream via writeInto(), as usual.)
+    # That way, the data is materialized only once, no matter how many pass-through operators it flows through.
+    # Note: Not inherited by subclasses that override execute().
+    passthroughOutputs = ()
+
     __metaclass__ = OperatorMetaClass
 
     def __new__(cls, *args, **kwargs):
@@ -391,6 +410,20 @@ class Operator(object):
         for child in children:
             child.cleanUp()
 
+    def mapRoiToInputs(self, slot, subindex, roi):
+        """
+        Optional: Return the input data needed to compute the given roi of
+        the given output slot, as a list of (inputSlot, roi) pairs, i.e. the
+        requests execute() will make (including any halo).  Inputs that only
+        provide parameters (e.g. sigmas) need not be listed.
+
+        The default implementation returns None, meaning the mapping is
+        unknown.  Used by :py:func:`lazyflow.utility.planUpstreamRois()`.
+
+        Note: Not inherited by subclasses that override execute().
+        """
+        return None
+
     def propagateDirty(self, slot, subindex, roi):
         """This method is called when an output of another operator on
         which this operators depends, i.e. to which it is connected gets
@@ -447,7 +480,15 @@ class Operator(object):
             old_metadata = { s: s.meta.copy() for s in self.outputs.values() }
 
             # Call the subclass
-            self.setupOutputs()
+            # (Internal operators are set up immediately, even within a configuration transaction.)
+            transaction = self.graph._configuration_transaction
+            if transaction is not None:
+                transaction.enter_setup()
+            try:
+                self.setupOutputs()
+            finally:
+                if transaction is not None:
+                    transaction.exit_setup()
             self._setup_count += 1
 
             self._settingUp = False
@@ -20,8 +20,8 @@
 #		   http://ilastik.org/license/
 ###############################################################################
 #Python
-import gc
 import os
+import collections
 import time
 import threading
 import platform
@@ -30,11 +30,11 @@ logger = logging.getLogger(__name__)
 traceLogger = logging.getLogger("TRACE." + __name__)
 
 #external dependencies
-import blist
 import psutil
 
 #lazyflow
 from lazyflow.utility import OrderedSignal
+from lazyflow.operators.blockSpillStore import BlockSpillStore
 import lazyflow
 
 this_process = psutil.Process(os.getpid())
@@ -72,7 +72,27 @@ class MemInfoNode:
         self.children = []
 
 class ArrayCacheMemoryMgr(threading.Thread):
+    """
+    Keeps the memory held by all caches within a byte budget.
+
+    Caches charge the manager for each block of memory they allocate (see 
+    charge()), credit it when they free the memory themselves (see credit()), 
+    report each access to a block via touch(), and report how long it took 
+    to compute a block's data via recordCost().  If a charge exceeds the 
+    budget, other blocks (of any cache) are evicted immediately, by calling 
+    their cache's _evictBlock() method.  By default, the blocks that are 
+    cheapest to recompute (per byte) are evicted first, with blocks that 
+    haven't been used for a while counting as cheaper (see setEvictionPolicy()).
+    Caches may spill clean blocks they evict to the spill store (see spillStore()), if there is one.
+
+    The thread itself only reports memory usage statistics.
+    """
     
+    # Eviction policies
+    LRU = 'lru'
+    LFU = 'lfu'
+    COST = 'cost'
+
     totalCacheMemory = OrderedSignal()
 
     loggingName = __name__ + ".ArrayCacheMemoryMgr"
@@ -83,19 +103,29 @@ class ArrayCacheMemoryMgr(threading.Thread):
         threading.Thread.__init__(self)
         self.daemon = True
 
-        self.caches = self._new_list()
         self.namedCaches = []
 
-        self._max_usage = 85
+        # The default budget is this percentage of the available RAM
         self._target_usage = 70
+        # Above this fraction of the budget, we are 'under pressure'
+        self._pressure_fraction = 0.9
+        self._budget = None
+        self._policy = ArrayCacheMemoryMgr.COST
+        # For the COST policy: The weight of a block's recompute cost halves 
+        #  for every this many seconds since the block's last access.
+        self._recency_halflife = 60.0
+
+        # (cache, block) -> [nbytes, access count, recompute seconds, last access time],
+        #  ordered from least to most recently used
+        self._blocks = collections.OrderedDict()
+        self._charged = 0
+
+        # Created on demand if lazyflow.SPILL_TO_DISK_MB > 0 (see spillStore())
+        self._spill_store = None
+
         self._lock = threading.Lock()
         self._last_usage = memoryUsagePercentage()
 
-    def _new_list(self):
-        def getPrio(array_cache):
-            return array_cache._cache_priority
-        return blist.sortedlist((), getPrio)
-
     def addNamedCache(self, array_cache):
         """add a cache to a special list of named caches
         
@@ -106,16 +136,194 @@ class ArrayCacheMemoryMgr(threading.Thread):
         """
         self.namedCaches.append(array_cache)
 
-    def add(self, array_cache):
+    def budget(self):
+        """
+        Return the number of bytes all caches may hold together.
+        """
+        if self._budget is None:
+            self._budget = int( getAvailableRamBytes() * self._target_usage / 100.0 )
+        return self._budget
+
+    def setBudget(self, nbytes):
+        """
+        Set the number of bytes all caches may hold together.
+        If nbytes is None, use the default: 70% of the available RAM.
+        If the caches currently hold more than that, blocks are evicted immediately.
+        """
+        with self._lock:
+            self._budget = nbytes
+            victims = self._selectVictims(exclude=None)
+        self._evict(victims)
+
+    def spillStore(self):
+        """
+        Return the BlockSpillStore that caches should write their evicted (clean) 
+        blocks to, or None if evicted blocks should simply be dropped.
+        By default, a store is created on first use if lazyflow.SPILL_TO_DISK_MB > 0.
+        """
+        if self._spill_store is None and lazyflow.SPILL_TO_DISK_MB > 0:
+            with self._lock:
+                if self._spill_store is None:
+                    self._spill_store = BlockSpillStore( lazyflow.SPILL_TO_DISK_MB * 1024**2, 
+                                                         lazyflow.SPILL_DIRECTORY )
+        return self._spill_store
+
+    def setSpillStore(self, store):
+        """
+        Replace the spill store (None: don't spill).
+        The blocks in the old store are discarded.
+        """
+        with self._lock:
+            old_store, self._spill_store = self._spill_store, store
+        if old_store is not None and old_store is not store:
+            old_store.close()
+
+    def setEvictionPolicy(self, policy):
+        """
+        Choose which blocks are evicted first: 
+        the least recently used (LRU), the least frequently used (LFU), or 
+        the ones with the lowest recompute cost per byte, weighted by recency (COST).
+        Under the COST policy, blocks without a recorded cost (see recordCost()) 
+        are evicted first, in LRU order.
+        """
+        assert policy in (ArrayCacheMemoryMgr.LRU, ArrayCacheMemoryMgr.LFU, ArrayCacheMemoryMgr.COST), \
+            "Unknown eviction policy: {}".format( policy )
+        self._policy = policy
+
+    def chargedBytes(self):
+        """
+        Return the number of bytes currently charged by all caches together.
+        """
+        return self._charged
+
+    def charge(self, cache, nbytes, block=None):
+        """
+        Record that the given cache now holds nbytes of memory for the 
+        given block (or for all its data, if block is None).
+        If this exceeds the budget, other blocks are evicted 
+        before this function returns.
+        """
+        key = (cache, block)
+        with self._lock:
+            old_entry = self._blocks.pop(key, None)
+            if old_entry is not None:
+                self._charged -= old_entry[0]
+            self._blocks[key] = [nbytes, 1, 0.0, time.time()]
+            self._charged += nbytes
+            victims = self._selectVictims(exclude=key)
+        self._evict(victims)
+
+    def credit(self, cache, block=None):
+        """
+        Record that the given cache has freed the memory of the given block.
+        """
         with self._lock:
-            self.caches.add(array_cache)
+            entry = self._blocks.pop((cache, block), None)
+            if entry is not None:
+                self._charged -= entry[0]
 
-    def remove(self, array_cache):
+    def touch(self, cache, block=None):
+        """
+        Record an access to the given block (for the eviction order).
+        """
+        key = (cache, block)
         with self._lock:
-            try:
-                self.caches.remove(array_cache)
-            except ValueError:
-                pass
+            entry = self._blocks.pop(key, None)
+            if entry is not None:
+                entry[1] += 1
+                entry[3] = time.time()
+                self._blocks[key] = entry
+
+    def recordCost(self, cache, seconds, block=None):
+        """
+        Record that computing (part of) the given block's data took the given 
+        number of seconds.  Costs of several fills of the same block add up.
+        """
+        with self._lock:
+            entry = self._blocks.get((cache, block))
+            if entry is not None:
+                entry[2] += seconds
+
+    def remove(self, cache):
+        """
+        Credit all blocks of the given cache, e.g. when it is cleaned up.
+        Its spilled blocks (if any) are discarded, too.
+        """
+        with self._lock:
+            for key in [ key for key in self._blocks if key[0] is cache ]:
+                self._charged -= self._blocks.pop(key)[0]
+            spill_store = self._spill_store
+        if spill_store is not None:
+            spill_store.remove(cache)
+
+    def isUnderPressure(self):
+        """
+        Return True if the caches (almost) use up the budget,
+        i.e. if it's a bad time to fill caches speculatively.
+        """
+        return self._charged > self._pressure_fraction * self.budget()
+
+    def _selectVictims(self, exclude):
+        """
+        Remove the blocks that must be evicted to get back within the budget, 
+        and return them as a list of (key, entry) pairs.  
+        The 'exclude' block (a (cache, block) key) is never selected.
+        Must be called with the lock held.
+        """
+        excess = self._charged - self.budget()
+        if excess <= 0:
+            return []
+
+        if self._policy == ArrayCacheMemoryMgr.LRU:
+            candidates = self._blocks.iterkeys()
+        elif self._policy == ArrayCacheMemoryMgr.LFU:
+            # Least frequently used first.  Ties are broken by recency.
+            counts = ( (entry[1], i, key) for i, (key, entry) in enumerate(self._blocks.iteritems()) )
+            candidates = ( key for _, _, key in sorted(counts) )
+        else:
+            # Cheapest to recompute (per byte) first.  Ties are broken by recency.
+            now = time.time()
+            halflife = self._recency_halflife
+            scores = ( ( entry[2] / max(entry[0], 1) * 0.5**((now - entry[3]) / halflife), i, key )
+                       for i, (key, entry) in enumerate(self._blocks.iteritems()) )
+            candidates = ( key for _, _, key in sorted(scores) )
+
+        victim_keys = []
+        for key in candidates:
+            if excess <= 0:
+                break
+            if key != exclude:
+                victim_keys.append(key)
+                excess -= self._blocks[key][0]
+
+        victims = []
+        for key in victim_keys:
+            entry = self._blocks.pop(key)
+            self._charged -= entry[0]
+            victims.append( (key, entry) )
+        return victims
+
+    def _evict(self, victims):
+        """
+        Ask the owners of the given blocks to free them.
+        Must be called WITHOUT the lock held: caches credit us when they free memory.
+        """
+        evicted_count = 0
+        evicted_bytes = 0
+        for key, entry in victims:
+            cache, block = key
+            if cache._evictBlock(block):
+                evicted_count += 1
+                evicted_bytes += entry[0]
+            else:
+                # The block is in use.  Keep accounting for it (as most recently used).
+                with self._lock:
+                    if key not in self._blocks:
+                        self._blocks[key] = entry
+                        self._charged += entry[0]
+        if victims:
+            self.traceLogger.debug( "Evicted {} of {} blocks ({} bytes), now charged: {} of {} bytes"
+                                    .format( evicted_count, len(victims), evicted_bytes, self._charged, self.budget() ) )
 
     def run(self):
         while True:
@@ -139,37 +347,3 @@ class ArrayCacheMemoryMgr(threading.Thread):
             self.totalCacheMemory(tot)
                 
             time.sleep(10)
-
-            if mem_usage > self._max_usage:
-                self.logger.info("freeing memory...")
-                with self._lock:
-                    count = 0
-                    not_freed = []
-                    old_length = len(self.caches)
-                    new_caches = self._new_list()
-                    self.traceLogger.debug("Updating {} caches".format( len(self.caches) ))
-                    for c in iter(self.caches):
-                        c._updatePriority(c._last_access)
-                        new_caches.add(c)
-                    self.caches = new_caches
-                    gc.collect()
-                    self.traceLogger.debug("Target mem usage: {}".format(self._target_usage))
-                    while mem_usage > self._target_usage and len(self.caches) > 0:
-                        self.traceLogger.debug("Mem usage: {}".format(mem_usage))
-                        last_cache = self.caches.pop(-1)
-                            
-                        freed = last_cache._freeMemory(refcheck = True)
-                        self.traceLogger.debug("Freed: {}".format(freed))
-                        mem_usage = memoryUsagePercentage()
-                        count += 1
-                        if freed == 0:
-                            # store the caches which could not be freed
-                            not_freed.append(last_cache)
-
-                gc.collect()
-
-                self.logger.info("freed %d/%d blocks, new usage = %f%%" % (count,old_length, mem_usage))
-                
-                for c in not_freed:
-                    # add the caches which could not be freed
-                    self.add(c)
@@ -0,0 +1,133 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+import numpy
+
+from lazyflow.request import Request
+
+class BlockPrefetcher(object):
+    """
+    Watches the rois requested from a block cache (in block coordinates) and detects sequential
+    or strided access along one axis, e.g. a user scrolling through z in a viewer:
+    When a request covers the same blocks as the previous one, shifted along a single axis by the same step
+    as the previous one was, the next ``num_steps`` block rois in that direction are requested in the background.
+
+    Prefetch requests are detached root requests of priority class ``Request.BACKGROUND``,
+    so they never delay interactive work.  Outstanding prefetch requests are cancelled when the access pattern
+    changes or when ``memory_pressure()`` returns True (no new ones are started then, either).
+
+    :param fetch: Called as ``fetch(block_start, block_stop)``.  Must return a list of (unsubmitted) requests
+                  that fill the cache for the given roi of blocks.  (Their results should be None, since
+                  the requests are kept until the roi is passed.)
+    :param num_steps: How many steps ahead to prefetch
+    :param block_grid_shape: The number of blocks along each axis
+    :param memory_pressure: Optional.  A function that returns True if no memory should be spent on prefetching.
+    """
+    def __init__(self, fetch, num_steps, block_grid_shape, memory_pressure=None):
+        self._fetch = fetch
+        self._num_steps = num_steps
+        self._grid_shape = numpy.array(block_grid_shape)
+        self._memory_pressure = memory_pressure or (lambda: False)
+        self._lock = threading.Lock()
+
+        self._last_roi = None
+        self._step = None
+
+        # { (block_start, block_stop) : [request, ...] }
+        # Rois prefetched (or being prefetched) since the access pattern was last changed
+        self._prefetched = {}
+
+    def record_access(self, block_start, block_stop):
+        """
+        Called by the cache for each request it receives (but not for prefetch requests).
+        """
+        block_start = numpy.array(block_start, dtype=int)
+        block_stop = numpy.array(block_stop, dtype=int)
+
+        to_cancel = []
+        to_fetch = []
+        with self._lock:
+            step = None
+            if self._last_roi is not None and (self._last_roi[1] - self._last_roi[0] == block_stop - block_start).all():
+                delta = block_start - self._last_roi[0]
+                if numpy.count_nonzero(delta) == 1:
+                    step = delta
+            confirmed = ( step is not None and self._step is not None and (step == self._step).all() )
+            self._last_roi = (block_start, block_stop)
+            self._step = step
+
+            if not confirmed or self._memory_pressure():
+                to_cancel = self._prefetched.values()
+                self._prefetched = {}
+            else:
+                # Forget rois we have passed already.  (Their requests are finished, or needed by the current access.)
+                prefetched, self._prefetched = self._prefetched, {}
+                for k in range(1, self._num_steps+1):
+                    start = numpy.maximum( block_start + k*step, 0 )
+                    stop = numpy.minimum( block_stop + k*step, self._grid_shape )
+                    if (start >= stop).any():
+                        # Reached the end of the data
+                        break
+                    key = ( tuple(start), tuple(stop) )
+                    if key in prefetched:
+                        self._prefetched[key] = prefetched[key]
+                    else:
+                        to_fetch.append( key )
+                        self._prefetched[key] = []
+
+        for requests in to_cancel:
+            for req in requests:
+                req.cancel()
+
+        for key in to_fetch:
+            with Request.priority_class_context( Request.BACKGROUND, detached=True ):
+                requests = self._fetch( *key )
+                for req in requests:
+                    req.notify_failed( self._handle_failed )
+                Request.submit_many( requests )
+            with self._lock:
+                if key in self._prefetched:
+                    self._prefetched[key] = requests
+                    continue
+            # The pattern changed in the meantime.
+            for req in requests:
+                req.cancel()
+
+    def cancel(self):
+        """
+        Cancel all outstanding prefetch requests and forget the access history.
+        """
+        with self._lock:
+            to_cancel = self._prefetched.values()
+            self._prefetched = {}
+            self._last_roi = None
+            self._step = None
+        for requests in to_cancel:
+            for req in requests:
+                req.cancel()
+
+    def _handle_failed(self, exc, exc_info):
+        # Prefetching is just speculation.  If the data is actually needed, the error will reappear.
+        logger.debug( "Prefetch request failed: {}".format( exc ) )
@@ -0,0 +1,193 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+#Python
+import os
+import shutil
+import tempfile
+import atexit
+import itertools
+import threading
+import collections
+import logging
+logger = logging.getLogger(__name__)
+
+#SciPy
+import numpy
+
+#lazyflow
+from lazyflow.utility.blockCodecs import getCodec
+
+class BlockSpillStore(object):
+    """
+    A second (disk) tier for the blocks that the ArrayCacheMemoryMgr evicts from RAM.
+
+    Caches put() clean blocks here when they are evicted and take() them back on 
+    the next access, which is usually much cheaper than recomputing them.  Each 
+    block is written to its own file in a (temporary) scratch directory.  If the 
+    files exceed max_bytes, the least recently spilled blocks are deleted.
+
+    Blocks are identified by (cache, block), as in ArrayCacheMemoryMgr.charge().
+    Caches must invalidate() their spilled blocks when they become dirty.
+    """
+    def __init__(self, max_bytes, directory=None, codec='none'):
+        """
+        max_bytes: The maximum total size of the files.
+        directory: The scratch directory will be created within this directory.  
+                   If None, the system's temporary directory is used.
+        codec: The codec for the files (see lazyflow.utility.blockCodecs).
+        """
+        self._max_bytes = max_bytes
+        self._parent_directory = directory
+        self._directory = None
+        self._codec = getCodec(codec)
+
+        # (cache, block) -> (path, nbytes, shape, dtype, info), ordered from least to most recently spilled
+        self._entries = collections.OrderedDict()
+        self._stored_bytes = 0
+        self._file_ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def maxBytes(self):
+        return self._max_bytes
+
+    def storedBytes(self):
+        """
+        Return the total size of the spilled blocks' files.
+        """
+        return self._stored_bytes
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def put(self, cache, block, data, info=None):
+        """
+        Write the given block data to disk.  The (small) info object is kept 
+        in RAM and returned by take() along with the data.  Replaces any 
+        previously spilled copy of the block.
+        If the block can't be written (e.g. the disk is full), it is dropped.
+        """
+        buf = self._codec.compress( numpy.ascontiguousarray(data) )
+        if len(buf) > self._max_bytes:
+            self.invalidate(cache, block)
+            return
+        path = None
+        try:
+            path = os.path.join( self._getDirectory(), "{:08d}.blk".format( next(self._file_ids) ) )
+            with open(path, 'wb') as f:
+                f.write(buf)
+        except (IOError, OSError) as ex:
+            logger.warning( "Could not spill block to disk, dropping it: {}".format( ex ) )
+            if path is not None and os.path.exists(path):
+                self._deleteFiles( [path] )
+            self.invalidate(cache, block)
+            return
+
+        key = (cache, block)
+        with self._lock:
+            old_paths = self._pop(key)
+            self._entries[key] = (path, len(buf), data.shape, data.dtype, info)
+            self._stored_bytes += len(buf)
+            while self._stored_bytes > self._max_bytes:
+                _, entry = self._entries.popitem(last=False)
+                self._stored_bytes -= entry[1]
+                old_paths.append( entry[0] )
+        self._deleteFiles(old_paths)
+
+    def take(self, cache, block=None):
+        """
+        Remove the given block from the store and return (data, info), 
+        or None if the block isn't stored (or its file can't be read).  
+        The returned array is writable.
+        """
+        with self._lock:
+            entry = self._entries.pop( (cache, block), None )
+            if entry is None:
+                return None
+            self._stored_bytes -= entry[1]
+        path, nbytes, shape, dtype, info = entry
+        try:
+            with open(path, 'rb') as f:
+                data = self._codec.decompress( f.read(), dtype ).reshape( shape )
+        except (IOError, OSError) as ex:
+            logger.warning( "Could not read spilled block from disk: {}".format( ex ) )
+            return None
+        finally:
+            if os.path.exists(path):
+                self._deleteFiles( [path] )
+        if not data.flags.writeable:
+            data = data.copy()
+        return data, info
+
+    def invalidate(self, cache, block=None):
+        """
+        Discard the given block (e.g. because it became dirty).
+        """
+        with self._lock:
+            paths = self._pop( (cache, block) )
+        self._deleteFiles(paths)
+
+    def remove(self, cache):
+        """
+        Discard all blocks of the given cache.
+        """
+        with self._lock:
+            paths = []
+            for key in [ key for key in self._entries if key[0] is cache ]:
+                paths += self._pop(key)
+        self._deleteFiles(paths)
+
+    def close(self):
+        """
+        Discard all blocks and delete the scratch directory.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._stored_bytes = 0
+            directory, self._directory = self._directory, None
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _pop(self, key):
+        """
+        Remove the given entry and return a list of the file(s) to delete.
+        Must be called with the lock held.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return []
+        self._stored_bytes -= entry[1]
+        return [ entry[0] ]
+
+    def _deleteFiles(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                logger.warning( "Could not delete spilled block: {}".format( path ) )
+
+    def _getDirectory(self):
+        with self._lock:
+            if self._directory is None:
+                self._directory = tempfile.mkdtemp( prefix='lazyflow-spill-', dir=self._parent_directory )
+                logger.debug( "Spilling evicted cache blocks to: {}".format( self._directory ) )
+                atexit.register( self.close )
+            return self._directory
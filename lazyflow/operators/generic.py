@@ -33,6 +33,7 @@ import vigra
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow import roi
 from lazyflow.roi import roiToSlice, sliceToRoi, TinyVector, getIntersection
+from lazyflow.rtype import SubRegion
 from lazyflow.request import RequestPool
 
 def axisTagObjectFromFlag(flag):
@@ -441,6 +442,8 @@ class OpSingleChannelSelector(Operator):
     inputSlots = [InputSlot("Input"),InputSlot("Index",stype='integer')]
     outputSlots = [OutputSlot("Output")]
 
+    passthroughOutputs = ('Output',)
+
     def setupOutputs(self):
         
         channelAxis=self.Input.meta.axistags.channelIndex
@@ -474,9 +477,35 @@ class OpSingleChannelSelector(Operator):
         newKey = list(key)
         newKey[channelIndex] = slice(index, index+1, None)
         #newKey = key[:-1] + (slice(index,index+1),)
+        if result is None:
+            # Passthrough: Just hand back the upstream result.
+            return self.inputs["Input"][tuple(newKey)].wait()
         self.inputs["Input"][tuple(newKey)].writeInto(result).wait()
         return result
 
+    def mapRoiToInputs(self, slot, subindex, roi):
+        channelIndex = self.Input.meta.axistags.channelIndex
+        start, stop = list(roi.start), list(roi.stop)
+        start[channelIndex] = self.Index.value
+        stop[channelIndex] = self.Index.value+1
+        return [ (self.Input, SubRegion(self.Input, start, stop)) ]
+
+    def _elementwiseStage(self):
+        """
+        Selecting a channel commutes with pixel-wise operations, so this operator can be part of a fused chain.
+        See :py:class:`OpPixelOperator`.
+        """
+        index = self.Index.value
+        channelIndex = self.Input.meta.axistags.channelIndex
+        if self.Input.meta.shape[channelIndex] <= index:
+            # Out of range.  Let the normal execute() complain about it.
+            return None
+        def mapRoi(start, stop):
+            start[channelIndex] = index
+            stop[channelIndex] = index+1
+            return start, stop
+        return _ElementwiseStage( self, mapRoi=mapRoi )
+
     def propagateDirty(self, slot, subindex, roi):
         key = roi.toSlice()
         if slot == self.Input:
@@ -504,6 +533,8 @@ class OpSubRegion(Operator):
     Roi = InputSlot() # value slot. value is a tuple: (start, stop)
     Output = OutputSlot()
 
+    passthroughOutputs = ('Output',)
+
     def setupOutputs(self):
         self._roi = self.Roi.value
         assert isinstance(self._roi[0], tuple)
@@ -523,9 +554,17 @@ class OpSubRegion(Operator):
         input_roi = numpy.array( (output_roi.start, output_roi.stop) )
         input_roi += self._roi[0]
         input_roi = map( tuple, input_roi )
+        if result is None:
+            # Passthrough: Just hand back the upstream result.
+            return self.Input(*input_roi).wait()
         self.Input(*input_roi).writeInto(result).wait()
         return result
 
+    def mapRoiToInputs(self, slot, subindex, output_roi):
+        input_roi = numpy.array( (output_roi.start, output_roi.stop) )
+        input_roi += self._roi[0]
+        return [ (self.Input, SubRegion(self.Input, *input_roi)) ]
+
     def propagateDirty(self, dirtySlot, subindex, input_dirty_roi):
         input_dirty_roi = ( input_dirty_roi.start, input_dirty_roi.stop )
         intersection = getIntersection( input_dirty_roi, self._roi, False )
@@ -623,13 +662,77 @@ class OpMaxChannelIndicatorOperator(Operator):
             self.outputs["Output"].setDirty(key)
 
 
+class _ElementwiseStage(object):
+    """
+    One operator's part of a fused chain of pixel-wise operators (see :py:class:`OpPixelOperator`).
+
+    :param operator: The operator this stage replaces
+    :param function: Applied to (a tile of) the stage's input data, or None for no-op stages (e.g. channel selection).
+    :param dtype: If not None, the function's result is converted to this dtype (as if it were written into the operator's output array).
+    :param mapRoi: Maps an output roi of the stage to the input roi it needs, or None if they are the same.
+                   Signature: ``mapRoi(start, stop) -> (start, stop)`` (the given lists may be modified).
+    """
+    def __init__(self, operator, function=None, dtype=None, mapRoi=None):
+        self.operator = operator
+        self.function = function
+        self.dtype = dtype
+        self.mapRoi = mapRoi
+
+    def apply(self, data):
+        if self.function is None:
+            return data
+        if self.dtype is None:
+            return self.function(data)
+        return numpy.asarray( self.function(data), dtype=self.dtype )
+
+def _tileSlicings(shape, maxTileSize):
+    """
+    Generate slicings that split an array of the given shape into tiles of (at most) maxTileSize elements,
+    or a single row along the last axis, if that's bigger.
+    """
+    shape = tuple(shape)
+    # Find the outermost axis whose trailing sub-array still fits into a tile.
+    innerSize = 1
+    axis = len(shape)
+    while axis > 0 and innerSize * shape[axis-1] <= maxTileSize:
+        axis -= 1
+        innerSize *= shape[axis]
+    if axis == 0:
+        # Everything fits into one tile.
+        yield (slice(None),) * len(shape)
+        return
+
+    # Tile along the previous axis and iterate over all axes before it.
+    axis -= 1
+    step = max( 1, maxTileSize // innerSize )
+    for outerIndex in numpy.ndindex( *shape[:axis] ):
+        for start in range(0, shape[axis], step):
+            yield outerIndex + ( slice(start, min(start+step, shape[axis])), )
+
 class OpPixelOperator(Operator):
+    """
+    Applies a pixel-wise function (e.g. ``lambda a: a*2``) to its input.
+
+    Chains of pixel-wise operators (OpPixelOperator, OpDtypeView and OpSingleChannelSelector) are fused:
+    When the output is requested, the data from the first non-fusable operator upstream is requested directly,
+    and the functions of all operators in the chain are applied to it tile by tile, writing into our result array.
+    That avoids allocating (and passing over) a full-size intermediate array for each operator in the chain.
+
+    .. note:: Since the function may be applied to individual tiles of the data, it must be truly pixel-wise.
+    """
     name = "OpPixelOperator"
     description = "simple pixel operations"
 
     inputSlots = [InputSlot("Input"), InputSlot("Function")]
     outputSlots = [OutputSlot("Output")]
 
+    # If False, chains of pixel-wise operators are never fused.
+    fuseElementwiseChains = True
+
+    # Number of elements processed at once in a fused chain.
+    # Small enough to keep the intermediate results of the chain in the CPU cache.
+    fusedTileSize = 2**16
+
     def setupOutputs(self):
         self.function = self.inputs["Function"].value
 
@@ -648,6 +751,12 @@ class OpPixelOperator(Operator):
             self.Output.meta.drange = tuple(drange_out)
 
     def execute(self, slot, subindex, roi, result):
+        # (Subclasses that override execute() but call this one have no _elementwiseStage, and aren't fused.)
+        if OpPixelOperator.fuseElementwiseChains and self._elementwiseStage is not None:
+            stages, sourceSlot = self._fusableChain()
+            if len(stages) > 1:
+                return self._executeFused(stages, sourceSlot, roi, result)
+
         key = roiToSlice(roi.start,roi.stop)
 
         req = self.inputs["Input"][key]
@@ -658,6 +767,52 @@ class OpPixelOperator(Operator):
         result[:] = self.function(matrix)
         return result
 
+    def mapRoiToInputs(self, slot, subindex, roi):
+        return [ (self.Input, roi) ]
+
+    def _elementwiseStage(self):
+        return _ElementwiseStage( self, function=self.function, dtype=self.Output.meta.dtype )
+
+    def _fusableChain(self):
+        """
+        Return the stages of the chain of fusable operators that ends with this one (most downstream first),
+        and the slot that provides the data for the first stage.
+        """
+        stages = [ self._elementwiseStage() ]
+        sourceSlot = self.Input._upstreamSource()
+        while True:
+            upstreamOp = sourceSlot.operator
+            if not isinstance(sourceSlot, OutputSlot) or not isinstance(upstreamOp, Operator) \
+               or getattr(upstreamOp, '_elementwiseStage', None) is None:
+                break
+            stage = upstreamOp._elementwiseStage()
+            if stage is None:
+                break
+            stages.append( stage )
+            sourceSlot = upstreamOp.Input._upstreamSource()
+        return stages, sourceSlot
+
+    def _executeFused(self, stages, sourceSlot, roi, result):
+        # Determine the roi of the source data
+        start, stop = list(roi.start), list(roi.stop)
+        for stage in stages:
+            if stage.mapRoi is not None:
+                start, stop = stage.mapRoi( start, stop )
+
+        req = sourceSlot( start, stop )
+        # Use the result array as the only buffer (if possible).
+        # Each tile is read completely before its result is written back.
+        if sourceSlot.meta.dtype == result.dtype:
+            req.writeInto(result)
+        source = req.wait()
+
+        for tileSlicing in _tileSlicings( result.shape, OpPixelOperator.fusedTileSize ):
+            tile = source[tileSlicing]
+            for stage in reversed(stages):
+                tile = stage.apply(tile)
+            result[tileSlicing] = tile
+        return result
+
     def propagateDirty(self, slot, subindex, roi):
         key = roi.toSlice()
         if slot == self.Input:
@@ -874,6 +1029,17 @@ class OpDtypeView(Operator):
         self.Input(roi.start, roi.stop).writeInto( result_view ).wait()
         return result
 
+    def mapRoiToInputs(self, slot, subindex, roi):
+        return [ (self.Input, roi) ]
+
+    def _elementwiseStage(self):
+        """
+        A dtype view is trivially pixel-wise, so this operator can be part of a fused chain.
+        See :py:class:`OpPixelOperator`.
+        """
+        dtype = self.Output.meta.dtype
+        return _ElementwiseStage( self, function=lambda a: a.view(dtype) )
+
     def propagateDirty(self, slot, subindex, roi):
         self.Output.setDirty( roi )
 
@@ -93,29 +93,45 @@ class OpBaseVigraFilter(Operator):
         outputSlot.meta.assignFrom(inputSlot.meta)
         outputSlot.setShapeAtAxisTo('c', channelNum)
         
+    def _sourceRoi(self, roi, halo):
+        """
+        expands the given output roi (in-place) to the source roi needed to compute it
+        """
+        channelIndex, timeIndex = self._channelAndTimeIndex()
+        roi.setInputShape(self.Input.meta.shape)
+        return roi.expandByShape(halo,channelIndex,timeIndex).adjustChannel(self.channelsPerChannel(),channelIndex,self.getChannelResolution())
+
+    def _channelAndTimeIndex(self):
+        """
+        returns the channel index and the time index (or None) of the input
+        """
+        axistags = self.Input.meta.axistags
+        timeIndex = axistags.index('t')
+        if timeIndex >= len(axistags):
+            timeIndex = None
+        return axistags.index('c'), timeIndex
+
+    def mapRoiToInputs(self, slot, subindex, roi):
+        halo = self.calculateHalo(self.setupFilter())
+        return [ (self.Input, self._sourceRoi(roi.copy(), halo)) ]
+
     def execute(self, slot, subindex, roi, result):
         roi = roi.copy() 
         #request,set or compute the necessary parameters
         axistags = self.Input.meta.axistags
         inputShape  = self.Input.meta.shape
-        channelIndex = axistags.index('c')
-        channelsPerC = self.channelsPerChannel()
-        channelRes = self.getChannelResolution()
-        timeIndex = axistags.index('t')
-        if timeIndex >= roi.dim:
-            timeIndex = None
-        roi.setInputShape(inputShape)
+        channelIndex, timeIndex = self._channelAndTimeIndex()
         origRoi = roi.copy()
         sigma = self.setupFilter()
         halo = self.calculateHalo(sigma)
         
         #set up the roi to get the necessary source
-        roi.expandByShape(halo,channelIndex,timeIndex).adjustChannel(channelsPerC,channelIndex,channelRes)
+        self._sourceRoi(roi, halo)
         source = self.Input(roi.start,roi.stop).wait()
         source = vigra.VigraArray(source,axistags=axistags)
         
         #set up the grid for the iterator, and the iterator
-        srcGrid = [source.shape[i] if i!= channelIndex else channelRes for i in range(len(source.shape))]
+        srcGrid = [source.shape[i] if i!= channelIndex else self.getChannelResolution() for i in range(len(source.shape))]
         trgtGrid = [inputShape[i]  if i != channelIndex else self.channelsPerChannel() for i in range(len(source.shape))]
         if timeIndex is not None:
             srcGrid[timeIndex] = 1
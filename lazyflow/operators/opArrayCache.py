@@ -151,8 +151,54 @@ class OpArrayCache(OpCache):
                         self._blockState[:] = OpArrayCache.DIRTY
                         del self._cache
                         self._cache = None
+                    self._memory_manager.credit(self)
             return freed
 
+    def _evictBlock(self, block):
+        """
+        Overridden from OpCache.
+        Our whole cache array is charged as a single block (block=None).
+        """
+        # Don't wait for our locks: the memory manager may be evicting 
+        #  us on behalf of another cache that holds its own locks.
+        if not self._cacheLock.acquire(False):
+            return False
+        try:
+            if not self._lock.acquire(False):
+                return False
+            try:
+                if self._cache is None:
+                    return True
+                spill_store = self._memory_manager.spillStore()
+                if spill_store is not None and (self._blockState == OpArrayCache.CLEAN).any():
+                    # Keep the clean blocks on disk
+                    spill_store.put( self, None, self._cache, self._cleanBlockStates() )
+                try:
+                    self._cache.resize((1,), refcheck = True)
+                except ValueError:
+                    # Someone holds a view of the cache (e.g. a running request)
+                    if spill_store is not None:
+                        spill_store.invalidate( self )
+                    return False
+                self.logger.debug("OpArrayCache (name={}): evicted cache".format(self.name))
+                self._blockState[:] = OpArrayCache.DIRTY
+                self._cache = None
+                return True
+            finally:
+                self._lock.release()
+        finally:
+            self._cacheLock.release()
+
+    def _cleanBlockStates(self):
+        """
+        Return a copy of the block states in which only the CLEAN blocks are kept (all others are DIRTY).
+        """
+        return fastWhere(self._blockState == OpArrayCache.CLEAN, OpArrayCache.CLEAN, OpArrayCache.DIRTY, numpy.uint8)
+
+    def cleanUp(self):
+        self._memory_manager.remove(self)
+        super( OpArrayCache, self ).cleanUp()
+
     def _get_full_blockshape(self, input_blockshape):
         max_shape = self.Input.meta.shape
         if not isinstance(input_blockshape, collections.Iterable):
@@ -183,16 +229,38 @@ class OpArrayCache(OpCache):
     def _allocateCache(self):
         with self._cacheLock:
             self._last_access = None
-            self._cache_priority = 0
             self._running = 0
 
             if self._cache is None or (self._cache.shape != self.Output.meta.shape):
-                mem = numpy.zeros(self.Output.meta.shape, dtype = self.Output.meta.dtype)
-                self.logger.debug("OpArrayCache: Allocating cache (size: %dbytes)" % mem.nbytes)
                 if self._blockState is None:
                     self._allocateManagementStructures()
+                mem = self._loadSpilledCache()
+                if mem is None:
+                    mem = numpy.zeros(self.Output.meta.shape, dtype = self.Output.meta.dtype)
+                    self.logger.debug("OpArrayCache: Allocating cache (size: %dbytes)" % mem.nbytes)
                 self._cache = mem
-        self._memory_manager.add(self)
+            nbytes = self._cache.nbytes
+        self._memory_manager.charge(self, nbytes)
+
+    def _loadSpilledCache(self):
+        """
+        If our cache was spilled to disk when it was evicted, load it and restore its clean blocks.
+        Returns the cache array, or None.
+        """
+        spill_store = self._memory_manager.spillStore()
+        if spill_store is None:
+            return None
+        spilled = spill_store.take(self)
+        if spilled is None:
+            return None
+        mem, blockStates = spilled
+        if mem.shape != tuple(self.Output.meta.shape) or mem.dtype != self.Output.meta.dtype \
+           or blockStates.shape != self._blockState.shape:
+            # We were reconfigured in the meantime
+            return None
+        self.logger.debug("OpArrayCache: Reloaded spilled cache (size: %dbytes)" % mem.nbytes)
+        self._blockState[:] = fastWhere(blockStates == OpArrayCache.CLEAN, OpArrayCache.CLEAN, self._blockState, numpy.uint8)
+        return mem
 
     def setupOutputs(self):
         self.CleanBlocks.meta.shape = (1,)
@@ -238,6 +306,9 @@ class OpArrayCache(OpCache):
         if (self._dirtyShape is None or reconfigure) and shape is not None:
             with self._lock:
                 self._allocateManagementStructures()
+                spill_store = self._memory_manager.spillStore()
+                if spill_store is not None:
+                    spill_store.invalidate(self)
                 if not self._lazyAlloc:
                     self._allocateCache()
 
@@ -251,6 +322,10 @@ class OpArrayCache(OpCache):
             start, stop = sliceToRoi(key, shape)
 
             with self._lock:
+                spill_store = self._memory_manager.spillStore()
+                if spill_store is not None:
+                    # Our spilled cache (if any) is out of date
+                    spill_store.invalidate(self)
                 if self._blockState is not None:
                     blockStart = numpy.floor(1.0 * start / self._blockShape)
                     blockStop = numpy.ceil(1.0 * stop / self._blockShape)
@@ -294,15 +369,9 @@ class OpArrayCache(OpCache):
                     if len(newDirtyBlocks > 0):
                         self.Output.setDirty( dirtyStart, dirtyStop )
 
-    def _updatePriority(self, new_access = None):
-        if self._last_access is None:
-            self._last_access = new_access or time.time()
-        cur_time = time.time()
-        delta = cur_time - self._last_access + 1e-9
-
-        self._last_access = cur_time
-        new_prio = 0.5 * self._cache_priority + delta
-        self._cache_priority = new_prio
+    def _recordAccess(self):
+        self._last_access = time.time()
+        self._memory_manager.touch(self)
 
     def execute(self, slot, subindex, roi, result):
         if slot == self.Output:
@@ -342,7 +411,7 @@ class OpArrayCache(OpCache):
             if numpy.logical_or(blockSet == OpArrayCache.CLEAN, blockSet == OpArrayCache.FIXED_DIRTY).all():
                 result[:] = self._cache[roiToSlice(start, stop)]
                 self._running -= 1
-                self._updatePriority()
+                self._recordAccess()
                 cacheView = None
                 return
     
@@ -413,8 +482,14 @@ class OpArrayCache(OpCache):
         temp = itertools.count(0)
 
         #wait for all requests to finish
+        # (The pool is empty once it has finished.)
+        numFills = len( dirtyPool )
+        fillStart = time.time()
         dirtyPool.wait()
-        if len( dirtyPool ) > 0:
+        if numFills > 0:
+            # Tell the memory manager how expensive our data is.
+            self._memory_manager.recordCost(self, time.time() - fillStart)
+
             # Signal that something was updated.
             # Note that we don't need to do this for the 'in process' queries (below)  
             #  because they are already in the dirtyPool in some other thread
@@ -444,7 +519,7 @@ class OpArrayCache(OpCache):
             else:
                 self.inputs["Input"][roiToSlice(start, stop)].writeInto(result).wait()
             self._running -= 1
-            self._updatePriority()
+            self._recordAccess()
             cacheView = None
         self.logger.debug("read %s took %f sec." % (roi.pprint(), time.time()-t))
 
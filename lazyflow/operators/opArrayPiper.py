@@ -31,16 +31,24 @@ class OpArrayPiper(Operator):
     #Outputs
     Output = OutputSlot()
 
+    passthroughOutputs = ('Output',)
+
     def setupOutputs(self):
         inputSlot = self.inputs["Input"]
         self.outputs["Output"].meta.assignFrom(inputSlot.meta)
 
     def execute(self, slot, subindex, roi, result):
         key = roi.toSlice()
+        if result is None:
+            # Passthrough: Just hand back the upstream result.
+            return self.inputs["Input"][key].wait()
         req = self.inputs["Input"][key].writeInto(result)
         req.wait()
         return result
 
+    def mapRoiToInputs(self, slot, subindex, roi):
+        return [ (self.Input, roi) ]
+
     def propagateDirty(self, slot, subindex, roi):
         key = roi.toSlice()
         # Check for proper name because subclasses may define extra inputs.
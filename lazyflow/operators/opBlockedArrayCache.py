@@ -22,25 +22,35 @@
 #Python
 import sys
 import time
-import generic
 import logging
+import collections
 logger = logging.getLogger(__name__)
 from threading import Lock
+from functools import partial
 
 #SciPy
 import numpy
 
 #lazyflow
+from lazyflow.drtile import drtile
 from lazyflow.roi import roiToSlice
-from lazyflow.utility import RamMeasurementContext
+from lazyflow.utility import RamMeasurementContext, fastWhere
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.rtype import SubRegion
-from lazyflow.request import RequestPool
+from lazyflow.request import Request, RequestPool
 from lazyflow.operators.opCache import OpCache
-from lazyflow.operators.opArrayCache import OpArrayCache
 from lazyflow.operators.arrayCacheMemoryMgr import ArrayCacheMemoryMgr, MemInfoNode
+from lazyflow.operators.blockPrefetcher import BlockPrefetcher
 
 class OpBlockedArrayCache(OpCache):
+    """
+    Caches its Input in blocks of outerBlockShape.  Each block is stored as 
+    a separate array (allocated when the block is first requested), and can be 
+    evicted on its own by the ArrayCacheMemoryMgr.
+
+    Within each block, data is requested from Input and tracked as 
+    clean/dirty with a granularity of innerBlockShape.
+    """
     name = "OpBlockedArrayCache"
     description = ""
 
@@ -50,6 +60,10 @@ class OpBlockedArrayCache(OpCache):
     outerBlockShape = InputSlot()
     fixAtCurrent = InputSlot()
     forward_dirty = InputSlot(value = True)
+
+    # If > 0, sequential or strided access patterns are detected, and this many
+    # steps ahead are prefetched in the background.  See BlockPrefetcher.
+    prefetchSteps = InputSlot(value = 0)
    
     #Output
     Output = OutputSlot("Output")
@@ -58,6 +72,12 @@ class OpBlockedArrayCache(OpCache):
     logger = logging.getLogger(loggerName)
     traceLogger = logging.getLogger("TRACE." + loggerName)
 
+    # Inner block states
+    IN_PROCESS  = 0
+    DIRTY       = 1
+    CLEAN       = 2
+    FIXED_DIRTY = 3
+
     def __init__(self, *args, **kwargs):
         super(OpBlockedArrayCache, self).__init__( *args, **kwargs )
         self._configured = False
@@ -69,9 +89,18 @@ class OpBlockedArrayCache(OpCache):
         self._blockShape = None
         self._fixed_all_dirty = False  # this is a shortcut for storing wehter all subblocks are dirty
         self._forward_dirty = False
-        self._opDummy = None
-        self._opSub_list = {}
-        self._cache_list = {}
+        self._prefetcher = None
+        self._memory_manager = ArrayCacheMemoryMgr.instance
+
+        # block number -> array with the block's data
+        self._block_data = {}
+        # block number -> array with the state of each of the block's inner blocks
+        #  (only for the blocks in self._block_data; all other blocks are dirty)
+        self._block_states = {}
+        self._innerShape = None
+        # block number -> requests that are currently filling the block
+        self._pending_requests = {}
+        self._last_access = None
 
         # This member is used by tests that check RAM usage.
         self.setup_ram_context = RamMeasurementContext()
@@ -118,6 +147,9 @@ class OpBlockedArrayCache(OpCache):
                     self._dirtyShape = numpy.ceil(1.0 * numpy.array(self.shape) /
                                                   numpy.array(self._blockShape)).astype(numpy.int)
                     assert numpy.array(self._dirtyShape).min() > 0, "ERROR in OpBlockedArrayCache: invalid dirtyShape = {dirtyShape}".format(dirtyShape=self._dirtyShape)
+
+                    # The inner blocks of each block start at the block's origin.
+                    self._innerShape = numpy.minimum(self._innerBlockShape, self._blockShape)
     
                     # Estimate ram usage            
                     ram_per_pixel = 0
@@ -135,19 +167,23 @@ class OpBlockedArrayCache(OpCache):
         
                     self.Output.meta.ram_usage_per_requested_pixel = ram_per_pixel
         
-                for op in self._cache_list.values():
-                    op.cleanUp()
-                for op in self._opSub_list.values():
-                    op.cleanUp()
-    
-                self._opSub_list = {}
-                self._cache_list = {}
+                    self._block_data = {}
+                    self._block_states = {}
+                    self._pending_requests = {}
+                self._memory_manager.remove(self)
     
                 self._configured = True
     
                 if notifyOutputDirty:
                     self.Output.setDirty(slice(None))
 
+            if self._prefetcher is not None:
+                self._prefetcher.cancel()
+                self._prefetcher = None
+            if self.prefetchSteps.value > 0:
+                self._prefetcher = BlockPrefetcher( self._fetchBlocks, self.prefetchSteps.value,
+                                                    self._dirtyShape, self._memoryPressure )
+
     def _get_block_multi_index(self, block_flat_index):
         """
         Convert a given block number (i.e. a raveled block index) into a multi_index.
@@ -192,6 +228,32 @@ class OpBlockedArrayCache(OpCache):
         raveled_indices_block = numpy.reshape(raveled_indices, shape)
         return raveled_indices_block
 
+    def _get_block_bounds(self, block_multi_index):
+        """
+        Return the start/stop coordinates of the given block (clipped to the image shape).
+        """
+        start = self._blockShape*block_multi_index
+        stop = numpy.minimum(start + self._blockShape, self.shape)
+        return start, stop
+
+    def _get_inner_states(self, b_ind, smallstart, smallstop):
+        """
+        Return the start of the inner block window that covers the given 
+        roi within the given (cached) block (in block-relative coordinates), 
+        and a view of the state array for that window.
+        """
+        innerStart = smallstart // self._innerShape
+        innerStop = (smallstop + self._innerShape - 1) // self._innerShape
+        states = self._block_states[b_ind][roiToSlice(innerStart, innerStop)]
+        return innerStart, states
+
+    def _new_block_states(self, blockshape):
+        """
+        Return a state array for a block of the given shape, with all inner blocks dirty.
+        """
+        innerBlocks = (blockshape + self._innerShape - 1) // self._innerShape
+        return OpBlockedArrayCache.DIRTY * numpy.ones( innerBlocks, numpy.uint8 )
+
     def generateReport(self, report):
         report.name = self.name
         report.fractionOfUsedMemoryDirty = self.fractionOfUsedMemoryDirty()
@@ -200,21 +262,27 @@ class OpBlockedArrayCache(OpCache):
         report.type = type(self)
         report.id = id(self)
        
-        for b_ind, block in self._cache_list.iteritems():
-            start = self._blockShape*self._get_block_multi_index(b_ind)
-            stop  = numpy.minimum(start + self._blockShape, self.Output.meta.shape)
+        for b_ind, block_data in self._block_data.items():
+            start, stop = self._get_block_bounds(self._get_block_multi_index(b_ind))
             
             n = MemInfoNode()
             n.roi = (start, stop)
+            n.name = "{} block {}".format( self.name, b_ind )
+            n.usedMemory = block_data.nbytes
+            n.dtype = block_data.dtype
+            n.type = type(block_data)
+            n.id = id(block_data)
             report.children.append(n)
-            block.generateReport(n)
             
     def usedMemory(self):
         tot = 0.0
-        for block in self._cache_list.values():
-            tot += block.usedMemory()
+        for block_data in self._block_data.values():
+            tot += block_data.nbytes
         return tot
 
+    def lastAccessTime(self):
+        return self._last_access
+
     def execute(self, slot, subindex, roi, result):
         assert (roi.start >= 0).all(), \
             "Requested roi is out-of-bounds: [{}, {}]".format( roi.start, roi.stop )
@@ -231,74 +299,274 @@ class OpBlockedArrayCache(OpCache):
 
         start, stop = roi.start, roi.stop
 
-        blockStart = (start / self._blockShape)
-        blockStop = (stop * 1.0 / self._blockShape).ceil()
-        innerBlocks = self._get_block_numbers(blockStart, blockStop)
-
-        pool = RequestPool()
-        for b_ind in innerBlocks.flat:
-            #which part of the original key does this block fill?
-            block_multi_index = self._get_block_multi_index(b_ind)
-            offset = self._blockShape*block_multi_index
-            bigstart = numpy.maximum(offset, start)
-            bigstop = numpy.minimum(offset + self._blockShape, stop)
-
-
-            smallstart = bigstart-offset
-            smallstop = bigstop - offset
+        blockStart = start // self._blockShape
+        blockStop = (stop + self._blockShape - 1) // self._blockShape # (Integer ceil)
+        self._executeBlocks(blockStart, blockStop, start, stop, result)
 
-            bigkey = roiToSlice(bigstart-start, bigstop-start)
-
-            with self._lock:    
-                if not self._fixed:
-                    if not self._cache_list.has_key(b_ind):
-
-                        self._opSub_list[b_ind] = generic.OpSubRegion(parent=self)
-                        self._opSub_list[b_ind].inputs["Input"].connect(self.inputs["Input"])
-                        tstart = self._blockShape*block_multi_index
-                        tstop = numpy.minimum((block_multi_index+numpy.ones(block_multi_index.shape, numpy.uint8))*self._blockShape, self.shape)
-    
-                        self._opSub_list[b_ind].Roi.setValue( (tuple(tstart), tuple(tstop)) )
-    
-                        self._cache_list[b_ind] = OpArrayCache(parent=self)
-                        self._cache_list[b_ind].inputs["Input"].connect(self._opSub_list[b_ind].outputs["Output"])
-                        self._cache_list[b_ind].inputs["fixAtCurrent"].connect( self.fixAtCurrent )
-                        self._cache_list[b_ind].inputs["blockShape"].setValue(self.inputs["innerBlockShape"].value)
-                        # we dont register a callback for dirtyness, since we already forward the signal
-                        
-                        # Forward value changed notifications to our own output.
-                        self._cache_list[b_ind].Output.notifyValueChanged( self.Output._sig_value_changed )
+        if self._prefetcher is not None:
+            self._prefetcher.record_access(blockStart, blockStop)
+            
+        self.logger.debug("read %r took %f msec." % (roi.pprint(), 1000.0*(time.time()-t)))
 
-            if self._cache_list.has_key(b_ind):
-                op = self._cache_list[b_ind]
-                #req = self._cache_list[b_ind].outputs["Output"][smallkey].writeInto(result[bigkey])
+    def _executeBlocks(self, blockStart, blockStop, start, stop, result):
+        """
+        Make sure that the given roi (which lies within the given roi of blocks) 
+        is cached, and copy it into result.  If result is None, just fill the cache.
+        """
+        innerBlocks = self._get_block_numbers(blockStart, blockStop)
 
-                smallroi = SubRegion(op.outputs["Output"], start = smallstart , stop= smallstop)
-                req = op.Output(smallroi.start, smallroi.stop)
-                req.writeInto(result[bigkey])
-                pool.add( req )
-                #op.execute(op.outputs["Output"], (), smallroi, result[bigkey])
+        fetchPool = RequestPool()
+        fetched = [] # (b_ind, request, inner states, number of pixels) for each request we make
+        spill_store = self._memory_manager.spillStore()
+        new_blocks = []
+        waiting_for = []
+        copies = []
+        with self._lock:
+            for b_ind in innerBlocks.flat:
+                b_ind = int(b_ind)
+                #which part of the original key does this block fill?
+                block_multi_index = self._get_block_multi_index(b_ind)
+                offset, blockstop = self._get_block_bounds(block_multi_index)
+                bigstart = numpy.maximum(offset, start)
+                bigstop = numpy.minimum(blockstop, stop)
+                bigkey = roiToSlice(bigstart-start, bigstop-start)
+                smallstart = bigstart-offset
+                smallstop = bigstop - offset
+
+                block_data = self._block_data.get(b_ind)
+                spilled = None
+                if block_data is None and spill_store is not None:
+                    spilled = spill_store.take(self, b_ind)
+                if spilled is not None:
+                    # Reload the block (and its clean inner blocks) from disk.
+                    block_data, spilledStates = spilled
+                    self._block_data[b_ind] = block_data
+                    self._block_states[b_ind] = spilledStates
+                    new_blocks.append( (b_ind, block_data.nbytes) )
+                elif block_data is None:
+                    if self._fixed:
+                        #When this block has never been in the cache and the current
+                        #value is fixed (fixAtCurrent=True), return 0  values
+                        #This prevents random noise appearing in such cases.
+                        if result is not None:
+                            result[bigkey] = 0
+                        # Since a downstream operator has expressed an interest in this block,
+                        #  mark it to be signaled as dirty when we become unfixed.
+                        # Otherwise, downstream operators won't know when there's valid data in this block.
+                        self._fixed_dirty_blocks.add(b_ind)
+                        continue
+
+                    block_data = numpy.zeros( blockstop - offset, dtype=self.Output.meta.dtype )
+                    self._block_data[b_ind] = block_data
+                    self._block_states[b_ind] = self._new_block_states( blockstop - offset )
+                    new_blocks.append( (b_ind, block_data.nbytes) )
+
+                innerStart, states = self._get_inner_states(b_ind, smallstart, smallstop)
+                if (states == OpBlockedArrayCache.IN_PROCESS).any():
+                    # Another request is filling parts of this block already
+                    waiting_for += self._pending_requests.get(b_ind, [])
+
+                cond = (states == OpBlockedArrayCache.DIRTY)
+                if cond.any():
+                    if self._fixed:
+                        # Someone asked for some dirty blocks while we were fixed.
+                        # Mark these blocks to be signaled as dirty when we become unfixed
+                        states[:] = fastWhere(cond, OpBlockedArrayCache.FIXED_DIRTY, states, numpy.uint8)
+                        self._fixed_dirty_blocks.add(b_ind)
+                    else:
+                        # Request each rectangle of dirty inner blocks
+                        tileWeights = fastWhere(cond, 1, 128**3, numpy.uint32)
+                        tileArray = drtile.test_DRTILE(tileWeights, 128**3).swapaxes(0,1)
+                        half = tileArray.shape[0]/2
+                        for i in range(tileArray.shape[1]):
+                            tileStart = tileArray[:half,i]
+                            tileStop = tileArray[half:,i]
+                            drStart = (tileStart + innerStart) * self._innerShape
+                            drStop = numpy.minimum( (tileStop + innerStart) * self._innerShape, blockstop - offset )
+
+                            req = self.Input(offset + drStart, offset + drStop)
+                            req.writeInto(block_data[roiToSlice(drStart, drStop)])
+                            req.uncancellable = True #FIXME
+                            fetchPool.add(req)
+
+                            tileStates = states[roiToSlice(tileStart, tileStop)]
+                            tileStates[:] = OpBlockedArrayCache.IN_PROCESS
+                            fetched.append( (b_ind, req, tileStates, numpy.prod(drStop - drStart)) )
+                            self._pending_requests.setdefault(b_ind, []).append(req)
+
+                if result is not None:
+                    copies.append( (b_ind, bigkey, smallstart, smallstop) )
+            self._last_access = time.time()
+
+        # Charge the memory manager outside of our lock: it may ask us to evict other blocks.
+        for b_ind, nbytes in new_blocks:
+            self._memory_manager.charge(self, nbytes, b_ind)
+
+        fillStart = time.time()
+        filled = False
+        try:
+            fetchPool.wait()
+            filled = True
+        finally:
+            # If the fetch failed, the tiles must be fetched again next time.
+            newState = OpBlockedArrayCache.CLEAN if filled else OpBlockedArrayCache.DIRTY
+            with self._lock:
+                for b_ind, req, tileStates, _ in fetched:
+                    # (Unless the block became dirty again in the meantime.)
+                    tileStates[:] = fastWhere(tileStates == OpBlockedArrayCache.IN_PROCESS,
+                                              newState, tileStates, numpy.uint8)
+                    pending = self._pending_requests[b_ind]
+                    pending.remove(req)
+                    if not pending:
+                        del self._pending_requests[b_ind]
+        if len(fetched) > 0:
+            self._recordCosts(fetched, time.time() - fillStart)
+
+            # Signal that something was updated.
+            self.Output._sig_value_changed()
+
+        for req in waiting_for:
+            req.wait()
+
+        # finally, copy the data into the result
+        while copies:
+            copies = self._copyCleanData(copies, result)
+
+    def _copyCleanData(self, copies, result):
+        """
+        Copy the given parts of cached blocks into the result.
+        Parts that were evicted or became dirty in the meantime are read directly from Input.
+        Returns the parts that are currently being filled by another request 
+        (after waiting for it), which must be copied again.
+        """
+        touched = []
+        uncached = []
+        retry = []
+        waiting_for = []
+        with self._lock:
+            for b_ind, bigkey, smallstart, smallstop in copies:
+                block_data = self._block_data.get(b_ind)
+                if block_data is None:
+                    uncached.append( (b_ind, bigkey, smallstart, smallstop) )
+                    continue
+                states = self._get_inner_states(b_ind, smallstart, smallstop)[1]
+                if (states == OpBlockedArrayCache.IN_PROCESS).any():
+                    waiting_for += self._pending_requests.get(b_ind, [])
+                    retry.append( (b_ind, bigkey, smallstart, smallstop) )
+                elif (states == OpBlockedArrayCache.DIRTY).any():
+                    uncached.append( (b_ind, bigkey, smallstart, smallstop) )
+                else:
+                    # (When we're fixed, FIXED_DIRTY data is returned as-is.)
+                    result[bigkey] = block_data[roiToSlice(smallstart, smallstop)]
+                    touched.append( b_ind )
+
+        for b_ind in touched:
+            self._memory_manager.touch(self, b_ind)
+
+        for b_ind, bigkey, smallstart, smallstop in uncached:
+            offset = self._get_block_bounds(self._get_block_multi_index(b_ind))[0]
+            self.Input(offset + smallstart, offset + smallstop).writeInto(result[bigkey]).wait()
+
+        for req in waiting_for:
+            req.wait()
+        return retry
+
+    def _recordCosts(self, fetched, seconds):
+        """
+        Tell the memory manager how expensive the blocks we just filled are.
+        The (wall clock) time it took to fill them all is divided among the 
+        blocks in proportion to the number of pixels requested for each.
+        """
+        pixels = collections.defaultdict(int)
+        for b_ind, _, _, npixels in fetched:
+            pixels[b_ind] += npixels
+        total = float( sum(pixels.values()) )
+        for b_ind, n in pixels.items():
+            self._memory_manager.recordCost(self, seconds * n / total, b_ind)
+
+    def _evictBlock(self, b_ind):
+        """
+        Overridden from OpCache.
+        """
+        # Don't wait for our lock: the memory manager may be evicting 
+        #  this block on behalf of another cache that holds its own locks.
+        if not self._lock.acquire(False):
+            return False
+        try:
+            if b_ind in self._pending_requests:
+                # The block is being filled.
+                return False
+            block_data = self._block_data.pop(b_ind, None)
+            if block_data is not None:
+                blockStates = self._block_states.pop(b_ind)
+                cleanStates = fastWhere(blockStates == OpBlockedArrayCache.CLEAN, 
+                                        OpBlockedArrayCache.CLEAN, OpBlockedArrayCache.DIRTY, numpy.uint8)
+                spill_store = self._memory_manager.spillStore()
+                if spill_store is not None and (cleanStates == OpBlockedArrayCache.CLEAN).any():
+                    # Keep the clean parts of the block on disk
+                    spill_store.put(self, b_ind, block_data, cleanStates)
+            return True
+        finally:
+            self._lock.release()
+
+    def cleanUp(self):
+        self._memory_manager.remove(self)
+        super( OpBlockedArrayCache, self ).cleanUp()
+
+    def _fetchBlocks(self, blockStart, blockStop):
+        """
+        Return (unsubmitted) requests that fill the cache for the given roi of blocks.  Used by the prefetcher.
+        """
+        innerBlocks = self._get_block_numbers(blockStart, blockStop)
+        return [ Request( partial(self._fetchBlock, b_ind) ) for b_ind in innerBlocks.flat ]
 
-                ####op.getOutSlot(op.outputs["Output"],smallkey,result[bigkey])
-                #requests.append(req)
-            else:
-                #When this block has never been in the cache and the current
-                #value is fixed (fixAtCurrent=True), return 0  values
-                #This prevents random noise appearing in such cases.
-                result[bigkey] = 0
-                with self._lock:
-                    # Since a downstream operator has expressed an interest in this block,
-                    #  mark it to be signaled as dirty when we become unfixed.
-                    # Otherwise, downstream operators won't know when there's valid data in this block.
-                    self._fixed_dirty_blocks.add(b_ind)
+    def _fetchBlock(self, b_ind):
+        if self._fixed:
+            return
+        block_multi_index = self._get_block_multi_index(b_ind)
+        start, stop = self._get_block_bounds(block_multi_index)
+        self._executeBlocks(block_multi_index, block_multi_index+1, start, stop, None)
 
-        pool.wait()
-            
-        self.logger.debug("read %r took %f msec." % (roi.pprint(), 1000.0*(time.time()-t)))
+    def _memoryPressure(self):
+        return self._memory_manager.isUnderPressure()
 
+    def _markDirty(self, start, stop, state):
+        """
+        Set the state of all cached inner blocks that intersect the given roi.
+        Spilled blocks that intersect the roi are discarded.
+        Must be called with the lock held.
+        """
+        spill_store = self._memory_manager.spillStore()
+        if (numpy.equal(start, 0).all() and numpy.equal(stop, self.shape).all()):
+            for states in self._block_states.values():
+                states[:] = state
+            if spill_store is not None:
+                spill_store.remove(self)
+            return
+        blockStart = start // self._blockShape
+        blockStop = (stop + self._blockShape - 1) // self._blockShape # (Integer ceil)
+        for b_ind in self._get_block_numbers(blockStart, blockStop).flat:
+            if b_ind in self._block_data:
+                offset, blockstop = self._get_block_bounds(self._get_block_multi_index(b_ind))
+                smallstart = numpy.maximum(offset, start) - offset
+                smallstop = numpy.minimum(blockstop, stop) - offset
+                states = self._get_inner_states(b_ind, smallstart, smallstop)[1]
+                states[:] = state
+            elif spill_store is not None:
+                spill_store.invalidate(self, b_ind)
 
     def propagateDirty(self, slot, subindex, roi):
         key = roi.toSlice()
+        if slot == self.inputs["Input"] and self._blockShape is not None:
+            # Find the block key
+            roi = SubRegion(slot, pslice=key)
+            start, stop = roi.start, roi.stop
+            with self._lock:
+                if self._fixed:
+                    self._markDirty(start, stop, OpBlockedArrayCache.FIXED_DIRTY)
+                else:
+                    self._markDirty(start, stop, OpBlockedArrayCache.DIRTY)
+
         if slot == self.inputs["Input"] and self._forward_dirty:
             if not self._fixed:
                 self.outputs["Output"].setDirty(key)                    
@@ -307,8 +575,8 @@ class OpBlockedArrayCache(OpCache):
                 roi = SubRegion(slot, pslice=key)
                 start, stop = roi.start, roi.stop
         
-                blockStart = (start / self._blockShape)
-                blockStop = (stop * 1.0 / self._blockShape).ceil()
+                blockStart = start // self._blockShape
+                blockStop = (stop + self._blockShape - 1) // self._blockShape # (Integer ceil)
                 
                 with self._lock:
                     # check whether the dirty region encompasses the whole cache
@@ -328,6 +596,9 @@ class OpBlockedArrayCache(OpCache):
                 # Take the superset of all the blocks that became dirty in the meantime and notify our output
                 dirtystart, dirtystop = (None,None)
                 with self._lock:
+                    for states in self._block_states.values():
+                        states[states == OpBlockedArrayCache.FIXED_DIRTY] = OpBlockedArrayCache.DIRTY
+
                     if self._fixed_all_dirty is True:
                         dirtystop = self.Output.meta.shape
                         dirtystart = [0] * len(self.Output.meta.shape)
@@ -335,10 +606,7 @@ class OpBlockedArrayCache(OpCache):
                         dirtystart = self.Output.meta.shape
                         dirtystop = [0] * len(self.Output.meta.shape)
                         for b_ind in self._fixed_dirty_blocks:
-                            offset = self._blockShape*self._get_block_multi_index(b_ind)
-                            bigstart = offset
-                            bigstop = numpy.minimum(offset + self._blockShape, self.Output.meta.shape)
-                            
+                            bigstart, bigstop = self._get_block_bounds(self._get_block_multi_index(b_ind))
                             dirtystart = numpy.minimum(bigstart, dirtystart)
                             dirtystop = numpy.maximum(bigstop, dirtystop)
                         
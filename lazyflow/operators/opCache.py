@@ -44,6 +44,15 @@ class OpCache(Operator):
     def lastAccessTime(self):
         """timestamp of last access (time.time())"""
         return 0 #overwrite me
+
+    def _evictBlock(self, block):
+        """
+        Free the memory that was charged to the ArrayCacheMemoryMgr for the given block.
+        Called by the memory manager, possibly while other caches hold their locks,
+        so this must not wait for locks: if the block is in use, return False.
+        Otherwise, return True (also if the block had already been freed).
+        """
+        raise NotImplementedError() #overwrite me if you charge the memory manager
     
     def _after_init(self):
         """
@@ -33,42 +33,46 @@ import h5py
 # Lazyflow
 from lazyflow.request import Request, RequestPool, RequestLock
 from lazyflow.graph import Operator, InputSlot, OutputSlot
-from lazyflow.roi import TinyVector, getIntersectingBlocks, getBlockBounds, roiToSlice, getIntersection
+from lazyflow.roi import TinyVector, getIntersectingBlockStarts, getBlockBounds, roiToSlice, getIntersection
 from lazyflow.operators.opCache import OpCache
+from lazyflow.utility.blockCodecs import CompressedBlock, getCodec, DEFAULT_CODEC
 
 logger = logging.getLogger(__name__)
 
 class OpCompressedCache(OpCache):
     """
-    A blockwise cache that stores each block as a separate in-memory hdf5 file with a compressed dataset.
+    A blockwise cache that stores each block as a compressed byte string (see lazyflow.utility.blockCodecs).
+    The codec is chosen via the Codec slot.  Blocks are (de)compressed in parallel.
     
     Note: It is not safe to call execute() change the blockshape simultaneously.
     """
     Input = InputSlot() # Also used to asynchronously force data into the cache via __setitem__ (see setInSlot(), below()
     BlockShape = InputSlot(optional=True) # If not provided, the entire input is treated as one block
+    Codec = InputSlot(value=DEFAULT_CODEC) # Name of the codec for new blocks (see blockCodecs.availableCodecs())
     
     Output = OutputSlot() # Output as numpy arrays
 
     InputHdf5 = InputSlot(optional=True)
     CleanBlocks = OutputSlot() # A list of rois (tuples) of the blocks that are currently stored in the cache
-    OutputHdf5 = OutputSlot() # Provides data as hdf5 datasets.  Only allowed for rois that exactly match a block.
+    OutputHdf5 = OutputSlot() # Provides data as (lzf-compressed) hdf5 datasets.  Only allowed for rois that exactly match a block.
     
     def __init__(self, *args, **kwargs):
         super( OpCompressedCache, self ).__init__( *args, **kwargs )
         self._lock = RequestLock()
+        self._codec = getCodec()
         self._init_cache(None)
 
     def _init_cache(self, new_blockshape):
         with self._lock:
             self._blockshape = new_blockshape
-            self._cacheFiles = {}
+            self._blocks = {} # { block_start : CompressedBlock }
             self._dirtyBlocks = set()
             self._blockLocks = {}
             self._chunkshape = self._chooseChunkshape(self._blockshape)
 
     def cleanUp(self):
         logger.debug( "Cleaning up" )
-        self._closeAllCacheFiles()
+        self._clearBlocks()
         super( OpCompressedCache, self ).cleanUp()
 
 
@@ -78,6 +82,9 @@ class OpCompressedCache(OpCache):
         self.CleanBlocks.meta.shape = (1,)
         self.CleanBlocks.meta.dtype = object
 
+        # Existing blocks remember their own codec, so a new codec only affects blocks stored from now on.
+        self._codec = getCodec( self.Codec.value )
+
         # no block shape given -> use the whole volume as one block
         new_blockshape = self.Input.meta.shape
         if self.BlockShape.ready():
@@ -116,8 +123,7 @@ class OpCompressedCache(OpCache):
             "roi: {} is out-of-bounds for Input shape: {}"\
             "".format( roi, self.Input.meta.shape )
         
-        block_starts = getIntersectingBlocks( self._blockshape, (roi.start, roi.stop) )
-        block_starts = map( tuple, block_starts )
+        block_starts = getIntersectingBlockStarts( self._blockshape, (roi.start, roi.stop) )
 
         # Ensure all block cache files are up-to-date
         self._waitForBlocks(block_starts)
@@ -138,22 +144,37 @@ class OpCompressedCache(OpCache):
         reqPool.wait()
 
     def _copyData(self, roi, destination, block_starts):
-        # Copy data from each block
-        # (Parallelism not needed here: h5py will serialize these requests anyway)
+        """
+        Copy data from each block into the destination array.
+        The blocks are decompressed in parallel.
+        """
         logger.debug( "Copying data from {} blocks...".format( len(block_starts) ) )
+        reqPool = RequestPool()
         for block_start in block_starts:
-            entire_block_roi = getBlockBounds( self.Output.meta.shape, self._blockshape, block_start )
+            reqPool.add( Request( partial( self._copyBlockData, roi, destination, block_start ) ) )
+        reqPool.wait()
 
-            # This block's portion of the roi
-            intersecting_roi = getIntersection( (roi.start, roi.stop), entire_block_roi )
-            
-            # Compute slicing within destination array and slicing within this block
-            destination_relative_intersection = numpy.subtract(intersecting_roi, roi.start)
-            block_relative_intersection = numpy.subtract(intersecting_roi, block_start)
-            
+    def _copyBlockData(self, roi, destination, block_start):
+        """
+        Copy this block's portion of the roi into the destination array.
+        If the block isn't stored, write zeros.
+        """
+        entire_block_roi = getBlockBounds( self.Output.meta.shape, self._blockshape, block_start )
+
+        # This block's portion of the roi
+        intersecting_roi = getIntersection( (roi.start, roi.stop), entire_block_roi )
+        
+        # Compute slicing within destination array and slicing within this block
+        destination_relative_intersection = numpy.subtract(intersecting_roi, roi.start)
+        block_relative_intersection = numpy.subtract(intersecting_roi, block_start)
+        
+        block_data = self._getBlockData( entire_block_roi )
+        if block_data is not None:
             # Copy from block to destination
-            dataset = self._getBlockDataset( entire_block_roi )
-            destination[ roiToSlice(*destination_relative_intersection) ] = dataset[ roiToSlice( *block_relative_intersection ) ]
+            destination[ roiToSlice(*destination_relative_intersection) ] = block_data[ roiToSlice( *block_relative_intersection ) ]
+        else:
+            # Not stored (yet).  Overwrite with zeros.
+            destination[ roiToSlice(*destination_relative_intersection) ] = 0
 
     def _executeCleanBlocks(self, destination):
         """
@@ -161,7 +182,7 @@ class OpCompressedCache(OpCache):
         an *unsorted* list of block rois that the cache currently holds.
         """
         # Set difference: clean = existing - dirty
-        clean_block_starts = set( self._cacheFiles.keys() ) - self._dirtyBlocks
+        clean_block_starts = set( self._blocks.keys() ) - self._dirtyBlocks
         
         output_shape = self.Output.meta.shape
         clean_block_rois = map( partial( getBlockBounds, output_shape, self._blockshape ),
@@ -179,18 +200,28 @@ class OpCompressedCache(OpCache):
 
         block_roi = [roi.start, roi.stop]
         self._ensureCached( block_roi )
-        dataset = self._getBlockDataset( block_roi )
         assert str(block_roi) not in destination, "destination hdf5 group already has a dataset with this block's name"
-        destination.copy( dataset, str(block_roi) )
-        return destination        
+
+        # Convert on demand: decompress the block and write it as a compressed hdf5 dataset.
+        data = self._getBlockData( block_roi )
+        if data is None:
+            data = numpy.zeros( roi.stop - roi.start, dtype=self.Output.meta.dtype )
+        
+        # h5py will crash if the chunkshape is larger than the dataset shape.
+        chunkshape = tuple( numpy.minimum( data.shape, self._chunkshape ) )
+        destination.create_dataset( str(block_roi),
+                                    data=data,
+                                    chunks=chunkshape,
+                                    compression='lzf' ) # lzf should be faster than gzip, 
+                                                        # with a slightly worse compression ratio
+        return destination
 
     def propagateDirty(self, slot, subindex, roi):
         if slot == self.Input:
             # Keep track of dirty blocks
             if self._blockshape is not None:
                 with self._lock:
-                    block_starts = getIntersectingBlocks( self._blockshape, (roi.start, roi.stop) )
-                    block_starts = map( tuple, block_starts )
+                    block_starts = getIntersectingBlockStarts( self._blockshape, (roi.start, roi.stop) )
                     
                     for block_start in block_starts:
                         self._dirtyBlocks.add( block_start )
@@ -199,6 +230,9 @@ class OpCompressedCache(OpCache):
         elif slot == self.BlockShape:
             # Everything is dirty
             self.Output.setDirty( slice(None) )
+        elif slot == self.Codec:
+            # The data doesn't change
+            pass
         else:
             assert False, "Unknown output slot"
             
@@ -267,11 +301,12 @@ class OpCompressedCache(OpCache):
         return dtype().nbytes
     
     def usedMemory(self):
-        #FIXME
+        """
+        The number of bytes used by the compressed blocks.
+        """
         tot = 0.0
-        for b in self._cacheFiles:
-            if "data" in b:
-                tot += b["data"].size * self._getDtypeBytes(b["data"].dtype)
+        for block in self._blocks.values():
+            tot += block.nbytes
         return tot
     
     def generateReport(self, report):
@@ -283,72 +318,64 @@ class OpCompressedCache(OpCache):
         report.type = type(self)
         report.id = id(self)
 
-    def _getCacheFile(self, entire_block_roi):
+    def _getBlockLock(self, block_start):
         """
-        Get the cache file for the block that starts at block_start.
-        If it doesn't exist yet, create it first.
+        Get the lock that serializes updates to the given block.
         """
-        block_start = tuple(entire_block_roi[0])
-        if block_start in self._cacheFiles:
-            return self._cacheFiles[block_start]
+        if block_start in self._blockLocks:
+            return self._blockLocks[block_start]
         with self._lock:
-            if block_start not in self._cacheFiles:
-                # Create an in-memory hdf5 file with a unique name
-                logger.debug("Creating a cache file for block: {}".format( list(block_start) ))
-                filename = str(id(self)) + str(id(self._cacheFiles)) + str(block_start)
-                mem_file = h5py.File(filename, driver='core', backing_store=False, mode='w')                
-
-                # h5py will crash if the chunkshape is larger than the dataset shape.
-                datashape = tuple( entire_block_roi[1] - entire_block_roi[0] )
-                chunkshape = numpy.minimum(numpy.array(datashape), self._chunkshape )
-                chunkshape = tuple(chunkshape)
-
-                # Make a compressed dataset
-                mem_file.create_dataset('data',
-                                        shape=datashape,
-                                        dtype=self.Output.meta.dtype,
-                                        chunks=chunkshape,
-                                        compression='lzf' ) # lzf should be faster than gzip, 
-                                                            # with a slightly worse compression ratio
-
+            if block_start not in self._blockLocks:
                 self._blockLocks[block_start] = RequestLock()
-                self._cacheFiles[block_start] = mem_file
-                self._dirtyBlocks.add( block_start )
-            return self._cacheFiles[block_start]
+            return self._blockLocks[block_start]
 
+    def _getBlockData(self, entire_block_roi):
+        """
+        Decompress the block that starts at entire_block_roi[0] and return it as a (possibly read-only) array.
+        Returns None if the block isn't stored.
+        """
+        block = self._blocks.get( tuple(entire_block_roi[0]) )
+        if block is None:
+            return None
+        return block.toArray()
+
+    def _storeBlockData(self, block_start, data):
+        """
+        Compress the given data (the ENTIRE block) and store it in the cache.
+        """
+        # Convert to our output dtype, as an hdf5 dataset would.
+        data = numpy.ascontiguousarray( data, dtype=self.Output.meta.dtype )
+        block = CompressedBlock.fromArray( data, self._codec )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Storage for block: {} is {}. ({}% of original)".format( block_start, block.nbytes, 100*block.nbytes/max(1, data.nbytes) ))
+        with self._lock:
+            self._blocks[block_start] = block
 
     def _ensureCached(self, entire_block_roi):
         """
-        Ensure that the cache file for the given block is up-to-date.
-        (Refresh it if it's dirty.)
+        Ensure that the given block is up-to-date.
+        (Refresh it if it's dirty or absent.)
         """
         block_start = tuple(entire_block_roi[0])
-        block_file = self._getCacheFile(entire_block_roi)
-        if block_start in self._dirtyBlocks:
-            updated_cache = False
-            with self._blockLocks[block_start]:
-                # Check AGAIN now that we have the lock.
-                # (Avoid doing this twice in parallel requests.)
-                if block_start in self._dirtyBlocks:
-                    # Can't write directly into the hdf5 dataset because 
-                    #  h5py.dataset.__getitem__ creates a copy, not a view.
-                    # We must use a temporary numpy array to hold the data.
-                    data = self.Input(*entire_block_roi).wait()
-                    block_file['data'][...] = data
-                    
-                    if logger.isEnabledFor(logging.DEBUG):
-                        uncompressed_size = numpy.prod(data.shape) * self._getDtypeBytes(data.dtype)
-                        storage_size = block_file["data"].id.get_storage_size()
-                        logger.debug("Storage for block: {} is {}. ({}% of original)".format( block_start, storage_size, 100*storage_size/uncompressed_size ))
-                    with self._lock:
-                        self._dirtyBlocks.remove( block_start )
-                    updated_cache = True
-
-            if updated_cache:
-                # Now that the lock is released, signal that the cache was updated. 
-                self.Output._sig_value_changed()
-                self.OutputHdf5._sig_value_changed()
-                self.CleanBlocks._sig_value_changed()
+        if block_start in self._blocks and block_start not in self._dirtyBlocks:
+            return
+        updated_cache = False
+        with self._getBlockLock(block_start):
+            # Check AGAIN now that we have the lock.
+            # (Avoid doing this twice in parallel requests.)
+            if block_start not in self._blocks or block_start in self._dirtyBlocks:
+                data = self.Input(*entire_block_roi).wait()
+                # Note: Compression happens here, i.e. in parallel for all requested blocks.
+                self._storeBlockData( block_start, data )
+                with self._lock:
+                    self._dirtyBlocks.discard( block_start )
+                updated_cache = True
+
+        if updated_cache:
+            # Now that the lock is released, signal that the cache was updated. 
+            self.Output._sig_value_changed()
+            self.OutputHdf5._sig_value_changed()
+            self.CleanBlocks._sig_value_changed()
 
     def setInSlot(self, slot, subindex, roi, value):
         """
@@ -374,8 +401,7 @@ class OpCompressedCache(OpCache):
             "roi: {} is out-of-bounds for Input shape: {}"\
             "".format( roi, self.Input.meta.shape )
         
-        block_starts = getIntersectingBlocks( self._blockshape, (roi.start, roi.stop) )
-        block_starts = map( tuple, block_starts )
+        block_starts = getIntersectingBlockStarts( self._blockshape, (roi.start, roi.stop) )
 
         # Copy data to each block
         logger.debug( "Copying data INTO {} blocks...".format( len(block_starts) ) )
@@ -390,15 +416,25 @@ class OpCompressedCache(OpCache):
             block_relative_intersection = numpy.subtract(intersecting_roi, block_start)
             
             new_block_data = value[ roiToSlice(*source_relative_intersection) ]
-            if not store_zero_blocks and new_block_data.sum() == 0 and block_start not in self._cacheFiles:
+            if not store_zero_blocks and new_block_data.sum() == 0 and block_start not in self._blocks:
                 # Special fast-path: If this block doesn't exist yet, 
                 #  don't bother creating if we're just going to fill it with zeros
                 # (Used by the OpCompressedUserLabelArray)
                 pass
             else:
-                # Copy from source to block
-                dataset = self._getBlockDataset( entire_block_roi )
-                dataset[ roiToSlice( *block_relative_intersection ) ] = new_block_data
+                with self._getBlockLock(block_start):
+                    if (block_relative_intersection == numpy.subtract(entire_block_roi, block_start)).all():
+                        # The whole block is overwritten.
+                        block_data = new_block_data
+                    else:
+                        # Copy from source into the (decompressed) block
+                        block_data = self._getBlockData( entire_block_roi )
+                        if block_data is None:
+                            block_data = numpy.zeros( entire_block_roi[1] - entire_block_roi[0], dtype=self.Output.meta.dtype )
+                        else:
+                            block_data = block_data.copy()
+                        block_data[ roiToSlice( *block_relative_intersection ) ] = new_block_data
+                    self._storeBlockData( block_start, block_data )
     
             # Here, we assume that if this function is used to update ANY PART of a 
             #  block, he is responsible for updating the ENTIRE block.
@@ -419,14 +455,13 @@ class OpCompressedCache(OpCache):
         roi_is_exactly_one_block &= ((roi.start % self._blockshape) == 0).all()
         roi_is_exactly_one_block &= (block_roi == numpy.array((roi.start, roi.stop))).all()
         if roi_is_exactly_one_block:
-            cachefile = self._getCacheFile( block_roi )
             logger.debug( "Copying HDF5 data directly into block {}".format( block_roi ) )
-            assert cachefile['data'].dtype == value.dtype
-            assert cachefile['data'].shape == value.shape
-            del cachefile['data']
-            cachefile.copy( value, 'data' )
+            assert value.dtype == self.Output.meta.dtype
+            assert value.shape == tuple(block_roi[1] - block_roi[0])
     
             block_start = tuple(roi.start)
+            with self._getBlockLock(block_start):
+                self._storeBlockData( block_start, value[...] )
             self._dirtyBlocks.discard( block_start )
         else:
             # This hdf5 data does not correspond to exactly one block.
@@ -438,72 +473,8 @@ class OpCompressedCache(OpCache):
 #        self.OutputHdf5._sig_value_changed()
 #        self.CleanBlocks._sig_value_changed()
 
-    def _getBlockDataset(self, entire_block_roi):
-        """
-        Get the correct cache file and return the *dataset* handle,
-        not a numpy array of its contents.
-        """
-        block_file = self._getCacheFile(entire_block_roi)
-        return block_file['data']
-
-
-    def _closeAllCacheFiles(self):
-        logger.debug( "Closing all caches" )
-        cacheFiles = self._cacheFiles
-        for k,v in cacheFiles.items():
-            with self._blockLocks[k]:
-                v.close()
+    def _clearBlocks(self):
+        logger.debug( "Clearing all blocks" )
         with self._lock:
             self._blockLocks = {}
-            self._cacheFiles = {}
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+            self._blocks = {}
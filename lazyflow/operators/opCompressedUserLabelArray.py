@@ -28,7 +28,7 @@ import numpy
 
 # Lazyflow
 from lazyflow.graph import Operator, InputSlot, OutputSlot
-from lazyflow.roi import TinyVector, getIntersectingBlocks, getBlockBounds, roiToSlice, getIntersection, roiFromShape
+from lazyflow.roi import TinyVector, getIntersectingBlockStarts, getBlockBounds, roiToSlice, getIntersection, roiFromShape
 from lazyflow.operators.opCache import OpCache
 from lazyflow.operators.opCompressedCache import OpCompressedCache
 from lazyflow.rtype import SubRegion
@@ -174,7 +174,7 @@ class OpCompressedUserLabelArray(OpCompressedCache):
             "roi: {} is out-of-bounds for Input shape: {}"\
             "".format( roi, self.Input.meta.shape )
         
-        block_starts = getIntersectingBlocks( self._blockshape, (roi.start, roi.stop) )
+        block_starts = getIntersectingBlockStarts( self._blockshape, (roi.start, roi.stop) )
         self._copyData(roi, destination, block_starts)
         return destination
 
@@ -230,12 +230,10 @@ class OpCompressedUserLabelArray(OpCompressedCache):
         destination[:] = 0.0
 
         # Get the logical blocking.
-        block_starts = getIntersectingBlocks( self._blockshape, (input_roi.start, input_roi.stop) )
+        block_starts = getIntersectingBlockStarts( self._blockshape, (input_roi.start, input_roi.stop) )
 
-        # (Parallelism wouldn't help here: h5py will serialize these requests anyway)
-        block_starts = map( tuple, block_starts )
         for block_start in block_starts:
-            if block_start not in self._cacheFiles:
+            if block_start not in self._blocks:
                 # No label data in this block.  Move on.
                 continue
 
@@ -248,7 +246,7 @@ class OpCompressedUserLabelArray(OpCompressedCache):
             deep_relative_intersection = numpy.subtract(intersecting_roi, input_roi.start)
             block_relative_intersection = numpy.subtract(intersecting_roi, block_start)
                         
-            deep_data = self._getBlockDataset( entire_block_roi )[roiToSlice(*block_relative_intersection)]
+            deep_data = self._getBlockData( entire_block_roi )[roiToSlice(*block_relative_intersection)]
 
             # make binary and convert to float
             deep_data_float = numpy.where( deep_data, numpy.float32(1.0), numpy.float32(0.0) )
@@ -293,31 +291,6 @@ class OpCompressedUserLabelArray(OpCompressedCache):
                                                  numpy.float32(0.0))
         return
 
-    def _copyData(self, roi, destination, block_starts):
-        """
-        Copy data from each block into the destination array.
-        For blocks that aren't currently stored, just write zeros.
-        """
-        # (Parallelism not needed here: h5py will serialize these requests anyway)
-        block_starts = map( tuple, block_starts )
-        for block_start in block_starts:
-            entire_block_roi = getBlockBounds( self.Output.meta.shape, self._blockshape, block_start )
-
-            # This block's portion of the roi
-            intersecting_roi = getIntersection( (roi.start, roi.stop), entire_block_roi )
-            
-            # Compute slicing within destination array and slicing within this block
-            destination_relative_intersection = numpy.subtract(intersecting_roi, roi.start)
-            block_relative_intersection = numpy.subtract(intersecting_roi, block_start)
-            
-            if block_start in self._cacheFiles:
-                # Copy from block to destination
-                dataset = self._getBlockDataset( entire_block_roi )
-                destination[ roiToSlice(*destination_relative_intersection) ] = dataset[ roiToSlice( *block_relative_intersection ) ]
-            else:
-                # Not stored yet.  Overwrite with zeros.
-                destination[ roiToSlice(*destination_relative_intersection) ] = 0
-
     def propagateDirty(self, slot, subindex, roi):
         # There should be no way to make the output dirty except via setInSlot()
         pass
@@ -376,8 +349,7 @@ class OpCompressedUserLabelArray(OpCompressedCache):
         max_label = 0
 
         # Get logical blocking.
-        block_starts = getIntersectingBlocks( self._blockshape, roiFromShape(self.Input.meta.shape) )
-        block_starts = map( tuple, block_starts )
+        block_starts = getIntersectingBlockStarts( self._blockshape, roiFromShape(self.Input.meta.shape) )
 
         # Write each block
         for block_start in block_starts:
@@ -7,7 +7,7 @@ import numpy
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.request import RequestLock, Request, RequestPool
 from lazyflow.utility import OrderedSignal
-from lazyflow.roi import getBlockBounds, getIntersectingBlocks, determineBlockShape
+from lazyflow.roi import getBlockBounds, getIntersectingBlockStarts, determineBlockShape
 
 class OpFeatureMatrixCache(Operator):
     """
@@ -189,8 +189,7 @@ class OpFeatureMatrixCache(Operator):
         roi.start[-1] = 0
         roi.stop[-1] = 1
         # Bookkeeping: Track the dirty blocks
-        block_starts = getIntersectingBlocks( self._blockshape, (roi.start, roi.stop) )
-        block_starts = map( tuple, block_starts )
+        block_starts = getIntersectingBlockStarts( self._blockshape, (roi.start, roi.stop) )
         
         # 
         # If the features were dirty (not labels), we only really care about
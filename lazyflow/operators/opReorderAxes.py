@@ -31,6 +31,8 @@ class OpReorderAxes(Operator):
     AxisOrder = InputSlot(value='txyzc') # string: The desired output axis order
     Output = OutputSlot()
 
+    passthroughOutputs = ('Output',)
+
     def setupOutputs(self):
         output_order = "".join(self.AxisOrder.value)
         input_order = self.Input.meta.getAxisKeys()
@@ -96,6 +98,11 @@ class OpReorderAxes(Operator):
         self._common_axis_transpose_order = map( output_common_axes.index, input_common_axes )
         self._in_unsqueeze_slicing = tuple( slice(None) if a in output_order else numpy.newaxis for a in input_order )
 
+        # These are used by execute() to create a view of the input data with the output axis order (the inverse of the above)
+        self._in_squeeze_slicing = tuple( slice(None) if a in output_order else 0 for a in input_order )
+        self._common_axis_inverse_transpose_order = map( input_common_axes.index, output_common_axes )
+        self._out_unsqueeze_slicing = tuple( slice(None) if a in input_order else numpy.newaxis for a in output_order )
+
     def execute(self, slot, subindex, out_roi, result):
         assert slot == self.Output, "Unknown output slot: {}".format( slot.name )
         assert len(self._invalid_axes) == 0, \
@@ -107,6 +114,14 @@ class OpReorderAxes(Operator):
         in_roi_pairs = map( out_roi_dict.__getitem__, self._in_out_map ) # e.g. [(0,1), (0,10), (0,20)]
         in_roi = zip( *in_roi_pairs ) # e.g. [(0,0,0), (1,10,20)]
 
+        if result is None:
+            # Passthrough: Return a view of the upstream result with the output axis order.
+            # (Same steps as below, in reverse.)
+            input_data = self.Input( *in_roi ).wait().view(numpy.ndarray)
+            input_squeezed = input_data[self._in_squeeze_slicing]
+            input_reordered = numpy.transpose(input_squeezed, self._common_axis_inverse_transpose_order)
+            return input_reordered[self._out_unsqueeze_slicing]
+
         # Create a view of the result that can be written to by the input slot.
         #   1) Drop (singleton) result axes that aren't used by the input
         #   2) Transpose such that 'common' axes are in the order expected by input
@@ -43,6 +43,7 @@ class OpSlicedBlockedArrayCache(OpCache):
     innerBlockShape = InputSlot()
     outerBlockShape = InputSlot()
     fixAtCurrent = InputSlot(value = False)
+    prefetchSteps = InputSlot(value = 0) # See OpBlockedArrayCache
    
     #Outputs
     Output = OutputSlot()
@@ -102,6 +103,7 @@ class OpSlicedBlockedArrayCache(OpCache):
             for i,innershape in enumerate(self._innerShapes):
                 op = OpBlockedArrayCache(parent=self)
                 op.inputs["fixAtCurrent"].connect(self.inputs["fixAtCurrent"])
+                op.prefetchSteps.connect(self.prefetchSteps)
                 self._innerOps.append(op)
                 
                 op.inputs["Input"].connect(self.inputs["Input"])
@@ -179,5 +181,7 @@ class OpSlicedBlockedArrayCache(OpCache):
                      # It is considered an error to change the blockshape after the initial configuration.
             elif slot == self.fixAtCurrent:
                 self.Output.setDirty( slice(None) )
+            elif slot == self.prefetchSteps:
+                pass
             else:
                 assert False, "Unknown dirty input slot"
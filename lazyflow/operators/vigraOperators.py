@@ -355,20 +355,82 @@ class OpPixelFeaturesPresmoothed(Operator):
             assert False, "Unknown dirty input slot."
             
 
+    def _sourceRegions(self, key):
+        """
+        For the given key of the Output, compute (in terms of INPUT coordinates, without channel and time axes)
+        the requested region, the region of the smoothed image that the feature filters need,
+        and the region of the input that the smoothing needs.
+        Returns start, stop, vigOpSourceStart, vigOpSourceStop, newStart, newStop
+        """
+        axistags = self.Output.meta.axistags
+        subkey = popFlagsFromTheKey(key,axistags,'c')
+        subshape=popFlagsFromTheKey(self.Output.meta.shape,axistags,'c')
+        at2 = copy.copy(axistags)
+        at2.dropChannelAxis()
+        subshape=popFlagsFromTheKey(subshape,at2,'t')
+        subkey = popFlagsFromTheKey(subkey,at2,'t')
+
+        start, stop = roi.sliceToRoi(subkey,subkey)
+        maxSigma = max(0.7,self.maxSigma)  #we use 0.7 as an approximation of not doing any smoothing
+        #smoothing was already applied previously
+
+        # The region of the smoothed image we need to give to the feature filter (in terms of INPUT coordinates)
+        # 0.7, because the features receive a pre-smoothed array and don't need much of a neighborhood
+        vigOpSourceStart, vigOpSourceStop = roi.extendSlice(start, stop, subshape, 0.7, self.WINDOW_SIZE)
+
+        # The region of the input that we need to give to the smoothing operator (in terms of INPUT coordinates)
+        newStart, newStop = roi.extendSlice(vigOpSourceStart, vigOpSourceStop, subshape, maxSigma, self.WINDOW_SIZE)
+        return start, stop, vigOpSourceStart, vigOpSourceStop, newStart, newStop
+
+    def _inputKey(self, key, newStart, newStop):
+        """
+        Return the key of the Input request for the given Output key,
+        given the input region from _sourceRegions() (which has no channel and time axes).
+        """
+        inAxistags = self.Input.meta.axistags
+        channelAxis = inAxistags.index('c')
+        timeAxis = inAxistags.index('t')
+
+        treadKey = list( roi.roiToSlice(newStart, newStop) )
+        if inAxistags.axisTypeCount(vigra.AxisType.Time):
+            if timeAxis < channelAxis:
+                treadKey.insert(timeAxis, key[timeAxis])
+            else:
+                treadKey.insert(timeAxis-1, key[timeAxis])
+        if inAxistags.axisTypeCount(vigra.AxisType.Channels) == 0:
+            treadKey =  popFlagsFromTheKey(treadKey,self.Output.meta.axistags,'c')
+        else:
+            treadKey.insert(channelAxis, slice(None,None,None))
+        return tuple(treadKey)
+
+    def _outputRoi(self, subindex, rroi):
+        """
+        Translate a roi of one of the Features to the corresponding roi of the Output.
+        """
+        key = roiToSlice(rroi.start, rroi.stop)
+        index = subindex[0]
+        subslot = self.Features[index]
+        key = list(key)
+        channelIndex = self.Input.meta.axistags.index('c')
+
+        # Translate channel slice to the correct location for the output slot.
+        key[channelIndex] = slice(self.featureOutputChannels[index][0] + key[channelIndex].start,
+                                  self.featureOutputChannels[index][0] + key[channelIndex].stop)
+        return SubRegion(subslot, pslice=key)
+
+    def mapRoiToInputs(self, slot, subindex, rroi):
+        if slot == self.Features:
+            rroi = self._outputRoi(subindex, rroi)
+        key = rroi.toSlice()
+        newStart, newStop = self._sourceRegions(key)[4:]
+        treadKey = self._inputKey(key, newStart, newStop)
+        return [ (self.Input, SubRegion(self.Input, pslice=treadKey)) ]
+
     def execute(self, slot, subindex, rroi, result):
         assert slot == self.Features or slot == self.Output
         if slot == self.Features:
-            key = roiToSlice(rroi.start, rroi.stop)
-            index = subindex[0]
-            subslot = self.Features[index]
-            key = list(key)
-            channelIndex = self.Input.meta.axistags.index('c')
-            
-            # Translate channel slice to the correct location for the output slot.
-            key[channelIndex] = slice(self.featureOutputChannels[index][0] + key[channelIndex].start,
-                                      self.featureOutputChannels[index][0] + key[channelIndex].stop)
-            rroi = SubRegion(subslot, pslice=key)
-    
+            rroi = self._outputRoi(subindex, rroi)
+
             # Get output slot region for this channel
             return self.execute(self.Output, (), rroi, result)
         elif slot == self.outputs["Output"]:
@@ -402,27 +464,10 @@ class OpPixelFeaturesPresmoothed(Operator):
             hasTimeAxis = self.inputs["Input"].meta.axistags.axisTypeCount(vigra.AxisType.Time)
             timeAxis=self.inputs["Input"].meta.axistags.index('t')
 
-            subkey = popFlagsFromTheKey(key,axistags,'c')
-            subshape=popFlagsFromTheKey(shape,axistags,'c')
-            at2 = copy.copy(axistags)
-            at2.dropChannelAxis()
-            subshape=popFlagsFromTheKey(subshape,at2,'t')
-            subkey = popFlagsFromTheKey(subkey,at2,'t')
-
             oldstart, oldstop = roi.sliceToRoi(key, shape)
 
-            start, stop = roi.sliceToRoi(subkey,subkey)
-            maxSigma = max(0.7,self.maxSigma)  #we use 0.7 as an approximation of not doing any smoothing
-            #smoothing was already applied previously
-            
-            # The region of the smoothed image we need to give to the feature filter (in terms of INPUT coordinates)
-            # 0.7, because the features receive a pre-smoothed array and don't need much of a neighborhood 
-            vigOpSourceStart, vigOpSourceStop = roi.extendSlice(start, stop, subshape, 0.7, self.WINDOW_SIZE)
-            
-            
-            # The region of the input that we need to give to the smoothing operator (in terms of INPUT coordinates)
-            newStart, newStop = roi.extendSlice(vigOpSourceStart, vigOpSourceStop, subshape, maxSigma, self.WINDOW_SIZE)
-            
+            start, stop, vigOpSourceStart, vigOpSourceStop, newStart, newStop = self._sourceRegions(key)
+
             newStartSmoother = roi.TinyVector(start - vigOpSourceStart)
             newStopSmoother = roi.TinyVector(stop - vigOpSourceStart)
             roiSmoother = roi.roiToSlice(newStartSmoother, newStopSmoother)
@@ -431,24 +476,7 @@ class OpPixelFeaturesPresmoothed(Operator):
             vigOpSourceStart = roi.TinyVector(vigOpSourceStart - newStart)
             vigOpSourceStop = roi.TinyVector(vigOpSourceStop - newStart)
 
-            readKey = roi.roiToSlice(newStart, newStop)
-
-            writeNewStart = start - newStart
-            writeNewStop = writeNewStart +  stop - start
-
-            treadKey=list(readKey)
-
-            if hasTimeAxis:
-                if timeAxis < channelAxis:
-                    treadKey.insert(timeAxis, key[timeAxis])
-                else:
-                    treadKey.insert(timeAxis-1, key[timeAxis])
-            if  self.inputs["Input"].meta.axistags.axisTypeCount(vigra.AxisType.Channels) == 0:
-                treadKey =  popFlagsFromTheKey(treadKey,axistags,'c')
-            else:
-                treadKey.insert(channelAxis, slice(None,None,None))
-
-            treadKey=tuple(treadKey)
+            treadKey = self._inputKey(key, newStart, newStop)
 
             req = self.inputs["Input"][treadKey]
             
@@ -20,3 +20,4 @@
 #		   http://ilastik.org/license/
 ###############################################################################
 from request import *
+from processPool import ProcessPool, ProcessBoundRequest
@@ -0,0 +1,337 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Process-based execution for workloads that hold the GIL.
+
+Requests normally run on the worker threads of the global :py:class:`threadPool.ThreadPool`.
+That's fine for workloads that spend their time in numpy/vigra (which release the GIL),
+but pure-Python workloads can't use more than one core that way.
+A :py:class:`ProcessBoundRequest` ships its workload to a pool of worker *processes* instead.
+While the workload runs, the request is suspended, so its worker thread is free to run other requests.
+
+The workload must be picklable, i.e. a module-level function and picklable arguments.
+If the request is given a destination via ``writeInto()``, the workload is called with an extra
+``destination`` keyword argument: a shared-memory array of the same shape and dtype, which is
+copied into the real destination when the workload completes.
+
+Example (e.g. from within an operator's ``execute`` function)::
+
+    def _histogram_kernel(data, destination):
+        ...
+
+    def execute(self, slot, subindex, roi, result):
+        data = self.Input(roi.start, roi.stop).wait()
+        ProcessBoundRequest( _histogram_kernel, data ).writeInto(result).wait()
+        return result
+"""
+# Built-in
+import os
+import atexit
+import cPickle as pickle
+import tempfile
+import threading
+import traceback
+import multiprocessing
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Third-party
+import numpy
+
+# lazyflow
+from request import Request, RequestLock
+
+def _shm_dir():
+    return '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+def _call_tracked(marker_filename, fn, args):
+    """
+    Executed in the worker process: Record which process runs the task, then run it.
+    """
+    with open(marker_filename, 'w') as f:
+        f.write( str(os.getpid()) )
+    return fn(*args)
+
+class ProcessPool(object):
+    """
+    Thin wrapper around ``multiprocessing.Pool``.
+    The worker processes are not started until the first task is submitted.
+
+    ``multiprocessing.Pool`` silently drops the task of a worker process that dies 
+    (e.g. segfault or OOM kill).  A watchdog thread detects such tasks and reports them as lost.
+    """
+    # How often the watchdog checks the running tasks (in seconds)
+    WATCHDOG_INTERVAL = 0.5
+
+    def __init__(self, num_processes=None):
+        self.num_processes = num_processes or multiprocessing.cpu_count()
+        self._pool = None
+        self._lock = threading.Lock()
+
+        # marker filename -> (async result, lost_callback)
+        self._tasks = {}
+        self._stopped = threading.Event()
+        self._watchdog = None
+
+    def apply_async(self, fn, args, callback, lost_callback):
+        """
+        Run ``fn(*args)`` in one of the worker processes.
+        When it completes, ``callback(result)`` is called from the pool's result-handler thread.
+        If the worker process dies while running the task, ``lost_callback()`` is called 
+        from the watchdog thread instead.
+
+        .. note:: ``multiprocessing.Pool`` never calls ``callback`` if ``fn`` raises.
+                  Callers are expected to catch all exceptions within ``fn`` (see :py:func:`_run_in_process`).
+        """
+        fd, marker_filename = tempfile.mkstemp( prefix='lazyflow-', suffix='.pid', dir=_shm_dir() )
+        os.close(fd)
+
+        def handle_result(result):
+            with self._lock:
+                self._tasks.pop( marker_filename, None )
+            _remove_file( marker_filename )
+            callback( result )
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool( self.num_processes )
+                self._stopped.clear()
+                self._watchdog = threading.Thread( target=self._watch, args=(self._pool,), name="ProcessPool watchdog" )
+                self._watchdog.daemon = True
+                self._watchdog.start()
+            async_result = self._pool.apply_async( _call_tracked, (marker_filename, fn, args), callback=handle_result )
+            if not async_result.ready():
+                self._tasks[marker_filename] = (async_result, lost_callback)
+
+    def _watch(self, pool):
+        """
+        Watchdog thread: report the tasks whose worker process has died.
+        """
+        while not self._stopped.wait( self.WATCHDOG_INTERVAL ):
+            with self._lock:
+                if pool is not self._pool:
+                    return
+                # (Reaped workers are removed from the pool, and exited ones have an exitcode.)
+                live_pids = set( p.pid for p in pool._pool if p.exitcode is None )
+                lost = []
+                for marker_filename, (async_result, lost_callback) in self._tasks.items():
+                    pid = _read_pid( marker_filename )
+                    if pid is not None and pid not in live_pids and not async_result.ready():
+                        del self._tasks[marker_filename]
+                        lost.append( (marker_filename, lost_callback) )
+            for marker_filename, lost_callback in lost:
+                _remove_file( marker_filename )
+                lost_callback()
+
+    def stop(self):
+        """
+        Terminate the worker processes.  Any tasks that are still running are dropped.
+        """
+        with self._lock:
+            pool = self._pool
+            self._pool = None
+            tasks = self._tasks
+            self._tasks = {}
+            self._stopped.set()
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        for marker_filename in tasks:
+            _remove_file( marker_filename )
+
+def _read_pid(marker_filename):
+    """
+    Return the pid written by :py:func:`_call_tracked`, or None if the task hasn't started yet.
+    """
+    try:
+        with open(marker_filename) as f:
+            pid = f.read()
+    except IOError:
+        return None
+    return int(pid) if pid else None
+
+def _remove_file(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+class _SharedArray(object):
+    """
+    An array backed by a file in shared memory (if available),
+    so that it can be written by a worker process and read by this one without pickling the data.
+    """
+    def __init__(self, shape, dtype):
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+        self.filename = None
+        if numpy.prod( self.shape ) == 0:
+            # (numpy.memmap can't map an empty file)
+            self.array = numpy.ndarray( self.shape, dtype=self.dtype )
+        else:
+            fd, self.filename = tempfile.mkstemp( prefix='lazyflow-', suffix='.shm', dir=_shm_dir() )
+            os.close(fd)
+            self.array = numpy.memmap( self.filename, dtype=self.dtype, mode='w+', shape=self.shape )
+
+    @property
+    def info(self):
+        """
+        Everything a worker process needs to open this array (see :py:func:`_open_shared_array`).
+        """
+        return ( self.filename, self.shape, self.dtype.str )
+
+    def close(self):
+        self.array = None
+        if self.filename is not None:
+            os.remove( self.filename )
+            self.filename = None
+
+def _open_shared_array( (filename, shape, dtype) ):
+    if filename is None:
+        return numpy.ndarray( shape, dtype=dtype )
+    return numpy.memmap( filename, dtype=dtype, mode='r+', shape=shape )
+
+def _run_in_process(fn, args, shared_array_info):
+    """
+    Executed in the worker process.
+    Returns a pickled tuple: ``(True, result)`` or ``(False, (exception, formatted_traceback))``.
+    We do the pickling ourselves so that unpicklable results are reported as failures
+    (otherwise ``multiprocessing.Pool`` would never call our callback).
+    """
+    try:
+        if shared_array_info is None:
+            result = fn(*args)
+        else:
+            destination = _open_shared_array( shared_array_info )
+            fn( *args, destination=destination )
+            if isinstance(destination, numpy.memmap):
+                destination.flush()
+            del destination
+            result = None
+        return pickle.dumps( (True, result), pickle.HIGHEST_PROTOCOL )
+    except Exception as ex:
+        tb = traceback.format_exc()
+        try:
+            return pickle.dumps( (False, (ex, tb)), pickle.HIGHEST_PROTOCOL )
+        except Exception:
+            # The exception itself can't be pickled.
+            return pickle.dumps( (False, (RuntimeError(repr(ex)), tb)), pickle.HIGHEST_PROTOCOL )
+
+class ProcessBoundRequest(Request):
+    """
+    A :py:class:`Request` whose workload is executed in a worker process of the global :py:class:`ProcessPool`.
+
+    - ``notify_finished``, ``notify_failed`` and ``notify_cancelled`` behave as for ordinary requests.
+    - If the workload raises, the exception is re-raised in the waiting request(s).
+      The worker process traceback is logged.
+    - The workload can't be interrupted once it has been sent to a worker process.
+      If the request is cancelled in the meantime, the workload's result is simply discarded.
+    - If the worker process dies while executing the workload, the request fails with a RuntimeError.
+    """
+
+    # One process pool shared by all process-bound requests.
+    global_process_pool = None
+
+    @classmethod
+    def reset_process_pool( cls, num_processes = multiprocessing.cpu_count() ):
+        """
+        Change the number of worker processes.
+        The processes are started lazily, when the first process-bound request executes.
+
+        .. note:: It is only valid to call this during startup.
+                  Any workloads currently running in the pool will be dropped.
+        """
+        if cls.global_process_pool is not None:
+            cls.global_process_pool.stop()
+        cls.global_process_pool = ProcessPool( num_processes )
+
+    def __init__(self, fn, *args):
+        """
+        :param fn: A picklable callable, executed as ``fn(*args)`` in a worker process.
+        :param args: Picklable positional arguments for ``fn``.
+        """
+        self._process_fn = fn
+        self._process_args = args
+        self._destination = None
+        super( ProcessBoundRequest, self ).__init__( self._execute_in_process )
+
+    def writeInto(self, destination):
+        """
+        Have the workload write its output into the given array (via shared memory).
+        The workload will receive the shared array as a keyword argument named ``destination``.
+        """
+        assert not destination.dtype.hasobject, "Can't share object arrays between processes."
+        self._destination = destination
+        return self
+
+    def _execute_in_process(self):
+        shared_array = None
+        if self._destination is not None:
+            shared_array = _SharedArray( self._destination.shape, self._destination.dtype )
+        try:
+            # The lock is released by the pool's result-handler thread when the workload is done.
+            # In the meantime, acquiring it a second time suspends this request (not the whole worker thread).
+            outcome = []
+            done_lock = RequestLock()
+            done_lock.acquire()
+            def handle_outcome(pickled_outcome):
+                outcome.append( pickled_outcome )
+                done_lock.release()
+
+            def handle_lost():
+                error = RuntimeError( "The worker process died while executing {}".format( self._process_fn ) )
+                outcome.append( pickle.dumps( (False, (error, "(no traceback)")), pickle.HIGHEST_PROTOCOL ) )
+                done_lock.release()
+
+            shared_info = shared_array and shared_array.info
+            ProcessBoundRequest.global_process_pool.apply_async( _run_in_process,
+                                                                 (self._process_fn, self._process_args, shared_info),
+                                                                 handle_outcome,
+                                                                 handle_lost )
+            done_lock.acquire()
+
+            # Were we cancelled while the workload was running in the other process?
+            # (If we were suspended, acquire() already raised.  Otherwise, check here.)
+            Request.raise_if_cancelled()
+
+            ok, value = pickle.loads( outcome[0] )
+            if not ok:
+                exception, tb = value
+                logger.error( "Process-bound workload {} failed in worker process:\n{}"
+                              .format( self._process_fn, tb ) )
+                raise exception
+
+            if shared_array is None:
+                return value
+            self._destination[...] = shared_array.array
+            return self._destination
+        finally:
+            if shared_array is not None:
+                shared_array.close()
+
+ProcessBoundRequest.reset_process_pool()
+
+def _stop_process_pool():
+    if ProcessBoundRequest.global_process_pool is not None:
+        ProcessBoundRequest.global_process_pool.stop()
+atexit.register( _stop_process_pool )
@@ -21,10 +21,13 @@
 ###############################################################################
 # Built-in
 import sys
+import time
 import functools
+import contextlib
 import itertools
 import collections
 import threading
+import weakref
 import multiprocessing
 import platform
 import traceback
@@ -87,6 +90,40 @@ def log_exception( logger, msg=None, exc_info=None, level=logging.ERROR ):
     if msg:
         logger.log(level, msg )
 
+def _import_asyncio():
+    """
+    Import the asyncio module (or its Python 2 backport, trollius) on demand.
+    Neither is required unless you use the asyncio bridge (e.g. ``Request.as_future()``).
+    """
+    try:
+        import asyncio
+    except ImportError:
+        try:
+            import trollius as asyncio
+        except ImportError:
+            raise ImportError("Awaiting requests requires the asyncio module (or trollius, on Python 2).")
+    return asyncio
+
+def _new_future(loop):
+    asyncio = _import_asyncio()
+    if hasattr(loop, 'create_future'):
+        return loop.create_future()
+    return asyncio.Future(loop=loop)
+
+# These are executed in the event loop thread (via loop.call_soon_threadsafe).
+# The future might have been cancelled in the meantime, in which case there's nothing to do.
+def _set_future_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+def _set_future_exception(future, exception):
+    if not future.done():
+        future.set_exception(exception)
+
+def _cancel_future(future):
+    if not future.done():
+        future.cancel()
+
 class Request( object ):
     
     # One thread pool shared by all requests.
@@ -94,17 +131,45 @@ class Request( object ):
     global_thread_pool = None
     
     @classmethod
-    def reset_thread_pool( cls, num_workers = multiprocessing.cpu_count() ):
+    def reset_thread_pool( cls, num_workers = multiprocessing.cpu_count(), work_stealing=False, memory_budget=None ):
         """
         Change the number of threads allocated to the request system.
         
+        :param num_workers: The number of worker threads.
+        :param work_stealing: If True, use a work-stealing scheduler:  Child requests are queued 
+                              on the worker that spawned them and idle workers steal from the others.
+                              See :py:class:`threadPool.ThreadPool` for details.
+        :param memory_budget: If not None, the maximum total estimated RAM (in bytes) of the requests executing at once.
+                              Requests that would exceed the budget are held back until others finish.
+                              See :py:meth:`threadPool.ThreadPool.set_memory_budget()` and ``Request.estimated_bytes``.
+        
         .. note:: It is only valid to call this during startup.
                   Any existing requests will be dropped from the pool.
         """
         if cls.global_thread_pool is not None:
             cls.global_thread_pool.stop()
-        cls.global_thread_pool = threadPool.ThreadPool( num_workers )
+        cls.global_thread_pool = threadPool.ThreadPool( num_workers, 
+                                                        work_stealing=work_stealing, 
+                                                        memory_budget=memory_budget )
     
+    @classmethod
+    def resize_thread_pool( cls, num_workers ):
+        """
+        Change the number of worker threads of the running thread pool.
+        Unlike :py:meth:`reset_thread_pool()`, this is safe to call at any time: no requests are dropped.
+        See :py:meth:`threadPool.ThreadPool.resize()`.
+        """
+        cls.global_thread_pool.resize( num_workers )
+
+    @classmethod
+    def enable_thread_pool_auto_tuning( cls, min_workers, max_workers, interval=1.0 ):
+        """
+        Let the thread pool add workers while many of them are blocked (e.g. waiting for I/O), 
+        and remove workers while the CPU is saturated.
+        See :py:class:`threadPool.ThreadPoolAutoTuner`.
+        """
+        cls.global_thread_pool.enable_auto_tuning( min_workers, max_workers, interval )
+
     class CancellationException(Exception):
         """
         This is raised when the whole request has been cancelled.
@@ -153,6 +218,60 @@ class Request( object ):
     
     _root_request_counter = itertools.count()
 
+    # Priority classes.  Requests of a more urgent class (lower value) are always scheduled first,
+    #  and running requests of a less urgent class give up their worker at their next wait().
+    # The class is chosen when a root request is created (see priority_class_context) and inherited by its children.
+    INTERACTIVE = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+    # Holds the priority class for new root requests created in the current thread.
+    _thread_priority_class = threading.local()
+
+    # If its value is True, requests created by the current thread are root requests,
+    # even if they are created from within another request.  See priority_class_context()
+    _thread_detached = threading.local()
+
+    @classmethod
+    @contextlib.contextmanager
+    def priority_class_context(cls, priority_class, detached=False):
+        """
+        Context manager.
+        Root requests created by the current thread within the context get the given priority class.
+        (Child requests always inherit the priority class of their parent.)
+
+        If ``detached`` is True, all requests created within the context are root requests,
+        even if they are created from within another request.  That is, they don't inherit the
+        priority or cancelled status of the current request, and it doesn't wait for them.
+        (For example, to start speculative background work from within an ordinary request.)
+        Don't wait() within a detached context.
+
+        For example:
+
+        .. code-block:: python
+
+            with Request.priority_class_context(Request.INTERACTIVE):
+                data = op.Output[:].wait()
+        """
+        assert priority_class in (cls.INTERACTIVE, cls.NORMAL, cls.BACKGROUND), \
+            "Unknown priority class: {}".format( priority_class )
+        old_class = getattr(cls._thread_priority_class, 'value', cls.NORMAL)
+        old_detached = getattr(cls._thread_detached, 'value', False)
+        cls._thread_priority_class.value = priority_class
+        cls._thread_detached.value = detached
+        try:
+            yield
+        finally:
+            cls._thread_priority_class.value = old_class
+            cls._thread_detached.value = old_detached
+
+    # If True, the time spent in wait() is charged to the innermost active WaitTimer of the waiting greenlet.
+    # Only enabled while profiling, so ordinary waits don't pay for the extra bookkeeping.
+    _track_wait_time = False
+
+    # If not None, a RequestTracer that is notified of request life cycle events (see lazyflow.utility.RequestTracer).
+    _tracer = None
+
     def __init__(self, fn):
         """
         Constructor.
@@ -170,11 +289,16 @@ class Request( object ):
         self.uncancellable = False
         self.finished = False
         self.execution_complete = False
-        self.finished_event = threading.Event()
+        self._finished_event = None # Created on demand.  See finished_event
+        self._finished_event_set = False
         self.exception = None
         self.exception_info = (None, None, None)
         self._cleaned = False
 
+        #: The estimated RAM (in bytes) this request will need, for admission control in the ThreadPool.
+        #: Only set for requests that aren't already covered by an ancestor's estimate (see Slot.get)
+        self.estimated_bytes = 0
+
         # Execution
         self.greenlet = None # Not created until assignment to a worker
         self._assigned_worker = None
@@ -182,20 +306,30 @@ class Request( object ):
         # Request relationships
         self.pending_requests = set()  # Requests that are waiting for this one
         self.blocking_requests = set() # Requests that this one is waiting for (currently one at most since wait() can only be called on one request at a time)
-        self.child_requests = set()    # Requests that were created from within this request (NOT the same as pending_requests)
+        self.child_requests = set()    # Unfinished requests that were created from within this request (NOT the same as pending_requests)
+        self._num_children = 0         # Total number of child requests ever created (for their sub-priority)
         
         self._current_foreign_thread = None
-        current_request = Request._current_request()
+        if getattr( Request._thread_detached, 'value', False ):
+            current_request = None
+        else:
+            current_request = Request._current_request()
         self.parent_request = current_request
         if current_request is None:
-            self._priority = [ Request._root_request_counter.next() ]
+            priority_class = getattr( Request._thread_priority_class, 'value', Request.NORMAL )
+            self._priority = [ priority_class, Request._root_request_counter.next() ]
+            self._within_estimated_request = False
         else:
+            # If an ancestor was charged against the memory budget, this request's RAM is part of that estimate.
+            self._within_estimated_request = current_request._within_estimated_request \
+                                             or current_request.estimated_bytes > 0
             with current_request._lock:
                 current_request.child_requests.add(self)
+                current_request._num_children += 1
                 # We must ensure that we get the same cancelled status as our parent.
                 self.cancelled = current_request.cancelled
                 # We acquire the same priority as our parent, plus our own sub-priority
-                self._priority = current_request._priority + [ len(current_request.child_requests) ]
+                self._priority = current_request._priority + [ current_request._num_children ]
 
         self._lock = threading.Lock() # NOT an RLock, since requests may share threads
         self._sig_finished = SimpleSignal()
@@ -204,6 +338,9 @@ class Request( object ):
         
         self._sig_execution_complete = SimpleSignal()
 
+        if Request._tracer is not None:
+            Request._tracer.request_created(self)
+
     def __lt__(self, other):
         """
         Request comparison is by priority.
@@ -211,6 +348,14 @@ class Request( object ):
         """
         return self._priority < other._priority
 
+    @property
+    def priority_class(self):
+        """
+        The priority class of this request: ``Request.INTERACTIVE``, ``Request.NORMAL`` or ``Request.BACKGROUND``.
+        This member is also used by the ThreadPool to decide whether queued work is more urgent than running work.
+        """
+        return self._priority[0]
+
     def __str__(self):
         return "fn={}, assigned_worker={}, started={}, execution_complete={}, exception={}, "\
                "greenlet={}, current_foreign_thread={}, uncancellable={}"\
@@ -238,6 +383,19 @@ class Request( object ):
             self._cleaned = True
             self._result = None
         
+    @property
+    def finished_event(self):
+        """
+        A ``threading.Event`` that is set when this request is finished (for non-request threads to wait on).
+        Most requests are only ever waited for from within other requests, so it's created on demand.
+        """
+        with self._lock:
+            if self._finished_event is None:
+                self._finished_event = threading.Event()
+                if self._finished_event_set:
+                    self._finished_event.set()
+            return self._finished_event
+
     @property
     def assigned_worker(self):
         """
@@ -257,6 +415,9 @@ class Request( object ):
         # Create our greenlet now (so the greenlet has the correct parent, i.e. the worker)
         self.greenlet = RequestGreenlet(self, self._execute)
 
+        if Request._tracer is not None:
+            Request._tracer.request_assigned(self, worker)
+
     @property
     def result(self):
         assert not self._cleaned, "Can't get this result.  The request has already been cleaned!"
@@ -304,6 +465,13 @@ class Request( object ):
             # To free memory (and child requests), we can clean up everything but the result.
             self.clean( _fullClean=False )
 
+            # Our parent doesn't need to keep track of us anymore (there's nothing left to cancel).
+            parent = self.parent_request
+            if parent is not None:
+                with parent._lock:
+                    parent.child_requests.discard(self)
+                self.parent_request = None
+
             # Unconditionally signal (internal use only)
             with self._lock:
                 self.execution_complete = True
@@ -311,8 +479,19 @@ class Request( object ):
                 self._sig_execution_complete.clean()
 
         finally:
-            # Notify non-request-based threads
-            self.finished_event.set()
+            # Return our share of the memory budget (if any) so held-back requests can start.
+            if self.estimated_bytes:
+                Request.global_thread_pool.release_budget(self)
+
+            # Notify non-request-based threads (if any of them created the event)
+            with self._lock:
+                self._finished_event_set = True
+                finished_event = self._finished_event
+            if finished_event is not None:
+                finished_event.set()
+
+            if Request._tracer is not None:
+                Request._tracer.request_finished(self)
 
             # Clean-up
             if self.greenlet is not None:
@@ -329,6 +508,26 @@ class Request( object ):
                 self.started = True
                 self._wake_up()
     
+    @classmethod
+    def submit_many(cls, requests):
+        """
+        Submit several requests at once.  Equivalent to calling ``submit()`` on each of them, 
+        but the requests that aren't started yet are handed to the thread pool as a single batch.
+        (See :py:meth:`threadPool.ThreadPool.wake_up_many()`.)
+        """
+        new_requests = []
+        for req in requests:
+            if not isinstance(req, Request):
+                # e.g. ValueRequest
+                req.submit()
+                continue
+            with req._lock:
+                if not req.started:
+                    req.started = True
+                    new_requests.append(req)
+        if new_requests:
+            Request.global_thread_pool.wake_up_many( new_requests )
+
     def _wake_up(self):
         """
         Resume this request's execution (put it back on the worker's job queue).
@@ -340,7 +539,11 @@ class Request( object ):
         Switch to this request's greenlet
         """
         try:
-            self.greenlet.switch()
+            tracer = Request._tracer
+            if tracer is None:
+                self.greenlet.switch()
+            else:
+                tracer.traced_switch(self)
         except greenlet.error:
             # This is a serious error.
             # If we are handling an exception here, it means there's a bug in the request framework,
@@ -386,6 +589,14 @@ class Request( object ):
                              .format( threading.current_thread().name, self, self.greenlet.parent ) )
             raise
 
+    def _yield_worker(self):
+        """
+        Suspend this request, but put it straight back onto its worker's queue.
+        The worker will resume it after it has run any more urgent tasks.
+        """
+        self._wake_up()
+        self._suspend()
+
     def wait(self, timeout=None):
         """
         Start this request if necessary, then wait for it to complete.  Return the request's result.
@@ -418,12 +629,17 @@ class Request( object ):
         # Identify the request that is waiting for us (the current context)
         current_request = Request._current_request()
 
-        if current_request is None:
-            # 'None' means that this thread is not one of the request worker threads.
-            self._wait_within_foreign_thread( timeout )
-        else:
-            assert timeout is None, "The timeout parameter may only be used when wait() is called from a foreign thread."
-            self._wait_within_request( current_request )
+        wait_start = time.time() if Request._track_wait_time else None
+        try:
+            if current_request is None:
+                # 'None' means that this thread is not one of the request worker threads.
+                self._wait_within_foreign_thread( timeout )
+            else:
+                assert timeout is None, "The timeout parameter may only be used when wait() is called from a foreign thread."
+                self._wait_within_request( current_request )
+        finally:
+            if wait_start is not None:
+                WaitTimer._charge( time.time() - wait_start )
 
         assert self.finished
         return self._result
@@ -454,15 +670,20 @@ class Request( object ):
                 raise Request.CircularWaitException()
 
         if direct_execute_needed:
+            # After direct execution, we're already finished.  No need to wait for the event.
             self._current_foreign_thread = threading.current_thread()
-            self._execute()
+            tracer = Request._tracer
+            if tracer is None:
+                self._execute()
+            else:
+                tracer.traced_execute(self)
         else:
             self.submit()
 
-        # This is a non-worker thread, so just block the old-fashioned way
-        completed = self.finished_event.wait(timeout)
-        if not completed:
-            raise Request.TimeoutException()
+            # This is a non-worker thread, so just block the old-fashioned way
+            completed = self.finished_event.wait(timeout)
+            if not completed:
+                raise Request.TimeoutException()
         
         if self.cancelled:
             # It turns out this request was already cancelled.
@@ -480,6 +701,12 @@ class Request( object ):
         if current_request.cancelled:
             raise Request.CancellationException()
 
+        # If more urgent work has arrived in the meantime, let it have our worker first.
+        if Request.global_thread_pool.has_more_urgent_work( current_request.priority_class ):
+            current_request._yield_worker()
+            if current_request.cancelled:
+                raise Request.CancellationException()
+
         if current_request == self:
             # It's usually nonsense for a request to wait for itself,
             #  but we allow it if the request is already "finished"
@@ -503,7 +730,13 @@ class Request( object ):
 
             direct_execute_needed = not self.started
             suspend_needed = self.started and not self.execution_complete
-            if direct_execute_needed or suspend_needed:
+
+            # Fast path: If our creator waits for us before we were started, we'll be executed inline
+            #  and nobody else can be waiting for us, so there's no need to record the dependency.
+            # (If our creator gets cancelled, we'll be cancelled along with it anyway.)
+            track_dependency = suspend_needed or \
+                               ( direct_execute_needed and self.parent_request is not current_request )
+            if track_dependency:
                 current_request.blocking_requests.add(self)
                 self.pending_requests.add(current_request)
             
@@ -518,6 +751,12 @@ class Request( object ):
                 # Here, we set up a callback so we'll wake up once this request is complete.
                 self._sig_execution_complete.subscribe( functools.partial(current_request._handle_finished_request, self) )
 
+        if Request._tracer is not None:
+            if suspend_needed:
+                Request._tracer.request_suspended(current_request, self)
+            elif direct_execute_needed:
+                Request._tracer.request_inlined(self, current_request)
+
         if suspend_needed:
             current_request._suspend()
         elif direct_execute_needed:
@@ -527,12 +766,13 @@ class Request( object ):
             self._assigned_worker = current_request._assigned_worker
             self._execute()
             self.greenlet = None
-            current_request.blocking_requests.remove(self)
 
-        if suspend_needed or direct_execute_needed:
+        if track_dependency:
+            if direct_execute_needed:
+                current_request.blocking_requests.remove(self)
             # No need to lock here because set.remove is atomic in CPython.
             #with self._lock:
-                self.pending_requests.remove( current_request )
+            self.pending_requests.remove( current_request )
 
         # Now we're back (no longer suspended)
         # Was the current request cancelled while it was waiting for us?
@@ -618,10 +858,13 @@ class Request( object ):
         No request will be cancelled if other non-cancelled requests are waiting for its results.
         """
         # We can only be cancelled if: 
+        # (0) We haven't finished yet (there's nothing left to cancel, and our result must stay available) AND
         # (1) There are no foreign threads blocking for us (flagged via self.uncancellable) AND
         # (2) our parent request (if any) is already cancelled AND
         # (3) all requests that are pending for this one are already cancelled
         with self._lock:
+            if self.finished:
+                return
             cancelled = not self.uncancellable
             cancelled &= (self.parent_request is None or self.parent_request.cancelled)
             for r in self.pending_requests:
@@ -692,8 +935,197 @@ class Request( object ):
     def getResult(self):
         return self.result
 
+    ###############################
+    #### asyncio compatibility ####
+    ###############################
+
+    def as_future(self, loop=None):
+        """
+        Submit this request and return an asyncio (or trollius) Future for its result, 
+        so it can be awaited from an event loop without blocking a thread.
+
+        - The future is completed from within the loop thread (via ``loop.call_soon_threadsafe``).
+        - If the request fails, the future receives the request's exception.
+        - If the request is cancelled, the future is cancelled.
+        - If the future is cancelled (e.g. because the awaiting task was cancelled), ``cancel()`` is 
+          called on this request.  (As usual, the request is only cancelled if nobody else needs its result.)
+
+        :param loop: The event loop the future belongs to.  By default, the current event loop.
+        """
+        asyncio = _import_asyncio()
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        future = _new_future(loop)
+
+        def handle_finished(result):
+            loop.call_soon_threadsafe( _set_future_result, future, result )
+        def handle_failed(exception, exc_info):
+            loop.call_soon_threadsafe( _set_future_exception, future, exception )
+        def handle_cancelled():
+            loop.call_soon_threadsafe( _cancel_future, future )
+        self.notify_finished( handle_finished )
+        self.notify_failed( handle_failed )
+        self.notify_cancelled( handle_cancelled )
+
+        def handle_future_done(f):
+            if f.cancelled():
+                self.cancel()
+        future.add_done_callback( handle_future_done )
+
+        self.submit()
+        return future
+
+    def __await__(self):
+        """
+        Python 3 only: Allows ``result = await request`` from within a coroutine.  See :py:meth:`as_future()`.
+        """
+        return self.as_future().__await__()
+
 Request.reset_thread_pool()
 
+class WaitTimer(object):
+    """
+    Context manager that measures how much time the current request (or foreign thread) 
+    spends waiting for other requests to complete, i.e. in ``Request.wait()`` and ``Request.block()``.
+    Timers can be nested.  Only the innermost active timer of the waiting greenlet is charged.
+
+    .. note:: Waits are only measured while ``Request._track_wait_time`` is True.
+    """
+    def __init__(self):
+        self.seconds = 0.0
+    
+    def __enter__(self):
+        current_greenlet = greenlet.getcurrent()
+        try:
+            current_greenlet.wait_timers.append(self)
+        except AttributeError:
+            current_greenlet.wait_timers = [self]
+        return self
+
+    def __exit__(self, *args):
+        popped = greenlet.getcurrent().wait_timers.pop()
+        assert popped is self
+
+    @staticmethod
+    def _charge(seconds):
+        timers = getattr(greenlet.getcurrent(), 'wait_timers', None)
+        if timers:
+            timers[-1].seconds += seconds
+
+def _request_slot(request):
+    """
+    Return the slot whose data the given request (or its closest ancestor that was created by ``Slot.get()``) 
+    is computing, or None if the request isn't working on behalf of a slot.
+    """
+    while request is not None:
+        fn = request.fn
+        # Unwrap Request.writeInto() and functools.partial
+        fn = getattr( fn, 'func', fn )
+        slot = getattr( fn, 'slot', None )
+        if slot is not None:
+            return slot
+        request = request.parent_request
+    return None
+
+class OperatorStatsRegistry(object):
+    """
+    Statistics collected per operator by several independent collectors
+    (:py:class:`RequestLock` and each :py:class:`lazyflow.utility.OperatorProfiler`).
+    Each collector keeps its stats for an operator under its own key (e.g. the collector itself).
+
+    Operators are keyed weakly, so the stats of a deleted operator are discarded with it,
+    instead of being attributed to a new operator that happens to get the same id().
+    Stats that aren't attributed to any operator are kept under ``operator=None``.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operator_stats = weakref.WeakKeyDictionary() # { operator : { collector : stats } }
+        self._unattributed_stats = {}                      # { collector : stats }
+
+    def record(self, operator, collector, stats_type, update, create=True):
+        """
+        Call ``update(stats)`` with the given collector's stats for the given operator (while holding the registry lock).
+
+        :param stats_type: Called to create the stats if the collector has no stats for this operator yet.
+        :param create: If False, don't create missing stats (and don't call ``update``).
+        """
+        with self._lock:
+            if operator is None:
+                collector_stats = self._unattributed_stats
+            else:
+                try:
+                    collector_stats = self._operator_stats[operator]
+                except KeyError:
+                    if not create:
+                        return
+                    collector_stats = self._operator_stats[operator] = {}
+            try:
+                stats = collector_stats[collector]
+            except KeyError:
+                if not create:
+                    return
+                stats = collector_stats[collector] = stats_type()
+            update( stats )
+
+    def snapshot(self, collector):
+        """
+        Return the given collector's stats as a list of ``(operator, stats.to_dict())`` pairs.
+        """
+        with self._lock:
+            items = [ (operator, collector_stats[collector])
+                      for operator, collector_stats in self._operator_stats.items()
+                      if collector in collector_stats ]
+            if collector in self._unattributed_stats:
+                items.append( (None, self._unattributed_stats[collector]) )
+            return [ (operator, stats.to_dict()) for operator, stats in items ]
+
+    def reset(self, collector):
+        """
+        Discard all stats of the given collector.
+        """
+        with self._lock:
+            for collector_stats in self._operator_stats.values():
+                collector_stats.pop( collector, None )
+            self._unattributed_stats.pop( collector, None )
+
+#: The per-operator statistics of all collectors.
+operator_stats = OperatorStatsRegistry()
+
+class RequestLockStats(object):
+    """
+    Contention statistics for a :py:class:`RequestLock` (or for all locks acquired on behalf of one operator).
+    Only collected while lock instrumentation is enabled.  See :py:meth:`RequestLock.enable_instrumentation()`.
+    """
+    def __init__(self):
+        self.acquisitions = 0        # Total number of (blocking or successful non-blocking) acquisitions
+        self.contended = 0           # Number of acquisitions that had to wait for another holder
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.max_hold_time = 0.0
+        self.slowest_holder = None   # Operator/slot that held the lock for max_hold_time
+        self.holder = None           # Operator/slot that currently holds the lock (per-lock stats only)
+
+    def record_acquisition(self, contended, wait_time):
+        self.acquisitions += 1
+        if contended:
+            self.contended += 1
+        self.total_wait_time += wait_time
+        self.max_wait_time = max( self.max_wait_time, wait_time )
+
+    def record_hold(self, holder, hold_time):
+        if hold_time > self.max_hold_time:
+            self.max_hold_time = hold_time
+            self.slowest_holder = holder
+
+    def to_dict(self):
+        return { 'acquisitions' : self.acquisitions,
+                 'contended' : self.contended,
+                 'total_wait_time' : self.total_wait_time,
+                 'max_wait_time' : self.max_wait_time,
+                 'max_hold_time' : self.max_hold_time,
+                 'slowest_holder' : self.slowest_holder,
+                 'holder' : self.holder }
+
 class RequestLock(object):
     """
     Request-aware lock.  Implements the same interface as threading.Lock.
@@ -702,14 +1134,72 @@ class RequestLock(object):
     
     Requests and normal threads can *share* access to a RequestLock.
     That is, they compete equally for access to the lock.
+
+    Contention can be measured by enabling instrumentation for all RequestLocks (see :py:meth:`enable_instrumentation()`).
+    Each lock then collects :py:class:`RequestLockStats` (see ``stats``), 
+    and the stats are also aggregated per operator (see :py:meth:`contention_report()`).
     
     Implementation detail:  Depends on the ability to call two *private* Request methods: _suspend() and _wake_up().
     """
     logger = logging.getLogger(__name__ + ".RequestLock")
-    def __init__(self):
+
+    # Instrumentation state (see enable_instrumentation())
+    _instrumented = False
+    _slow_holder_threshold = None
+
+    @classmethod
+    def enable_instrumentation(cls, enabled=True, slow_holder_threshold=None):
+        """
+        Start (or stop) collecting contention statistics for all RequestLocks.
+
+        :param slow_holder_threshold: If not None, log a warning whenever a lock is held for longer than this many seconds.
+        """
+        cls._instrumented = enabled
+        cls._slow_holder_threshold = slow_holder_threshold
+
+    @classmethod
+    def reset_instrumentation(cls):
+        """
+        Discard the per-operator statistics collected so far.
+        (Existing per-lock statistics are not affected.)
+        """
+        operator_stats.reset( RequestLock )
+
+    @classmethod
+    def contention_report(cls):
+        """
+        Return the lock statistics aggregated per operator, as a list of dicts (see ``RequestLockStats.to_dict()``), 
+        sorted by ``total_wait_time``, worst first.  Each dict also has ``operator`` (the operator name), ``class`` and ``id`` keys.
+        Acquisitions that weren't made on behalf of any operator are listed with ``operator=None``.
+
+        Acquisitions are attributed to the operator whose slot the acquiring request is computing.
+        For per-block cache locks, that's the cache itself.
+        """
+        report = []
+        for operator, d in operator_stats.snapshot( RequestLock ):
+            del d['holder']
+            if operator is None:
+                d.update( { 'operator' : None, 'class' : None, 'id' : id(None) } )
+            else:
+                d.update( { 'operator' : operator.name, 'class' : type(operator).__name__, 'id' : id(operator) } )
+            report.append( d )
+        report.sort( key=lambda d: d['total_wait_time'], reverse=True )
+        return report
+
+    def __init__(self, track_contention=True):
+        """
+        :param track_contention: If False, this lock never collects statistics, even if instrumentation is enabled.
+                                 (Useful for locks that are used for signaling instead of mutual exclusion.)
+        """
         # This member holds the state of this RequestLock
         self._modelLock = threading.Lock()
 
+        #: Contention statistics for this lock, or None if it was never acquired while instrumentation was enabled.
+        self.stats = None
+        self._track_contention = track_contention
+        self._acquired_at = None
+        self._holder_operator = None
+
         # This member protects the _pendingRequests set from corruption
         self._selfProtectLock = threading.Lock()
         
@@ -731,11 +1221,65 @@ class RequestLock(object):
         :param blocking: Same as in threading.Lock 
         """
         current_request = Request._current_request()
+        if RequestLock._instrumented and self._track_contention:
+            return self._acquire_instrumented(current_request, blocking)
         if current_request is None:
             return self._acquire_from_within_thread(blocking)
         else:
             return self._acquire_from_within_request(current_request, blocking)
 
+    def _acquire_instrumented(self, current_request, blocking):
+        contended = self._modelLock.locked()
+        start = time.time()
+        if current_request is None:
+            got_it = self._acquire_from_within_thread(blocking)
+        else:
+            got_it = self._acquire_from_within_request(current_request, blocking)
+        if not got_it:
+            return False
+
+        # We own the lock now, so nobody else can be modifying our stats.
+        acquired_at = time.time()
+        wait_time = acquired_at - start
+        slot = _request_slot(current_request)
+        if slot is None:
+            operator = None
+            holder = None
+        else:
+            operator = slot.operator
+            holder = "{}.{}".format( operator.name, slot.name )
+
+        if self.stats is None:
+            self.stats = RequestLockStats()
+        self.stats.record_acquisition( contended, wait_time )
+        self.stats.holder = holder
+        self._acquired_at = acquired_at
+        self._holder_operator = operator
+
+        operator_stats.record( operator, RequestLock, RequestLockStats,
+                               lambda stats: stats.record_acquisition( contended, wait_time ) )
+        return True
+
+    def _release_instrumented(self):
+        """
+        Record the hold time of the current holder.  Called just before the lock is released.
+        """
+        hold_time = time.time() - self._acquired_at
+        holder = self.stats.holder
+        operator = self._holder_operator
+        self.stats.record_hold( holder, hold_time )
+        self.stats.holder = None
+        self._acquired_at = None
+        self._holder_operator = None
+
+        # (If the stats were reset in the meantime, there's nothing to update.)
+        operator_stats.record( operator, RequestLock, RequestLockStats,
+                               lambda stats: stats.record_hold( holder, hold_time ), create=False )
+
+        threshold = RequestLock._slow_holder_threshold
+        if threshold is not None and hold_time > threshold:
+            self.logger.warn( "RequestLock was held for {:.3f} seconds by {}".format( hold_time, holder ) )
+
     def _acquire_from_within_request(self, current_request, blocking):
         with self._selfProtectLock:
             # Try to get it immediately.
@@ -786,6 +1330,9 @@ class RequestLock(object):
         """
         assert self._modelLock.locked(), "Can't release a RequestLock that isn't already acquired!"
 
+        if self._acquired_at is not None:
+            self._release_instrumented()
+
         with self._selfProtectLock:
             if len(self._pendingRequests) == 0:
                 # There were no waiting requests or threads, so the lock is free to be acquired again.
@@ -860,13 +1407,21 @@ class SimpleRequestCondition(object):
     
     def __init__(self):
         self._ownership_lock = RequestLock()
-        self._waiter_lock = RequestLock()   # Only one "waiter".  
-                                            # Used to block the current request while we wait to be notify()ed.
+        self._waiter_lock = RequestLock(track_contention=False)  # Only one "waiter".  
+                                                                 # Used to block the current request while we wait to be notify()ed.
     
         # Export the acquire/release methods of the ownership lock
         self.acquire = self._ownership_lock.acquire
         self.release = self._ownership_lock.release
 
+    @property
+    def stats(self):
+        """
+        Contention statistics for the condition's (ownership) lock.  See :py:attr:`RequestLock.stats`.
+        Time spent in :py:meth:`wait()` is not counted as contention.
+        """
+        return self._ownership_lock.stats
+
     def __enter__(self):
         self._ownership_lock.__enter__()
         
@@ -971,10 +1526,8 @@ class RequestPool(object):
             raise RequestPool.RequestPoolError("Can't re-start a RequestPool that was already started.")
         # shallow copy prevents python complaining when finished requests
         # remove themselves from self._requests
-        requests = self._requests.copy()
-        # while loop with pop() allows the gc to clean up completed requests
-        while requests:
-            requests.pop().submit()
+        # Submitting them as one batch avoids notifying every worker for every request.
+        Request.submit_many( self._requests.copy() )
 
     def wait(self):
         """
@@ -1044,6 +1597,55 @@ class RequestPool(object):
         """
         self._requests = set()
 
+    def as_future(self, loop=None):
+        """
+        Submit the pool and return an asyncio (or trollius) Future that completes (with ``None``) 
+        when all requests in the pool have finished.
+        If any request fails, the future receives its exception.  
+        If the future is cancelled, all requests in the pool are cancelled.
+        See :py:meth:`Request.as_future()` for details.
+        """
+        asyncio = _import_asyncio()
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        future = _new_future(loop)
+
+        requests = self._requests.copy()
+        remaining = [len(requests)]
+        remaining_lock = threading.Lock()
+        def handle_finished(result):
+            with remaining_lock:
+                remaining[0] -= 1
+                all_finished = (remaining[0] == 0)
+            if all_finished:
+                loop.call_soon_threadsafe( _set_future_result, future, None )
+        def handle_failed(exception, exc_info):
+            loop.call_soon_threadsafe( _set_future_exception, future, exception )
+        def handle_cancelled():
+            loop.call_soon_threadsafe( _cancel_future, future )
+
+        if not requests:
+            loop.call_soon_threadsafe( _set_future_result, future, None )
+        for req in requests:
+            req.notify_finished( handle_finished )
+            req.notify_failed( handle_failed )
+            req.notify_cancelled( handle_cancelled )
+
+        def handle_future_done(f):
+            if f.cancelled():
+                self.cancel()
+        future.add_done_callback( handle_future_done )
+
+        if not self._started:
+            self.submit()
+        return future
+
+    def __await__(self):
+        """
+        Python 3 only: Allows ``await pool`` from within a coroutine.  See :py:meth:`as_future()`.
+        """
+        return self.as_future().__await__()
+
 
 class RequestPool_SIMPLE(object):
     # This simplified version doesn't attempt to be efficient with RAM like the standard version (above).
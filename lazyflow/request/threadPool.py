@@ -20,14 +20,16 @@
 #		   http://ilastik.org/license/
 ###############################################################################
 # Built-in
+import os
 import atexit
 import collections
 import heapq
+import itertools
 import threading
 import platform
-import psutil
 import time
-import os
+
+import psutil
 
 
 # This module's code needs to be sanitized if you're not using CPython.
@@ -45,10 +47,23 @@ class PriorityQueue(object):
     def push(self, item):
         with self._lock:
             heapq.heappush(self._heap, item)
+
+    def push_many(self, items):
+        with self._lock:
+            for item in items:
+                heapq.heappush(self._heap, item)
     
     def pop(self):
         with self._lock:
             return heapq.heappop(self._heap)
+
+    def peek(self):
+        """
+        Return (but don't remove) the item that would be popped next.
+        Raises IndexError if the queue is empty.
+        """
+        with self._lock:
+            return self._heap[0]
     
     def __len__(self):
         return len(self._heap)
@@ -62,9 +77,15 @@ class FifoQueue(object):
 
     def push(self, item):
         self._deque.append(item)
+
+    def push_many(self, items):
+        self._deque.extend(items)
     
     def pop(self):
         return self._deque.popleft()
+
+    def peek(self):
+        return self._deque[0]
     
     def __len__(self):
         return len(self._deque)
@@ -78,72 +99,20 @@ class LifoQueue(object):
 
     def push(self, item):
         self._deque.append(item)
+
+    def push_many(self, items):
+        self._deque.extend(items)
     
     def pop(self):
         return self._deque.pop()
+
+    def peek(self):
+        return self._deque[-1]
     
     def __len__(self):
         return len(self._deque)
 
 
-class MemoryWatcher(threading.Thread):
-    """
-    Background thread for checking memory usage
-    """
-    
-    def __init__(self, thread_pool):
-        threading.Thread.__init__(self)
-        self.process = psutil.Process(os.getpid())
-        self.usage = self.process.memory_percent()
-        self.tasks = FifoQueue()
-        self.thread_pool = thread_pool
-        self.threshold = 85 # threshold at which to 
-        self.threshold_reached = False
-        self.stopped = False
-        self.daemon = True
-        
-    def run(self):
-        """
-        Computes memory usage every 0.1 second.
-        Flushes queued tasks, if memory usage is below a threshold.
-        """
-        while self.stopped is False:
-            self.usage = self.process.memory_percent()
-            if self.usage < self.threshold:
-                self.flush()
-            time.sleep(0.1)
-            
-    def filter(self, task):
-        """
-        See if a task needs to be queued due to high memory usages.
-        """
-        if self.usage > self.threshold and len(task._priority) == 1:
-            if self.threshold_reached is False:
-                print "MemoryWatcher: memory usage above %f%% filtering task." % (self.threshold,)
-                self.threshold_reached = True
-            self.tasks.push(task)
-            raise IndexError
-        return task
-            
-    def flush(self):
-        """
-        Flush all queued tasks back to the threadpool.
-        """
-        if len(self.tasks) > 0:
-            if self.threshold_reached is True:
-                print "MemoryWatcher: memory usage below %f%%. Flushing queued tasks ..." % (self.threshold,)
-                self.threshold_reached = False
-                
-        while len(self.tasks) > 0:
-            task = self.tasks.pop()
-            self.thread_pool.wake_up(task)
-            
-    def stop(self):
-        """
-        stop the MemoryWatcher
-        """
-        self.stopped = True
-   
 class ThreadPool(object):
     """
     Manages a set of worker threads and dispatches tasks to them.
@@ -153,19 +122,43 @@ class ThreadPool(object):
     #_DefaultQueueType = LifoQueue
     _DefaultQueueType = PriorityQueue
     
-    def __init__(self, num_workers, queue_type=_DefaultQueueType):
+    def __init__(self, num_workers, queue_type=_DefaultQueueType, work_stealing=False, memory_budget=None):
         """
         Constructor.  Starts all workers.
         
         :param num_workers: The number of worker threads to create.
         :param queue_type: The type of queue to use for prioritizing tasks.  Possible queue types include :py:class:`PriorityQueue`,
-                           :py:class:`FifoQueue`, and :py:class:`LifoQueue`, or any class with ``push()``, ``pop()``, and ``__len__()`` methods.
+                           :py:class:`FifoQueue`, and :py:class:`LifoQueue`, or any class with ``push()``, ``push_many()``, ``pop()``, ``peek()`` and ``__len__()`` methods.
+        :param work_stealing: If True, each worker keeps its own queue of unassigned tasks.
+                              Tasks that are woken up from within a worker thread (e.g. child requests) 
+                              are pushed onto that worker's queue, and idle workers steal tasks from the 
+                              other workers' queues.  Only a single idle worker is notified for each new task.
+        :param memory_budget: If not None, the maximum number of bytes that may be "in flight" at once.
+                              See :py:meth:`set_memory_budget()` for details.
         """
         self.job_condition = threading.Condition()
         self.unassigned_tasks = queue_type()
-        #self.memory = MemoryWatcher(self)
-        #self.memory.start()
         self.num_workers = num_workers
+        self.work_stealing = work_stealing
+        self._prioritized = issubclass(queue_type, PriorityQueue)
+
+        # Workers that are currently waiting for work.
+        # (Workers add/remove themselves; see _Worker._get_next_job)
+        self._idle_workers = set()
+
+        # Admission control state.  (See set_memory_budget)
+        self.memory_budget = memory_budget
+        self._budget_lock = threading.Lock()
+        self._in_flight_bytes = 0
+        self._admitted_tasks = {}
+        self._pending_admission = queue_type()
+
+        # The set of workers is replaced (never modified in place) when the pool is resized,
+        #  so other threads can safely iterate over it.
+        self._queue_type = queue_type
+        self._workers_lock = threading.Lock()
+        self._worker_counter = itertools.count()
+        self._auto_tuner = None
         self.workers = self._start_workers( num_workers, queue_type )
 
         # ThreadPools automatically stop upon program exit
@@ -179,35 +172,237 @@ class ThreadPool(object):
         # Once a task has been assigned, it must always be processed in the same worker
         if hasattr(task, 'assigned_worker') and task.assigned_worker is not None:
             task.assigned_worker.wake_up( task )
+        elif self.memory_budget is None or self._admit(task):
+            self._schedule(task)
+
+    def wake_up_many(self, tasks):
+        """
+        Equivalent to calling :py:meth:`wake_up()` for each of the given tasks, but cheaper for large batches:
+        New tasks are pushed onto the queue all at once, and only as many idle workers 
+        are notified as there are new tasks (instead of notifying all workers for each task).
+        """
+        new_tasks = []
+        for task in tasks:
+            if getattr(task, 'assigned_worker', None) is not None:
+                task.assigned_worker.wake_up( task )
+            elif self.memory_budget is None or self._admit(task):
+                new_tasks.append( task )
+        if new_tasks:
+            self._schedule_many( new_tasks )
+
+    def _schedule_many(self, tasks):
+        """
+        Queue several new (unassigned) tasks at once, and wake up enough idle workers to start them.
+        """
+        current_worker = self._current_worker() if self.work_stealing else None
+        if current_worker is not None and not current_worker.retiring:
+            current_worker.local_tasks.push_many( tasks )
+        else:
+            self.unassigned_tasks.push_many( tasks )
+
+        # Busy workers check the queues before they go to sleep, so only idle workers need to be notified.
+        for _ in range( len(tasks) ):
+            if not self._idle_workers:
+                break
+            self._notify_idle_worker()
+
+    def _schedule(self, task):
+        """
+        Queue a new (unassigned) task so that it will be picked up by the next available worker.
+        """
+        if self.work_stealing:
+            # Tasks spawned from within one of our workers stay local to that worker (until someone steals them).
+            # Tasks from foreign threads (or retiring workers) go into the shared queue.
+            current_worker = self._current_worker()
+            if current_worker is not None and not current_worker.retiring:
+                current_worker.local_tasks.push(task)
+            else:
+                self.unassigned_tasks.push(task)
+            # Notify just one waiting worker that there's new work
+            self._notify_idle_worker()
         else:
             self.unassigned_tasks.push(task)
             # Notify all currently waiting workers that there's new work
             self._notify_all_workers()
 
+    def tasks_waiting(self):
+        """
+        Return the number of tasks that are waiting to be started by any worker:
+        the unassigned tasks, plus (in work-stealing mode) the tasks in the workers' local queues.
+        """
+        num_tasks = len(self.unassigned_tasks)
+        if self.work_stealing:
+            num_tasks += sum( len(w.local_tasks) for w in self.workers )
+        return num_tasks
+
+    def has_more_urgent_work(self, priority_class):
+        """
+        Return True if an unassigned task of a more urgent priority class 
+        (i.e. a lower ``priority_class`` value) than the given one is waiting to be started.
+        Tasks without a ``priority_class`` attribute are never considered more urgent.
+        Always False if the pool doesn't use a :py:class:`PriorityQueue`.
+        """
+        if not self._prioritized or len(self.unassigned_tasks) == 0:
+            return False
+        try:
+            task = self.unassigned_tasks.peek()
+        except IndexError:
+            return False
+        return getattr(task, 'priority_class', priority_class) < priority_class
+
+    def set_memory_budget(self, memory_budget):
+        """
+        Limit the total estimated RAM usage of the tasks that are executing at once.
+
+        Tasks may declare their expected cost in bytes via an ``estimated_bytes`` attribute.
+        A new task with a nonzero cost is only started if its cost fits into the budget
+        (along with the cost of all other admitted tasks), or if no other costly task is in flight.
+        Otherwise, it is held back until enough admitted tasks have called :py:meth:`release_budget()`.
+        Tasks without a cost are never held back.
+
+        :param memory_budget: The budget in bytes, or None to disable admission control.
+                              (Tasks that are currently held back are started immediately.)
+        """
+        with self._budget_lock:
+            self.memory_budget = memory_budget
+            admitted = self._admit_pending_tasks()
+        for task in admitted:
+            self._schedule(task)
+
+    def release_budget(self, task):
+        """
+        Must be called when a task is complete, to return its share of the memory budget.
+        Any tasks that were held back and now fit into the budget are started.
+        Has no effect if the task was never charged against the budget.
+        """
+        with self._budget_lock:
+            cost = self._admitted_tasks.pop(task, None)
+            if cost is None:
+                return
+            self._in_flight_bytes -= cost
+            admitted = self._admit_pending_tasks()
+        for task in admitted:
+            self._schedule(task)
+
+    def _admit(self, task):
+        """
+        Charge the given task against the memory budget.
+        Return True if it may start now, or False if it was queued until more budget is available.
+        """
+        cost = getattr(task, 'estimated_bytes', 0)
+        if not cost:
+            return True
+        with self._budget_lock:
+            # Tasks that were held back go first, unless nothing is in flight at all.
+            if self._admitted_tasks and \
+               ( len(self._pending_admission) > 0 or self._in_flight_bytes + cost > self.memory_budget ):
+                self._pending_admission.push(task)
+                return False
+            self._admitted_tasks[task] = cost
+            self._in_flight_bytes += cost
+            return True
+
+    def _admit_pending_tasks(self):
+        """
+        Admit as many held-back tasks as will fit into the budget and return them.
+        Must be called with self._budget_lock held.  The caller must schedule the returned tasks.
+        """
+        admitted = []
+        while len(self._pending_admission) > 0:
+            task = self._pending_admission.peek()
+            cost = task.estimated_bytes
+            if self.memory_budget is not None and self._admitted_tasks \
+               and self._in_flight_bytes + cost > self.memory_budget:
+                break
+            self._pending_admission.pop()
+            self._admitted_tasks[task] = cost
+            self._in_flight_bytes += cost
+            admitted.append(task)
+        return admitted
+
+    def resize(self, num_workers):
+        """
+        Change the number of worker threads.  Can be called at any time.  No tasks are dropped.
+        
+        New workers start picking up tasks immediately.  Workers that are removed stop accepting 
+        new tasks, but keep running until the tasks that are already assigned to them have completed.
+        (A suspended request can only be resumed by the worker it was started on.)
+        """
+        assert num_workers > 0, "A ThreadPool needs at least one worker."
+        with self._workers_lock:
+            active_workers = [w for w in self.workers if not w.retiring]
+            if num_workers > len(active_workers):
+                new_workers = set()
+                for _ in range(num_workers - len(active_workers)):
+                    new_workers.add( _Worker(self, self._worker_counter.next(), queue_type=self._queue_type) )
+                self.workers = self.workers | new_workers
+                for w in new_workers:
+                    w.start()
+            else:
+                retiring_workers = active_workers[num_workers:]
+                for w in retiring_workers:
+                    w.retire()
+            self.num_workers = num_workers
+
+    def enable_auto_tuning(self, min_workers, max_workers, interval=1.0):
+        """
+        Start a background thread that adjusts the number of workers (within the given bounds) 
+        according to how busy the CPU is.  See :py:class:`ThreadPoolAutoTuner`.
+        """
+        self.disable_auto_tuning()
+        self._auto_tuner = ThreadPoolAutoTuner(self, min_workers, max_workers, interval)
+        self._auto_tuner.start()
+
+    def disable_auto_tuning(self):
+        if self._auto_tuner is not None:
+            self._auto_tuner.stop()
+            self._auto_tuner = None
+
     def stop(self):
         """
         Stop all threads in the pool, and block for them to complete.
         Postcondition: All worker threads have stopped.  Unfinished tasks are simply dropped.
         """
-        #self.memory.stop()
-        
-        for w in self.workers:
+        self.disable_auto_tuning()
+
+        workers = self.workers
+        for w in workers:
             w.stop()
         
-        for w in self.workers:
+        for w in workers:
             w.join()
     
+    def _remove_worker(self, worker):
+        """
+        Called by a retired worker just before its thread exits.
+        """
+        with self._workers_lock:
+            self.workers = self.workers - set([worker])
+
     def _start_workers(self, num_workers, queue_type):
         """
         Start a set of workers and return the set.
         """
         workers = set()
-        for i in range(num_workers):
-            w = _Worker(self, i, queue_type=queue_type)
+        for _ in range(num_workers):
+            w = _Worker(self, self._worker_counter.next(), queue_type=queue_type)
             workers.add( w )
+
+        # In work-stealing mode, the workers need to see each other as soon as they start.
+        self.workers = workers
+        for w in workers:
             w.start()
         return workers
 
+    def _current_worker(self):
+        """
+        Return the worker of this pool that is executing the calling code, or None if called from any other thread.
+        """
+        current_thread = threading.current_thread()
+        if isinstance(current_thread, _Worker) and current_thread.thread_pool is self:
+            return current_thread
+        return None
+
     def _notify_all_workers(self):
         """
         Wake up all worker threads that are currently waiting for work.
@@ -216,6 +411,18 @@ class ThreadPool(object):
             with worker.job_queue_condition:
                 worker.job_queue_condition.notify()
 
+    def _notify_idle_worker(self):
+        """
+        Wake up one worker thread that is currently waiting for work, if there is one.
+        If all workers are busy, do nothing: each worker checks all queues before it goes to sleep.
+        """
+        try:
+            worker = self._idle_workers.pop()
+        except KeyError:
+            return
+        with worker.job_queue_condition:
+            worker.job_queue_condition.notify()
+
     def _wait_for_idle(self):
         """
         Useful for testing only.
@@ -223,19 +430,19 @@ class ThreadPool(object):
         """
         done = False
         while not done:
-            while self.unassigned_tasks:
+            while self.unassigned_tasks or self._pending_admission:
                 time.sleep(0.1)
             
             for worker in self.workers:
-                while worker.job_queue:
+                while worker.job_queue or worker.local_tasks:
                     time.sleep(0.1)
             
             # Second pass: did any of those completing tasks launch new tasks?
             done = True
             for worker in self.workers:
-                if len(worker.job_queue) > 0:
+                if len(worker.job_queue) > 0 or len(worker.local_tasks) > 0:
                     done = False
-            if self.unassigned_tasks:
+            if self.unassigned_tasks or self._pending_admission:
                 done = False
                     
 
@@ -253,25 +460,76 @@ class _Worker(threading.Thread):
         self.stopped = False
         self.job_queue_condition = threading.Condition()
         self.job_queue = queue_type()
+
+        # Unassigned tasks that were spawned from this worker (work-stealing mode only)
+        self.local_tasks = queue_type()
+
+        # A retiring worker doesn't accept new tasks, and exits as soon as its assigned tasks are complete.
+        self.retiring = False
+
+        # The greenlets of the (unfinished) tasks that were assigned to this worker.
+        # Tasks without a greenlet (e.g. plain functions) finish in a single call, so they aren't listed.
+        self._pinned_greenlets = set()
+
+        # True while a task is executing (used by the ThreadPoolAutoTuner).
+        self.busy = False
         
     def run(self):
         """
-        Keep executing available tasks until we're stopped.
+        Keep executing available tasks until we're stopped (or retired).
         """
         # Try to get some work.
         next_task = self._get_next_job()
 
-        while not self.stopped:
+        while not self.stopped and next_task is not None:
             # Start (or resume) the work by switching to its greenlet
+            task_greenlet = getattr(next_task, 'greenlet', None)
+            self.busy = True
             next_task()
+            self.busy = False
+            if task_greenlet is not None and task_greenlet.dead:
+                self._pinned_greenlets.discard(task_greenlet)
 
             # We're done with this request.
             # Free it immediately for garbage collection.
             next_task = None
+            task_greenlet = None
 
             # Now try to get some work (wait if necessary).
             next_task = self._get_next_job()
 
+        if not self.stopped:
+            # We've been retired.
+            self.thread_pool._remove_worker(self)
+
+            # Hand over any tasks that were queued locally (work-stealing mode), so they aren't lost.
+            # They were already admitted against the memory budget, so they are re-queued directly.
+            orphaned_tasks = []
+            while len(self.local_tasks) > 0:
+                try:
+                    orphaned_tasks.append( self.local_tasks.pop() )
+                except IndexError:
+                    break
+            if orphaned_tasks:
+                self.thread_pool._schedule_many( orphaned_tasks )
+
+    def retire(self):
+        """
+        Tell this worker to stop accepting new tasks, and to exit once its assigned tasks are complete.
+        Does not block for thread completion.
+        """
+        self.retiring = True
+        self.thread_pool._idle_workers.discard(self)
+        # Wake up the thread if it's waiting for work, so it can exit if it has nothing left to do.
+        with self.job_queue_condition:
+            self.job_queue_condition.notify()
+
+    def _retired(self):
+        """
+        Return True if this worker is retiring and all of its assigned tasks are complete.
+        """
+        return self.retiring and len(self._pinned_greenlets) == 0 and len(self.job_queue) == 0
+
     def stop(self):
         """
         Tell this worker to stop running.
@@ -303,13 +561,25 @@ class _Worker(threading.Thread):
         with self.job_queue_condition:
             next_task = self._pop_job()
 
-            while next_task is None and not self.stopped:
-                # Wait for work to become available
-                self.job_queue_condition.wait()
+            while next_task is None and not self.stopped and not self._retired():
+                # Announce that we're idle BEFORE checking the queues one last time,
+                #  so a task that is pushed in the meantime can't be missed.
+                # (Retiring workers don't want new tasks, so they don't announce themselves.)
+                if not self.retiring:
+                    self.thread_pool._idle_workers.add(self)
                 next_task = self._pop_job()
+                if next_task is None:
+                    # Wait for work to become available
+                    self.job_queue_condition.wait()
+                    next_task = self._pop_job()
+            self.thread_pool._idle_workers.discard(self)
 
-        if not self.stopped:
-            assert next_task is not None
+        if next_task is None and self.retiring and len(self.thread_pool.unassigned_tasks) > 0:
+            # We might have been notified about a new task just before we retired.
+            # Make sure someone else picks it up.
+            self.thread_pool._notify_idle_worker()
+
+        if not self.stopped and next_task is not None:
             assert next_task.assigned_worker is self
 
         return next_task
@@ -318,21 +588,140 @@ class _Worker(threading.Thread):
         """
         Non-blocking.
         If possible, get a job from our own job queue.
-        Otherwise, get one from the global job queue.
+        Otherwise, get one from the global job queue 
+        (or, in work-stealing mode, from our local queue or another worker's local queue).
         Return None if neither queue has work to do.
         """
-        # Try our own queue first
+        # Try our own queue first, unless there's unassigned work of a more urgent priority class.
+        if self.retiring:
+            # Retiring workers only finish the tasks they already have.
+            if len(self.job_queue) > 0:
+                return self.job_queue.pop()
+            return None
+
         if len(self.job_queue) > 0:
-            return self.job_queue.pop()
+            try:
+                own_class = getattr( self.job_queue.peek(), 'priority_class', None )
+            except IndexError:
+                own_class = None
+            if own_class is None or not self.thread_pool.has_more_urgent_work( own_class ):
+                return self.job_queue.pop()
 
         # Otherwise, try to claim a job from the global unassigned list            
         try:
-            #task = self.thread_pool.memory.filter(self.thread_pool.unassigned_tasks.pop())
-            task = self.thread_pool.unassigned_tasks.pop()
+            if self.thread_pool.work_stealing:
+                task = self._pop_unassigned_job()
+            else:
+                task = self.thread_pool.unassigned_tasks.pop()
         except IndexError:
+            # Someone else claimed the urgent task first.  Fall back to our own queue.
+            if len(self.job_queue) > 0:
+                return self.job_queue.pop()
             return None
         else:
             task.assigned_worker = self # If this fails, then your callable is some built-in that doesn't allow arbitrary  
                                         #  members (e.g. .assigned_worker) to be "monkey-patched" onto it.  You may have to wrap it in a custom class first.
+            task_greenlet = getattr(task, 'greenlet', None)
+            if task_greenlet is not None:
+                self._pinned_greenlets.add(task_greenlet)
             return task
+
+    def _pop_unassigned_job(self):
+        """
+        Work-stealing mode only.
+        Pop the next unassigned task from our local queue or the shared queue.
+        If both are empty, steal a task from another worker.
+        If the pool uses a PriorityQueue, the highest-priority task among the candidate queues is chosen.
+        Raises IndexError if there's no work anywhere.
+        """
+        queue = self._choose_queue( (self.local_tasks, self.thread_pool.unassigned_tasks) )
+        if queue is None:
+            others = [w.local_tasks for w in self.thread_pool.workers if w is not self]
+            queue = self._choose_queue( others )
+        if queue is None:
+            raise IndexError("No unassigned tasks.")
+        return queue.pop()
+
+    def _choose_queue(self, queues):
+        """
+        Return the non-empty queue whose next task has the best priority, or None if all queues are empty.
+        (For non-prioritized queue types, simply return the first non-empty queue.)
+        """
+        best_queue = None
+        best_task = None
+        for queue in queues:
+            if len(queue) == 0:
+                continue
+            if not self.thread_pool._prioritized:
+                return queue
+            try:
+                task = queue.peek()
+            except IndexError:
+                # Someone else emptied it in the meantime.
+                continue
+            if best_queue is None or task < best_task:
+                best_queue = queue
+                best_task = task
+        return best_queue
+
+class ThreadPoolAutoTuner(threading.Thread):
+    """
+    Background thread that periodically adjusts the size of a ThreadPool:
+
+    - If a significant share of the busy workers isn't using the CPU (e.g. they are blocked in 
+      file or network I/O) and tasks are waiting to be started, a worker is added.
+    - If the CPU is saturated, a worker is removed.
+
+    The number of workers always stays within ``[min_workers, max_workers]``.
+    """
     
+    def __init__(self, thread_pool, min_workers, max_workers, interval=1.0, 
+                 blocked_fraction=0.5, saturated_fraction=0.95):
+        """
+        :param interval: Seconds between adjustments
+        :param blocked_fraction: Add a worker if at least this fraction of the busy workers isn't using a CPU core.
+        :param saturated_fraction: Remove a worker if the process uses at least this fraction of all CPU cores.
+        """
+        threading.Thread.__init__(self, name="ThreadPoolAutoTuner")
+        assert 0 < min_workers <= max_workers
+        self.daemon = True
+        self.thread_pool = thread_pool
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.interval = interval
+        self.blocked_fraction = blocked_fraction
+        self.saturated_fraction = saturated_fraction
+        self.process = psutil.Process(os.getpid())
+        self.num_cores = psutil.cpu_count()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        self.process.cpu_percent(None) # The first call just initializes the measurement.
+        while not self._stop_event.wait(self.interval):
+            self.adjust( self.process.cpu_percent(None) / 100.0 )
+
+    def adjust(self, cores_used):
+        """
+        Resize the pool according to the current CPU usage (measured in cores, e.g. 2.5).
+        """
+        pool = self.thread_pool
+        busy_workers = sum( 1 for w in pool.workers if w.busy and not w.retiring )
+        num_workers = pool.num_workers
+        tasks_waiting = pool.tasks_waiting() > 0
+
+        if cores_used >= self.saturated_fraction * self.num_cores:
+            if num_workers > self.min_workers:
+                pool.resize( num_workers - 1 )
+        elif busy_workers > 0 and tasks_waiting \
+             and (busy_workers - cores_used) >= self.blocked_fraction * busy_workers:
+            if num_workers < self.max_workers:
+                pool.resize( num_workers + 1 )
+
+        # Stay within the bounds, even if someone else resized the pool.
+        if pool.num_workers < self.min_workers:
+            pool.resize( self.min_workers )
+        elif pool.num_workers > self.max_workers:
+            pool.resize( self.max_workers )
+
+    def stop(self):
+        self._stop_event.set()
@@ -19,6 +19,7 @@
 # This information is also available on the ilastik web site at:
 #		   http://ilastik.org/license/
 ###############################################################################
+from __future__ import absolute_import
 if __name__ == "__main__":
     # When executing this file directly for doctest purposes,
     #  we must remove the lazyflow module from sys.path
@@ -32,150 +33,88 @@ if __name__ == "__main__":
 import numpy
 from numpy.lib.stride_tricks import as_strided as ast
 from math import ceil, floor, pow, log10
+from itertools import imap, product
+import operator # This is the Python standard operator module, not lazyflow.operator!
 import collections
 
+def _elementwise(op):
+    """
+    Return a binary method that applies op to each element of self and the 
+    corresponding element of other (or to each element of self and other, 
+    if other is a scalar).  As with zip(), the result is truncated to the 
+    shorter operand.
+    """
+    def method(self, other):
+        if not hasattr(other, '__iter__'):
+            return self.__class__( map(op, self, [other]*len(self)) )
+        try:
+            if len(other) == len(self):
+                # map() is faster than imap() here, but pads unequal operands with None.
+                return self.__class__( map(op, self, other) )
+        except TypeError:
+            pass
+        return self.__class__( imap(op, self, other) )
+    return method
+
+def _reflected(op):
+    """
+    Like _elementwise(), but for the reflected operators (e.g. __rsub__),
+    where self is the right-hand operand.
+    """
+    def method(self, other):
+        if not hasattr(other, '__iter__'):
+            return self.__class__( map(op, [other]*len(self), self) )
+        try:
+            if len(other) == len(self):
+                return self.__class__( map(op, other, self) )
+        except TypeError:
+            pass
+        return self.__class__( imap(op, other, self) )
+    return method
+
 class TinyVector(list):
+    """
+    A short, mutable list of numbers with element-wise arithmetic and comparison operators.
+    Used for the start/stop coordinates of SubRegion rois.
+    """
     __slots__ = []
 
     def copy(self):
         return TinyVector(self)
 
-    def __add__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(x+y for x,y in zip(self,other))
-        else:
-            return TinyVector(x+other for x in self)
-
-    __radd__ = __add__
-
-    def __iadd__(self, other):
-        # Must explicitly override list.__iadd__
-        # Others (e.g. isub, imul) can use default implementation.
-        if isinstance(other, collections.Iterable):
-            self =  TinyVector(x+y for x,y in zip(self,other))
-            return self
-        else:
-            self = TinyVector(x+other for x in self)
-            return self
-
-    def __sub__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(x-y for x,y in zip(self,other))
-        else:
-            return TinyVector(x-other for x in self)
-
-    def __rsub__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(y-x for x,y in zip(self,other))
-        else:
-            return TinyVector(other-x for x in self)
-
-    def __mul__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(x*y for x,y in zip(self,other))
-        else:
-            return TinyVector(x*other for x in self)
+    __add__ = __radd__ = _elementwise(operator.add)
 
-    __rmul__ = __mul__
+    # Must explicitly override list.__iadd__
+    # Others (e.g. isub, imul) can use default implementation.
+    __iadd__ = __add__
 
-    def __div__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(x/y for x,y in zip(self,other))
-        else:
-            return TinyVector(x/other for x in self)
+    __sub__ = _elementwise(operator.sub)
+    __rsub__ = _reflected(operator.sub)
 
-    def __rdiv__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(y/x for x,y in zip(self,other))
-        else:
-            return TinyVector(other/x for x in self)
+    __mul__ = __rmul__ = _elementwise(operator.mul)
 
-    def __mod__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(x%y for x,y in zip(self,other))
-        else:
-            return TinyVector(x%other for x in self)
+    __div__ = _elementwise(operator.div)
+    __rdiv__ = _reflected(operator.div)
 
-    def __rmod__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(y%x for x,y in zip(self,other))
-        else:
-            return TinyVector(other%x for x in self)
+    __mod__ = _elementwise(operator.mod)
+    __rmod__ = _reflected(operator.mod)
 
-    def __floordiv__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(x//y for x,y in zip(self,other))
-        else:
-            return TinyVector(x//other for x in self)
+    __floordiv__ = _elementwise(operator.floordiv)
+    __rfloordiv__ = _reflected(operator.floordiv)
 
-    def __rfloordiv__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(y//x for x,y in zip(self,other))
-        else:
-            return TinyVector(other//x for x in self)
+    __eq__ = _elementwise(operator.eq)
+    __ne__ = _elementwise(operator.ne)
+    __ge__ = _elementwise(operator.ge)
+    __le__ = _elementwise(operator.le)
+    __gt__ = _elementwise(operator.gt)
+    __lt__ = _elementwise(operator.lt)
 
-    def __eq__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(x==y for x,y in zip(self,other))
-        else:
-            return TinyVector(x==other for x in self)
-
-    def __ne__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(x!=y for x,y in zip(self,other))
-        else:
-            return TinyVector(x!=other for x in self)
-
-    def __ge__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(x>=y for x,y in zip(self,other))
-        else:
-            return TinyVector(x>=other for x in self)
-
-    def __le__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(x<=y for x,y in zip(self,other))
-        else:
-            return TinyVector(x<=other for x in self)
+    __and__ = __rand__ = _elementwise(operator.and_)
+    __or__ = __ror__ = _elementwise(operator.or_)
+    __xor__ = __rxor__ = _elementwise(operator.xor)
 
-    def __gt__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(x>y for x,y in zip(self,other))
-        else:
-            return TinyVector(x>other for x in self)
-
-    def __lt__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(x<y for x,y in zip(self,other))
-        else:
-            return TinyVector(x<other for x in self)
-
-    def __and__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(x&y for x,y in zip(self,other))
-        else:
-            return TinyVector(x&other for x in self)
-
-    __rand__ = __and__
-
-    def __or__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(x|y for x,y in zip(self,other))
-        else:
-            return TinyVector(x|other for x in self)
-
-    __ror__ = __or__
-
-    def __xor__(self, other):
-        if isinstance(other, collections.Iterable):
-            return TinyVector(x^y for x,y in zip(self,other))
-        else:
-            return TinyVector(x ^ other for x in self)
-
-    __rxor__ = __xor__
-    
     def __neg__(self):
-        return TinyVector( -x for x in self )
+        return TinyVector( map(operator.neg, self) )
     
     def __abs__(self):
         return TinyVector( map(abs, self) )
@@ -184,7 +123,7 @@ class TinyVector(list):
         return TinyVector(self)
     
     def __invert__(self):
-        return TinyVector(~x for x in self)
+        return TinyVector( map(operator.invert, self) )
     
     def ceil(self):
         return TinyVector(map(ceil ,self))
@@ -195,7 +134,7 @@ class TinyVector(list):
         #return numpy.floor(numpy.array(self))
 
     def _asint(self):
-        return TinyVector(map(lambda x:  x.__int__() ,self))
+        return TinyVector(map(int ,self))
 
     def insert(self,index, value):
         l = list(self)
@@ -203,20 +142,45 @@ class TinyVector(list):
         return TinyVector(l)
 
     def all(self):
-        answer = True
-        for e in self:
-            if not e:
-                answer = False
-                break
-        return answer
+        return all(self)
 
     def any(self):
-        answer = False
-        for e in self:
-            if e:
-                answer = True
-                break
-        return answer
+        return any(self)
+
+class TinyPoint(tuple):
+    """
+    Immutable counterpart of TinyVector, e.g. for block coordinates.
+    
+    Arithmetic is element-wise (like TinyVector), but comparison and 
+    hashing are inherited from tuple, so a TinyPoint can be used as a 
+    dict key and compares equal to the plain tuple with the same elements.
+
+    >>> p = TinyPoint((10, 20))
+    >>> p + (1, 2)
+    TinyPoint((11, 22))
+    >>> {(10, 20) : 'block'}[p]
+    'block'
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        return "TinyPoint({})".format( tuple.__repr__(self) )
+
+    __add__ = __radd__ = _elementwise(operator.add)
+    __sub__ = _elementwise(operator.sub)
+    __rsub__ = _reflected(operator.sub)
+    __mul__ = __rmul__ = _elementwise(operator.mul)
+    __div__ = _elementwise(operator.div)
+    __rdiv__ = _reflected(operator.div)
+    __mod__ = _elementwise(operator.mod)
+    __floordiv__ = _elementwise(operator.floordiv)
+    __rfloordiv__ = _reflected(operator.floordiv)
+
+    def __neg__(self):
+        return TinyPoint( map(operator.neg, self) )
+
+    def __abs__(self):
+        return TinyPoint( map(abs, self) )
 
 def expandSlicing(s, shape):
     """
@@ -402,12 +366,12 @@ def getIntersectingBlocks( blockshape, roi, asarray=False ):
      [  0   0]]
     """
     assert len(blockshape) == len(roi[0]) == len(roi[1]), "blockshape and roi are mismatched."
-    roistart = TinyVector( roi[0] )
-    roistop = TinyVector( roi[1] )
-    blockshape = TinyVector( blockshape )
+    roistart = numpy.asarray( roi[0] )
+    roistop = numpy.asarray( roi[1] )
+    blockshape = numpy.asarray( blockshape )
     
-    block_index_map_start = roistart / blockshape
-    block_index_map_stop = ( roistop + (blockshape - 1) ) / blockshape # Add (blockshape-1) first as a faster alternative to ceil() 
+    block_index_map_start = roistart // blockshape
+    block_index_map_stop = ( roistop + (blockshape - 1) ) // blockshape # Add (blockshape-1) first as a faster alternative to ceil() 
     block_index_map_shape = block_index_map_stop - block_index_map_start
     
     num_axes = len(blockshape)
@@ -426,6 +390,23 @@ def getIntersectingBlocks( blockshape, roi, asarray=False ):
         axiscount = block_indices.shape[-1]
         return numpy.reshape( block_indices, (num_indexes, axiscount) )
 
+def getIntersectingBlockStarts( blockshape, roi ):
+    """
+    Like getIntersectingBlocks(), but returns the block start coordinates 
+    as a list of TinyPoints (in the same order), ready for use as dict keys.
+    For the small block counts of a typical request, this is much cheaper 
+    than building the numpy array and converting each row to a tuple.
+
+    >>> getIntersectingBlockStarts( (10, 20), [(15, 25),(23, 41)] )
+    [TinyPoint((10, 20)), TinyPoint((10, 40)), TinyPoint((20, 20)), TinyPoint((20, 40))]
+    >>> getIntersectingBlockStarts( (10, 20), [(-10, -5),(5, 5)] )
+    [TinyPoint((-10, -20)), TinyPoint((-10, 0)), TinyPoint((0, -20)), TinyPoint((0, 0))]
+    """
+    assert len(blockshape) == len(roi[0]) == len(roi[1]), "blockshape and roi are mismatched."
+    axis_starts = [ xrange( (int(start) // b) * b, int(stop), b )
+                    for b, start, stop in zip( map(int, blockshape), roi[0], roi[1] ) ]
+    return map( TinyPoint, product( *axis_starts ) )
+
 def getBlockBounds(dataset_shape, block_shape, block_start):
     """
     Given a block start coordinate and block shape, return a roi for 
@@ -21,6 +21,7 @@
 ###############################################################################
 #Python
 import sys
+import time
 import logging
 import itertools
 import threading
@@ -35,7 +36,7 @@ import vigra
 #lazyflow
 from lazyflow import rtype
 from lazyflow.roi import TinyVector
-from lazyflow.request import Request
+from lazyflow.request import Request, WaitTimer
 from lazyflow.stype import ArrayLike
 from lazyflow.metaDict import MetaDict
 from lazyflow.utility import slicingtools, OrderedSignal
@@ -69,6 +70,97 @@ class ValueRequest(object):
         destination[:] = self.result
         return self
 
+class InFlightRequests(object):
+    """
+    Registry of the requests that are currently executing for a particular OutputSlot.
+    Used to coalesce requests for the same data.  See :py:meth:`OutputSlot.enableRequestCoalescing()`.
+
+    Only requests that allocate their own result (i.e. no ``writeInto()`` destination) are registered,
+    because a caller-provided destination may be overwritten by its owner as soon as the request completes.
+    """
+    class Entry(object):
+        def __init__(self, request, roi):
+            self.request = request
+            self.start = tuple(roi.start)
+            self.stop = tuple(roi.stop)
+            # Set by the executing request when it completes successfully.
+            # (We can't rely on request.result, since the owner might clean() the request.)
+            self.result = None
+
+        def contains(self, start, stop):
+            return len(self.start) == len(start) \
+               and all( a <= b for a, b in zip(self.start, start) ) \
+               and all( a <= b for a, b in zip(stop, self.stop) )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = set()
+
+    def add(self, request, roi):
+        entry = InFlightRequests.Entry(request, roi)
+        with self._lock:
+            self._entries.add(entry)
+        return entry
+
+    def remove(self, entry):
+        with self._lock:
+            self._entries.discard(entry)
+
+    def find(self, roi):
+        """
+        Return the entry of a registered request whose roi contains the given roi, or None.
+        Requests that the current request (or one of its ancestors) is executing are never returned, 
+        since waiting for them would deadlock.
+        """
+        start = tuple(roi.start)
+        stop = tuple(roi.stop)
+        with self._lock:
+            candidates = [ entry for entry in self._entries if entry.contains(start, stop) ]
+        if not candidates:
+            return None
+
+        ancestors = set()
+        current_request = Request._current_request()
+        while current_request is not None:
+            ancestors.add(current_request)
+            current_request = current_request.parent_request
+
+        for entry in candidates:
+            if entry.request not in ancestors:
+                return entry
+        return None
+
+class CoalescedRequestWrapper(object):
+    """
+    The workload of a request that was coalesced with a running request for a larger (or equal) roi.
+    Waits for the running request and copies the relevant part of its result.
+    If the running request was cancelled in the meantime, the data is computed from scratch after all.
+    """
+    def __init__(self, slot, roi, in_flight_entry):
+        self.slot = slot
+        self.roi = roi
+        self.entry = in_flight_entry
+
+    def __call__(self, destination=None):
+        try:
+            self.entry.request.block()
+        except Request.InvalidRequestException:
+            # The original request was cancelled before we could attach to it.
+            pass
+
+        original_result = self.entry.result
+        if original_result is None:
+            # No result to share after all.  Compute it ourselves.
+            return Slot.RequestExecutionWrapper(self.slot, self.roi)(destination)
+
+        key = tuple( slice(start - offset, stop - offset)
+                     for start, stop, offset in zip(self.roi.start, self.roi.stop, self.entry.start) )
+        if destination is None:
+            # Always copy: the original requester owns the original result and may modify it.
+            return original_result[key].copy()
+        destination[...] = original_result[key]
+        return destination
+
 def is_setup_fn(func):
     """
     Decorator.  Marks the function as a 'setup' function, 
@@ -103,6 +195,11 @@ class Slot(object):
     # output and diagramming purposes.
     _global_counter = itertools.count()
 
+    # Changed (to a new, unique value) whenever any slot's partner changes.
+    # Slots cache the result of _upstreamSource() until it changes.
+    _topology_counter = itertools.count()
+    _topology_version = _topology_counter.next()
+
 
     class SlotNotReadyError(Exception):
         pass
@@ -162,6 +259,9 @@ class Slot(object):
         self.partner = None
         self.level = level
 
+        # (Slot._topology_version, source slot) as of the last call to _upstreamSource()
+        self._upstream_source = (None, None)
+
         # in the case of an InputSlot one can directly assign a value
         # to a slot instead of connecting it to a partner, this
         # attribute holds the value
@@ -205,6 +305,9 @@ class Slot(object):
         self._settingUp = False
         self._condition = threading.Condition()
 
+        # Requests currently executing for this slot (only if request coalescing is enabled)
+        self._inFlightRequests = None
+
         # Allow slots to be sorted by their order of creation for
         # debug output and diagramming purposes.
         self._global_slot_id = Slot._global_counter.next()
@@ -448,6 +551,7 @@ class Slot(object):
                         "Can't connect slots of non-matching stypes!" \
                         " Attempting to connect '{}' (stype: {}) to '{}' (stype: {})".format(self.name, self.stype, partner.name, partner.stype)
                     self.partner = partner
+                    Slot._topology_version = Slot._topology_counter.next()
                     notifyReady = (self.partner.meta._ready and
                                    not self.meta._ready)
                     self.meta = self.partner.meta.copy()
@@ -479,6 +583,7 @@ class Slot(object):
     
                 elif partner.level < self.level:
                     self.partner = partner
+                    Slot._topology_version = Slot._topology_counter.next()
                     notifyReady = (self.partner.meta._ready and not
                                    self.meta._ready)
                     self.meta = self.partner.meta.copy()
@@ -556,6 +661,7 @@ class Slot(object):
             except ValueError:
                 pass
         self.partner = None
+        Slot._topology_version = Slot._topology_counter.next()
         had_value = self._value is not None
         self._value = None
         oldReady = self.meta._ready
@@ -715,8 +821,8 @@ class Slot(object):
             return ValueRequest(result)
         elif self.partner is not None:
             # this handles the case of an inputslot
-            # --> just relay the request
-            return self.partner.get(roi)
+            # --> just relay the request (directly to the end of the chain of partners)
+            return self._upstreamSource().get(roi)
         else:
             if not self.ready():
                 # Something is wrong.  Are we cancelled?
@@ -741,14 +847,69 @@ class Slot(object):
                 assert self._type != "input", "This inputSlot has no value and no partner.  You can't ask for its data yet!"
             # normal (outputslot) case
             # --> construct heavy request object..
+            if self._inFlightRequests is not None and hasattr(roi, 'start'):
+                # Can we reuse the result of a request that's already executing?
+                entry = self._inFlightRequests.find(roi)
+                if entry is not None:
+                    return Request( CoalescedRequestWrapper(self, roi, entry) )
+
             execWrapper = Slot.RequestExecutionWrapper(self, roi)
             request = Request(execWrapper)
+            if self._inFlightRequests is not None and hasattr(roi, 'start'):
+                execWrapper.inFlightRequests = self._inFlightRequests
+                execWrapper.request = request
+
+            # If admission control is active, tell the ThreadPool what this request will cost.
+            if Request.global_thread_pool.memory_budget is not None \
+               and not request._within_estimated_request:
+                request.estimated_bytes = self._estimateRequestBytes(roi)
 
             # We must decrement the execution count even if the
             # request is cancelled
             request.notify_cancelled(execWrapper.handleCancel)
             return request
 
+    def _upstreamSource(self):
+        """
+        Return the slot at the upstream end of our chain of partners (i.e. the first one without a partner),
+        which is the slot that actually provides our data.
+        The result is cached until any slot in the graph is connected or disconnected.
+        """
+        version, source = self._upstream_source
+        if version != Slot._topology_version:
+            version = Slot._topology_version
+            source = self
+            while source.partner is not None:
+                source = source.partner
+            self._upstream_source = (version, source)
+        return source
+
+    def _estimateRequestBytes(self, roi):
+        """
+        Estimate the RAM needed to produce the given roi of this slot,
+        based on meta.ram_usage_per_requested_pixel if available, or the dtype otherwise.
+        Returns 0 if no estimate can be made (e.g. for non-array slots).
+        """
+        start = getattr(roi, 'start', None)
+        stop = getattr(roi, 'stop', None)
+        if start is None or stop is None or not isinstance(self.stype, ArrayLike):
+            return 0
+        roi_shape = numpy.subtract(stop, start)
+
+        ram_per_pixel = self.meta.ram_usage_per_requested_pixel
+        if ram_per_pixel is not None:
+            # ram_usage_per_requested_pixel already accounts for all channels of a pixel
+            if self.meta.axistags is not None and len(self.meta.axistags) == len(roi_shape):
+                axiskeys = self.meta.getAxisKeys()
+                if 'c' in axiskeys:
+                    roi_shape[axiskeys.index('c')] = 1
+            return int(numpy.prod(roi_shape) * ram_per_pixel)
+
+        try:
+            return int(numpy.prod(roi_shape)) * self.meta.getDtypeBytes()
+        except (TypeError, AttributeError):
+            return 0
+
     @staticmethod
     def _findUpstreamProblemSlot(slot):
         if slot.partner is not None:
@@ -768,13 +929,36 @@ class Slot(object):
             self.lock = threading.Lock()
             self.roi = roi
 
+            # Only used if request coalescing is enabled for the slot
+            self.inFlightRequests = None
+            self.request = None
+
         def __call__(self, destination=None):
             # store whether the user wants the results in a given
             # destination area
             destination_given = destination is not None
 
+            if self.inFlightRequests is not None and not destination_given:
+                # Let other requests for (parts of) the same roi reuse our result.
+                entry = self.inFlightRequests.add(self.request, self.roi)
+                try:
+                    entry.result = self._execute(destination)
+                    return entry.result
+                finally:
+                    self.inFlightRequests.remove(entry)
+            return self._execute(destination)
+
+        def _execute(self, destination):
+            destination_given = destination is not None
+            passthrough = False
+
             if destination is None:
-                destination = self.slot.stype.allocateDestination(self.roi)
+                # (For subslots, self.operator is the parent slot, which never declares passthrough outputs.)
+                if self.slot.name in getattr(self.operator, 'passthroughOutputs', ()):
+                    # The operator will hand us a view of its upstream result.  No need to allocate anything.
+                    passthrough = True
+                else:
+                    destination = self.slot.stype.allocateDestination(self.roi)
             else:
                 if self.slot.meta.dtype is not None and hasattr(destination, 'dtype'):
                     assert self.slot.meta.dtype == destination.dtype, \
@@ -789,14 +973,32 @@ class Slot(object):
             try:
                 # Execute the workload, which might not ever return
                 # (if we get cancelled).
-                result_op = self.operator.execute(self.slot, (), self.roi, destination)
+                profiler = self.operator.graph._profiler
+                if profiler is None:
+                    result_op = self.operator.execute(self.slot, (), self.roi, destination)
+                else:
+                    result_op = self._executeWithProfiling(profiler, destination)
 
                 # copy data from result_op to destination, if
                 # destination was actually given by the user, and the
                 # returned result_op is different from destination.
                 # (but don't copy if result_op is None, this means
                 # legacy op which wrote into destination anyway)
-                if destination_given and result_op is not None and id(result_op) != id(destination):
+                if passthrough:
+                    assert result_op is not None, \
+                        "Operator {} declares {} as a passthrough output, but its execute() "\
+                        "didn't return a result.".format( self.operator.name, self.slot.name )
+                    # Views of e.g. VigraArrays are returned as plain ndarrays, 
+                    #  just like the arrays from allocateDestination()
+                    if isinstance(result_op, numpy.ndarray) and type(result_op) is not numpy.ndarray:
+                        result_op = result_op.view(numpy.ndarray)
+                    # Consumers may modify their results in-place, so we must not hand out 
+                    #  views of an array that was given to one of our inputs via setValue().
+                    if self._viewsInputValue(result_op):
+                        result_op = result_op.copy()
+                    self.slot.stype.check_result_valid(self.roi, result_op)
+                    destination = result_op
+                elif destination_given and result_op is not None and id(result_op) != id(destination):
                     # check that the returned value is compatible with the requested roi
                     self.slot.stype.check_result_valid(self.roi, result_op)
 
@@ -825,6 +1027,31 @@ class Slot(object):
                 self._decrementOperatorExecutionCount()
                 raise
 
+        def _viewsInputValue(self, result):
+            """
+            Return True if the given (pass-through) result shares memory with 
+            the value of the slot at the upstream end of any of the operator's inputs.
+            """
+            if not isinstance(result, numpy.ndarray):
+                return False
+            for input_slot in self.operator.inputs.values():
+                if input_slot.level > 0:
+                    continue
+                value = input_slot._upstreamSource()._value
+                if isinstance(value, numpy.ndarray) and numpy.may_share_memory(result, value):
+                    return True
+            return False
+
+        def _executeWithProfiling(self, profiler, destination):
+            with WaitTimer() as wait_timer:
+                start = time.time()
+                result_op = self.operator.execute(self.slot, (), self.roi, destination)
+                wall_time = time.time() - start
+
+            output = destination if result_op is None else result_op
+            profiler.record( self.operator, wall_time, wait_timer.seconds, getattr(output, 'nbytes', 0) )
+            return result_op
+
         def _incrementOperatorExecutionCount(self):
             self.started = True
             assert self.operator._executionCount >= 0, \
@@ -878,6 +1105,13 @@ class Slot(object):
             else:
                 roi = args[0]
 
+            graph = self.graph
+            dirty_batch = graph and graph._dirty_batch
+            if dirty_batch is not None:
+                # Propagated later.  See Graph.batch_dirty_notifications()
+                dirty_batch.add(self, roi)
+                return
+
             for c in self.partners:
                 c.setDirty(roi)
 
@@ -1316,6 +1550,12 @@ class Slot(object):
         if self.operator is not None:
             # check whether all slots are connected and notify operator
             if self.operator.configured():
+                graph = self.graph
+                transaction = graph and graph._configuration_transaction
+                if ( transaction is not None and not isinstance(self.operator, Slot)
+                     and transaction.defer_setup(self.operator) ):
+                    # Set up later.  See Graph.configuration_transaction()
+                    return
                 self.operator._setupOutputs()
 
     def _setupOutputs(self):
@@ -1437,6 +1677,21 @@ class OutputSlot(Slot):
         self._type = "output"
         assert 'optional' not in kwargs, '"optional" init arg cannot be used with OutputSlot'
 
+    def enableRequestCoalescing(self, enabled=True):
+        """
+        If enabled, a request for a roi that is contained in the roi of a request that
+        is already executing for this slot does not compute anything.  Instead, it waits 
+        for the executing request and copies the relevant part of its result.
+        
+        This avoids duplicate work when several clients (e.g. viewer layers and an export) 
+        request the same data at the same time, and there is no cache in between.
+        Only requests without a ``writeInto()`` destination can be reused.
+        """
+        if not enabled:
+            self._inFlightRequests = None
+        elif self._inFlightRequests is None:
+            self._inFlightRequests = InFlightRequests()
+
     def execute(self, slot, subindex, roi, result):
         """For now, OutputSlots with level > 0 must pretend to be
         operators. That's why this function is here.
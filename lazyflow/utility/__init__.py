@@ -35,4 +35,8 @@ from format_known_keys import format_known_keys
 from timer import Timer, timeLogged
 import testing
 from ramMeasurementContext import RamMeasurementContext
-from export_to_tiles import export_to_tiles
\ No newline at end of file
+from export_to_tiles import export_to_tiles
+from operatorProfiler import OperatorProfiler
+from requestTracer import RequestTracer
+from dirtyRoiBatch import DirtyRoiBatch
+from roiPlanner import planUpstreamRois, RoiPlan
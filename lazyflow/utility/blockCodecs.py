@@ -0,0 +1,168 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Codecs for storing array blocks as compressed byte strings (see :py:class:`CompressedBlock`).
+
+The built-in codecs only need the standard library, but the fastest one ('blosc', using its lz4 compressor) 
+is only available if the blosc module is installed.  Use :py:func:`getCodec` to select a codec by name.
+"""
+import zlib
+
+import numpy
+
+try:
+    import blosc
+    _blosc_available = True
+except ImportError:
+    _blosc_available = False
+
+class Codec(object):
+    """
+    Base class for codecs.  Subclasses convert a contiguous array's bytes into a 
+    compressed string (and back), and must be safe to use from several threads at once.
+    """
+    name = None
+
+    def compress(self, array):
+        """
+        Return the compressed bytes of the given C-contiguous array.
+        """
+        raise NotImplementedError
+
+    def decompress(self, buf, dtype):
+        """
+        Return the flat (1D) array of the given dtype that was compressed into buf.
+        """
+        raise NotImplementedError
+
+class NullCodec(Codec):
+    """
+    Stores the raw bytes (no compression).
+    """
+    name = 'none'
+
+    def compress(self, array):
+        return array.tostring()
+
+    def decompress(self, buf, dtype):
+        return numpy.frombuffer(buf, dtype)
+
+class ZlibCodec(Codec):
+    """
+    zlib (deflate) compression.  zlib releases the GIL, so blocks can be 
+    (de)compressed in parallel by several request threads.
+    """
+    name = 'zlib'
+
+    def __init__(self, level=1):
+        # Level 1 is several times faster than the default (6), with a slightly worse ratio.
+        self.level = level
+
+    def compress(self, array):
+        return zlib.compress(numpy.getbuffer(array), self.level)
+
+    def decompress(self, buf, dtype):
+        return numpy.frombuffer(zlib.decompress(buf), dtype)
+
+class BloscCodec(Codec):
+    """
+    Blosc compression (with the lz4 compressor by default), 
+    which is much faster than zlib for typical image data.
+    Requires the blosc module.
+    """
+    name = 'blosc'
+
+    def __init__(self, cname='lz4', clevel=5, shuffle=True):
+        assert _blosc_available, "The blosc codec requires the blosc module."
+        self.cname = cname
+        self.clevel = clevel
+        self.shuffle = shuffle
+
+    def compress(self, array):
+        return blosc.compress(array.tostring(), array.dtype.itemsize, self.clevel, self.shuffle, self.cname)
+
+    def decompress(self, buf, dtype):
+        return numpy.frombuffer(blosc.decompress(buf), dtype)
+
+_codec_types = { NullCodec.name : NullCodec,
+                 ZlibCodec.name : ZlibCodec }
+if _blosc_available:
+    _codec_types[BloscCodec.name] = BloscCodec
+
+DEFAULT_CODEC = 'blosc' if _blosc_available else 'zlib'
+
+def availableCodecs():
+    """
+    Return the names of the codecs that can be used on this system.
+    """
+    return sorted(_codec_types.keys())
+
+def getCodec(name=DEFAULT_CODEC):
+    """
+    Return a codec instance for the given codec name (see availableCodecs()).
+    If the given name is already a Codec, it is returned as-is.
+    """
+    if isinstance(name, Codec):
+        return name
+    try:
+        return _codec_types[name]()
+    except KeyError:
+        raise ValueError( "Unknown codec: '{}'.  Available codecs are: {}".format( name, availableCodecs() ) )
+
+class CompressedBlock(object):
+    """
+    An array stored as a compressed byte string.
+
+    >>> a = numpy.arange(12, dtype=numpy.uint16).reshape(3,4)
+    >>> block = CompressedBlock.fromArray(a, getCodec('zlib'))
+    >>> block.shape, block.dtype
+    ((3, 4), dtype('uint16'))
+    >>> (block.toArray() == a).all()
+    True
+    >>> block.nbytes == len(block.data)
+    True
+    """
+    __slots__ = ('codec', 'shape', 'dtype', 'data')
+
+    def __init__(self, codec, shape, dtype, data):
+        self.codec = codec
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+        self.data = data
+
+    @classmethod
+    def fromArray(cls, array, codec):
+        array = numpy.ascontiguousarray(array)
+        return cls( codec, array.shape, array.dtype, codec.compress(array) )
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes used to store the (compressed) block.
+        """
+        return len(self.data)
+
+    def toArray(self):
+        """
+        Decompress the block.  The returned array may be read-only.
+        """
+        return self.codec.decompress(self.data, self.dtype).reshape(self.shape)
@@ -0,0 +1,132 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import threading
+import collections
+
+from lazyflow import rtype
+
+def _touching(start1, stop1, start2, stop2):
+    """
+    Return True if the two boxes overlap, or share a face (i.e. they are adjacent along one axis 
+    and overlap along all others).  Boxes that only share an edge or a corner are not touching.
+    """
+    adjacent_axes = 0
+    for a1, b1, a2, b2 in zip(start1, stop1, start2, stop2):
+        if a1 > b2 or a2 > b1:
+            return False
+        if a1 == b2 or a2 == b1:
+            adjacent_axes += 1
+    return adjacent_axes <= 1
+
+def _volume(start, stop):
+    volume = 1
+    for a, b in zip(start, stop):
+        volume *= b - a
+    return volume
+
+def _addBox(merged, start, stop, volume, maxOverhead):
+    """
+    Add a box to the given list of merged boxes ``[start, stop, volume]`` (in-place).
+    The volume of a merged box is the summed volume of the boxes it was made of.
+    """
+    start, stop = list(start), list(stop)
+    # Absorb all existing boxes that touch the new one (unless the bounding box would grow too much).
+    # The grown box may touch boxes it didn't touch before, so repeat until nothing changes.
+    found = True
+    while found:
+        found = False
+        for i, (start2, stop2, volume2) in enumerate(merged):
+            if _touching(start, stop, start2, stop2):
+                bbStart = map(min, start, start2)
+                bbStop = map(max, stop, stop2)
+                if _volume(bbStart, bbStop) <= maxOverhead * (volume + volume2):
+                    start, stop = bbStart, bbStop
+                    volume += volume2
+                    del merged[i]
+                    found = True
+                    break
+    merged.append( [start, stop, volume] )
+
+def mergeBoxes(boxes, maxOverhead=1.5):
+    """
+    Merge a list of boxes ``(start, stop)`` into a smaller set of bounding boxes:
+    Boxes that overlap or share a face (directly or via other boxes) are replaced by their 
+    common bounding box, as long as its volume is at most maxOverhead times the summed volume of the boxes.
+
+    >>> mergeBoxes( [([0,0], [2,2]), ([2,1], [4,3]), ([10,10], [11,11])] )
+    [([0, 0], [4, 3]), ([10, 10], [11, 11])]
+    """
+    merged = []
+    for start, stop in boxes:
+        _addBox( merged, start, stop, _volume(start, stop), maxOverhead )
+    return [ (start, stop) for start, stop, _ in merged ]
+
+class DirtyRoiBatch(object):
+    """
+    Collects dirty notifications (see ``Slot.setDirty()``) so they can be propagated later, all at once.
+    Normally not used directly.  See ``Graph.batch_dirty_notifications()``.
+
+    Dirty SubRegions of the same slot are merged into bounding boxes as they arrive (see :py:func:`mergeBoxes`),
+    so many small, adjacent dirty rois (e.g. from the dabs of a brush stroke) are propagated as a few larger rois.
+    Other roi types are propagated unchanged.
+    """
+    # See mergeBoxes()
+    maxOverhead = 1.5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        # { slot : [[start, stop, volume], ...] } in order of first notification (see _addBox())
+        self._boxes = collections.OrderedDict()
+
+        # { slot : [roi, ...] } for rois that can't be merged
+        self._other_rois = collections.OrderedDict()
+
+    def add(self, slot, roi):
+        with self._lock:
+            if isinstance(roi, rtype.SubRegion):
+                boxes = self._boxes.setdefault( slot, [] )
+                _addBox( boxes, roi.start, roi.stop, _volume(roi.start, roi.stop), self.maxOverhead )
+            else:
+                self._other_rois.setdefault( slot, [] ).append( roi )
+
+    def __len__(self):
+        """
+        The number of rois that will be propagated by flush().
+        """
+        with self._lock:
+            return sum( map(len, self._boxes.values() + self._other_rois.values()) )
+
+    def flush(self):
+        """
+        Propagate all collected dirty rois (by calling ``setDirty()`` on their slots) and forget them.
+        """
+        with self._lock:
+            boxes, self._boxes = self._boxes, collections.OrderedDict()
+            other_rois, self._other_rois = self._other_rois, collections.OrderedDict()
+
+        for slot, slot_boxes in boxes.items():
+            for start, stop, _ in slot_boxes:
+                slot.setDirty( rtype.SubRegion( slot, start, stop ) )
+        for slot, rois in other_rois.items():
+            for roi in rois:
+                slot.setDirty( roi )
@@ -0,0 +1,124 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import threading
+import collections
+
+from lazyflow.request import Request, operator_stats
+
+class ExecutionStats(object):
+    """
+    Accumulated statistics for a set of ``Operator.execute()`` calls.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.wall_time = 0.0
+        self.wait_time = 0.0
+        self.output_bytes = 0
+
+    def add(self, wall_time, wait_time, output_bytes):
+        self.calls += 1
+        self.wall_time += wall_time
+        self.wait_time += wait_time
+        self.output_bytes += output_bytes
+
+    def to_dict(self):
+        return { 'calls' : self.calls,
+                 'wall_time' : self.wall_time,
+                 'wait_time' : self.wait_time,
+                 'self_time' : self.wall_time - self.wait_time,
+                 'output_bytes' : self.output_bytes }
+
+class OperatorProfiler(object):
+    """
+    Collects execution statistics per operator class and per operator instance.
+    (The per-instance statistics are kept in the shared ``lazyflow.request.operator_stats`` registry.)
+    Normally not used directly.  See ``Graph.enable_profiling()`` and ``Graph.profiling_report()``.
+
+    For each ``execute()`` call, we record:
+
+    - wall_time: The total time spent in ``execute()``
+    - wait_time: The part of wall_time spent waiting for other requests (e.g. upstream data)
+    - output_bytes: The size of the result
+    """
+
+    # Number of active profilers (see activate()).
+    # Request wait times are only measured while at least one profiler is active.
+    _active_count = 0
+    _active_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = False
+        self.reset()
+
+    def activate(self):
+        with OperatorProfiler._active_lock:
+            if not self._active:
+                self._active = True
+                OperatorProfiler._active_count += 1
+                Request._track_wait_time = True
+
+    def deactivate(self):
+        with OperatorProfiler._active_lock:
+            if self._active:
+                self._active = False
+                OperatorProfiler._active_count -= 1
+                Request._track_wait_time = (OperatorProfiler._active_count > 0)
+
+    def reset(self):
+        """
+        Discard all statistics collected so far.
+        """
+        with self._lock:
+            self._class_stats = collections.defaultdict( ExecutionStats )
+        operator_stats.reset( self )
+
+    def record(self, operator, wall_time, wait_time, output_bytes):
+        """
+        Record a single ``execute()`` call of the given operator.
+        """
+        class_name = type(operator).__name__
+        with self._lock:
+            self._class_stats[class_name].add( wall_time, wait_time, output_bytes )
+        operator_stats.record( operator, self, ExecutionStats,
+                               lambda stats: stats.add( wall_time, wait_time, output_bytes ) )
+
+    def report(self):
+        """
+        Return the statistics collected so far, as plain python structures::
+
+            { 'classes' : { class_name : stats_dict, ... },
+              'instances' : [ stats_dict, ... ] }
+
+        Each stats_dict has the keys ``calls``, ``wall_time``, ``wait_time``, ``self_time`` and ``output_bytes``.
+        Instance entries also have ``operator`` (the operator name), ``class`` and ``id`` keys.
+        Instances are sorted by ``self_time``, slowest first.
+        Instances that have been deleted in the meantime are not listed (but are still counted in their class).
+        """
+        with self._lock:
+            classes = dict( (name, stats.to_dict()) for name, stats in self._class_stats.items() )
+        instances = []
+        for operator, d in operator_stats.snapshot( self ):
+            d.update( { 'operator' : operator.name, 'class' : type(operator).__name__, 'id' : id(operator) } )
+            instances.append( d )
+        instances.sort( key=lambda d: d['self_time'], reverse=True )
+        return { 'classes' : classes, 'instances' : instances }
@@ -0,0 +1,231 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import os
+import json
+import time
+import thread
+import threading
+import itertools
+import collections
+
+import numpy
+
+from lazyflow.request import Request
+
+class RequestTracer(object):
+    """
+    Records the life cycle of requests and writes it as a Chrome trace (JSON) file,
+    which can be loaded in ``chrome://tracing`` or the Perfetto UI.
+
+    Usage:
+
+    .. code-block:: python
+
+        with RequestTracer() as tracer:
+            op.Output[:].wait()
+        tracer.save('/tmp/requests.trace.json')
+
+    The trace contains:
+
+    - For each worker thread, a slice for each period during which it executed a request's greenlet.
+      (Gaps between slices are idle time or time spent in the scheduler.)
+      Slices for requests executed directly in a foreign thread appear on that thread.
+    - For each request, an asynchronous span from its creation until it finished, with instant events
+      when it was assigned to a worker, executed inline by its waiter, or suspended to wait for another request.
+
+    Requests that compute a slot's data are labeled with the operator and slot name, and the roi size.
+
+    At most ``max_events`` events are kept.  Once that many have been recorded, the oldest are discarded.
+    """
+
+    def __init__(self, max_events=1000000):
+        self._events = collections.deque( maxlen=max_events )
+        self._thread_names = {}
+        self._id_counter = itertools.count()
+        self._pid = os.getpid()
+        self._t0 = time.time()
+
+    def start(self):
+        """
+        Start recording.  Only one tracer can be active at a time.
+        """
+        Request._tracer = self
+
+    def stop(self):
+        if Request._tracer is self:
+            Request._tracer = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def reset(self):
+        """
+        Discard all events recorded so far.
+        """
+        self._events.clear()
+        self._t0 = time.time()
+
+    @property
+    def events(self):
+        """
+        The recorded events (including thread name metadata) as a list of Chrome trace event dicts.
+        """
+        metadata = [ { 'ph' : 'M', 'name' : 'thread_name', 'pid' : self._pid, 'tid' : tid, 'args' : { 'name' : name } }
+                     for tid, name in self._thread_names.items() ]
+        return metadata + list(self._events)
+
+    def save(self, filename):
+        """
+        Write the recorded events to the given file in Chrome trace JSON format.
+        """
+        with open(filename, 'w') as f:
+            json.dump( { 'traceEvents' : self.events, 'displayTimeUnit' : 'ms' }, f )
+
+    ##
+    ## Hooks (called by the Request implementation)
+    ##
+
+    def request_created(self, request):
+        request._trace_id = self._id_counter.next()
+        label, args = self._describe(request)
+        request._trace_label = label
+        parent = request.parent_request
+        if parent is not None:
+            args['parent'] = self._trace_id(parent)
+        args['priority_class'] = request.priority_class
+        self._record_async( 'b', label, request, args )
+
+    def request_assigned(self, request, worker):
+        self._record_async( 'n', 'assigned', request, { 'worker' : worker.name } )
+
+    def request_inlined(self, request, waiter):
+        self._record_async( 'n', 'executed inline', request, { 'waiter' : self._trace_id(waiter) } )
+
+    def request_suspended(self, request, blocking_request):
+        self._record_async( 'n', 'suspended', request, { 'waiting_for' : self._trace_id(blocking_request),
+                                                         'waiting_for_label' : self._label(blocking_request) } )
+
+    def request_finished(self, request):
+        if request.cancelled:
+            status = 'cancelled'
+        elif request.exception is not None:
+            status = 'failed'
+        else:
+            status = 'finished'
+        self._record_async( 'e', self._label(request), request, { 'status' : status } )
+
+    def traced_switch(self, request):
+        """
+        Switch to the request's greenlet and record the time until control returns to the worker.
+        """
+        trace_id = self._trace_id(request)
+        label = self._label(request)
+        start = time.time()
+        request.greenlet.switch()
+        self._record_slice( label, trace_id, start )
+
+    def traced_execute(self, request):
+        """
+        Execute the request directly in the current (foreign) thread and record it.
+        """
+        trace_id = self._trace_id(request)
+        label = self._label(request)
+        start = time.time()
+        request._execute()
+        self._record_slice( label, trace_id, start )
+
+    ##
+    ## Implementation
+    ##
+
+    def _trace_id(self, request):
+        try:
+            return request._trace_id
+        except AttributeError:
+            # Created before tracing started.
+            request._trace_id = self._id_counter.next()
+            return request._trace_id
+
+    def _label(self, request):
+        try:
+            return request._trace_label
+        except AttributeError:
+            request._trace_label = self._describe(request)[0]
+            return request._trace_label
+
+    def _describe(self, request):
+        """
+        Return a label for the request and a dict of extra info about it.
+        """
+        fn = request.fn
+        # Unwrap Request.writeInto() and functools.partial
+        fn = getattr( fn, 'func', fn )
+
+        slot = getattr( fn, 'slot', None )
+        if slot is None:
+            name = getattr( fn, '__name__', None ) or type(fn).__name__
+            return name, {}
+
+        label = "{}.{}".format( slot.operator.name, slot.name )
+        args = {}
+        roi = getattr( fn, 'roi', None )
+        start = getattr( roi, 'start', None )
+        stop = getattr( roi, 'stop', None )
+        if start is not None and stop is not None:
+            args['roi'] = "[{}, {})".format( list(start), list(stop) )
+            args['roi_size'] = int( numpy.prod( numpy.subtract( stop, start ) ) )
+        return label, args
+
+    def _timestamp(self, t=None):
+        # Chrome traces are in microseconds
+        return ((time.time() if t is None else t) - self._t0) * 1e6
+
+    def _tid(self):
+        tid = thread.get_ident()
+        if tid not in self._thread_names:
+            self._thread_names[tid] = threading.current_thread().name
+        return tid
+
+    def _record_async(self, phase, name, request, args):
+        self._events.append( { 'ph' : phase,
+                               'cat' : 'request',
+                               'name' : name,
+                               'id' : self._trace_id(request),
+                               'ts' : self._timestamp(),
+                               'pid' : self._pid,
+                               'tid' : self._tid(),
+                               'args' : args } )
+
+    def _record_slice(self, name, trace_id, start):
+        end = time.time()
+        self._events.append( { 'ph' : 'X',
+                               'cat' : 'execution',
+                               'name' : name,
+                               'ts' : self._timestamp(start),
+                               'dur' : (end - start) * 1e6,
+                               'pid' : self._pid,
+                               'tid' : self._tid(),
+                               'args' : { 'request' : trace_id } } )
@@ -0,0 +1,124 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import collections
+
+import numpy
+
+from lazyflow import rtype
+from lazyflow.request import Request
+
+class RoiPlan(object):
+    """
+    The result of :py:func:`planUpstreamRois()`.
+
+    - rois: An OrderedDict of ``{ slot : [roi, ...] }`` with the rois that will be requested from each slot
+      that provides data, i.e. each output slot computed by an operator, and each input slot with a value.
+      (Slots that just forward data from their upstream partner are not listed.)
+      Slots are listed in the order they were reached, starting from the requested slot.
+    - sources: The slots at which planning stopped: input slots with a value, and output slots of
+      operators that don't declare an input roi mapping (see ``Operator.mapRoiToInputs()``).
+    """
+    def __init__(self):
+        self.rois = collections.OrderedDict()
+        self.sources = []
+
+    def boundingRoi(self, slot):
+        """
+        Return the bounding box ``(start, stop)`` of all rois requested from the given slot,
+        or None if no rois will be requested from it.
+        """
+        rois = self.rois.get(slot)
+        if not rois:
+            return None
+        start = numpy.min( [roi.start for roi in rois], axis=0 )
+        stop = numpy.max( [roi.stop for roi in rois], axis=0 )
+        return tuple(start), tuple(stop)
+
+    def prefetch(self):
+        """
+        Submit requests for all source rois, so that the source data is (being) computed
+        before the downstream request is executed.  Returns the submitted requests.
+        """
+        requests = []
+        for slot in self.sources:
+            for roi in self.rois[slot]:
+                requests.append( slot(roi.start, roi.stop) )
+        Request.submit_many( requests )
+        return requests
+
+def _computingOperator(slot):
+    """
+    Return the operator that computes the given (unconnected) output slot,
+    and the subindex of the slot within the operator's output.
+    """
+    subindex = ()
+    op = slot.operator
+    while hasattr(op, '_subSlots'):
+        # The slot is a subslot of a multi-slot.
+        subindex = (op._subSlots.index(slot),) + subindex
+        slot = op
+        op = slot.operator
+    return op, subindex
+
+def planUpstreamRois(slot, roi):
+    """
+    Determine which rois will be requested from which upstream slots when the given roi of the given slot is requested,
+    by following the connections upstream and asking each operator to map its output roi to its input rois
+    (see ``Operator.mapRoiToInputs()``).  Nothing is executed.
+
+    :param slot: An output (or input) slot
+    :param roi: A SubRegion of the slot, or a ``(start, stop)`` tuple
+    :returns: A :py:class:`RoiPlan`
+    """
+    if not isinstance(roi, rtype.Roi):
+        roi = rtype.SubRegion(slot, *roi)
+
+    plan = RoiPlan()
+    seen = set()
+    queue = collections.deque( [(slot, roi)] )
+    while queue:
+        slot, roi = queue.popleft()
+
+        # Skip slots that just forward their partner's data
+        while slot.partner is not None:
+            slot = slot.partner
+
+        key = ( slot, tuple(roi.start), tuple(roi.stop) )
+        if key in seen:
+            continue
+        seen.add( key )
+
+        if slot not in plan.rois:
+            plan.rois[slot] = []
+        plan.rois[slot].append( rtype.SubRegion(slot, roi.start, roi.stop) )
+
+        input_rois = None
+        if slot._type == "output":
+            op, subindex = _computingOperator(slot)
+            input_rois = op.mapRoiToInputs(slot, subindex, roi)
+
+        if input_rois is None:
+            if slot not in plan.sources:
+                plan.sources.append( slot )
+        else:
+            queue.extend( input_rois )
+    return plan
@@ -156,10 +156,7 @@ class RoiRequestBatch( object ):
 
         try:
             # Start by activating a batch of N requests
-            for _ in range(self._batchSize):
-                with self._condition:
-                    self._activateNewRequest()
-                    self._activated_count += 1
+            self._activateNewRequests( self._batchSize )
 
             # Loop until StopIteration
             while True:
@@ -173,9 +170,8 @@ class RoiRequestBatch( object ):
 
                 # Launch new requests until we have the correct number of active requests
                 while not self._failed and self._activated_count - self._completed_count < self._batchSize:
-                    with self._condition:
-                        self._activateNewRequest() # Eventually raises StopIteration
-                        self._activated_count += 1
+                    # Eventually raises StopIteration
+                    self._activateNewRequests( self._batchSize - (self._activated_count - self._completed_count) )
 
                 if self._failed:
                     break
@@ -188,9 +184,32 @@ class RoiRequestBatch( object ):
 
         self.progressSignal( 100 )
 
+    def _activateNewRequests(self, count):
+        """
+        Creates up to ``count`` new requests and submits them together.
+        Raises StopIteration (after submitting the requests that were created) if there are no more rois to process.
+        """
+        new_requests = []
+        exhausted = False
+        try:
+            for _ in range(count):
+                with self._condition:
+                    new_requests.append( self._activateNewRequest() )
+                    self._activated_count += 1
+        except StopIteration:
+            exhausted = True
+
+        Request.submit_many( new_requests )
+
+        # The traceback of the StopIteration references this frame.
+        # Don't let it keep the requests (and their results) alive.
+        del new_requests
+        if exhausted:
+            raise StopIteration()
+
     def _activateNewRequest(self):
         """
-        Creates and activates a new request if there are more rois to process.
+        Creates a new request (but doesn't submit it) if there are more rois to process.
         Otherwise, raises StopIteration
         """
         # This could raise StopIteration
@@ -206,7 +225,7 @@ class RoiRequestBatch( object ):
         req.notify_finished( partial( self._handleCompletedRequest, roi ) )
         req.notify_failed( partial( self._handleFailedRequest, roi ) )
         req.notify_cancelled( partial( self._handleCancelledRequest, roi ) )
-        req.submit()
+        return req
 
     def _handleCompletedRequest(self, roi, result):
         try:
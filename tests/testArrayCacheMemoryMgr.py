@@ -0,0 +1,283 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import time
+import numpy
+import vigra
+from lazyflow.graph import Graph
+from lazyflow.operators import OpArrayPiper, OpArrayCache
+from lazyflow.operators.arrayCacheMemoryMgr import ArrayCacheMemoryMgr
+
+class FakeCache(object):
+    """
+    Stands in for an OpCache: records which of its blocks were evicted.
+    """
+    def __init__(self, name, busy=False):
+        self.name = name
+        self.busy = busy
+        self.evicted = []
+
+    def _evictBlock(self, block):
+        if self.busy:
+            return False
+        self.evicted.append(block)
+        return True
+
+class TestArrayCacheMemoryMgr(object):
+
+    def setUp(self):
+        # A private manager (not started), so the tests don't depend on the RAM of this machine
+        self.mgr = ArrayCacheMemoryMgr()
+        self.mgr.setBudget(250)
+
+    def testWithinBudget(self):
+        a = FakeCache('a')
+        self.mgr.charge(a, 100, 0)
+        self.mgr.charge(a, 100, 1)
+        assert self.mgr.chargedBytes() == 200
+        assert a.evicted == []
+
+        # Re-charging a block replaces its old charge
+        self.mgr.charge(a, 50, 1)
+        assert self.mgr.chargedBytes() == 150
+
+        self.mgr.credit(a, 0)
+        assert self.mgr.chargedBytes() == 50
+        self.mgr.credit(a, 0) # (no effect)
+        assert self.mgr.chargedBytes() == 50
+
+    def testLRU(self):
+        self.mgr.setEvictionPolicy( ArrayCacheMemoryMgr.LRU )
+        a = FakeCache('a')
+        b = FakeCache('b')
+        c = FakeCache('c')
+        self.mgr.charge(a, 100)
+        self.mgr.charge(b, 100)
+        self.mgr.touch(a)
+
+        # b is the least recently used cache
+        self.mgr.charge(c, 100)
+        assert a.evicted == []
+        assert b.evicted == [None]
+        assert self.mgr.chargedBytes() == 200
+
+    def testLFU(self):
+        self.mgr.setEvictionPolicy( ArrayCacheMemoryMgr.LFU )
+        a = FakeCache('a')
+        b = FakeCache('b')
+        c = FakeCache('c')
+        self.mgr.charge(a, 100)
+        self.mgr.charge(b, 100)
+        self.mgr.touch(a)
+        self.mgr.touch(a)
+        self.mgr.touch(b)
+        self.mgr.touch(a)
+
+        # b was used less often than a, even though it was used more recently.
+        self.mgr.charge(c, 100)
+        assert a.evicted == []
+        assert b.evicted == [None]
+
+    def testCost(self):
+        a = FakeCache('a')
+        b = FakeCache('b')
+        c = FakeCache('c')
+        self.mgr.charge(a, 100)
+        self.mgr.recordCost(a, 10.0)
+        self.mgr.charge(b, 100)
+        self.mgr.recordCost(b, 0.5)
+        self.mgr.recordCost(b, 0.5)
+
+        # b is cheaper to recompute than a, even though it was used more recently.
+        self.mgr.charge(c, 100)
+        assert a.evicted == []
+        assert b.evicted == [None]
+
+    def testCostPerByte(self):
+        a = FakeCache('a')
+        b = FakeCache('b')
+        c = FakeCache('c')
+        self.mgr.charge(a, 20)
+        self.mgr.recordCost(a, 1.0)
+        self.mgr.charge(b, 200)
+        self.mgr.recordCost(b, 2.0)
+
+        # b took longer to compute, but a is more expensive per byte.
+        self.mgr.charge(c, 100)
+        assert a.evicted == []
+        assert b.evicted == [None]
+
+    def testCostDecaysWithAge(self):
+        a = FakeCache('a')
+        b = FakeCache('b')
+        c = FakeCache('c')
+        self.mgr.charge(a, 100)
+        self.mgr.recordCost(a, 10.0)
+        self.mgr.charge(b, 100)
+        self.mgr.recordCost(b, 1.0)
+
+        # a is expensive, but it hasn't been used for an hour.
+        self.mgr._blocks[(a, None)][3] -= 3600
+        self.mgr.charge(c, 100)
+        assert a.evicted == [None]
+        assert b.evicted == []
+
+    def testBlockGranularity(self):
+        a = FakeCache('a')
+        b = FakeCache('b')
+        for i in range(5):
+            self.mgr.charge(a, 50, i)
+        
+        # Only as many blocks as needed are evicted, oldest first.
+        self.mgr.charge(b, 100)
+        assert a.evicted == [0, 1]
+        assert self.mgr.chargedBytes() == 250
+
+    def testNeverEvictsChargedBlock(self):
+        a = FakeCache('a')
+        self.mgr.charge(a, 200, 0)
+        self.mgr.charge(a, 300, 1)
+        assert a.evicted == [0]
+        assert self.mgr.chargedBytes() == 300
+
+    def testBusyBlocksStayCharged(self):
+        a = FakeCache('a', busy=True)
+        b = FakeCache('b')
+        self.mgr.charge(a, 200)
+        self.mgr.charge(b, 100)
+        assert self.mgr.chargedBytes() == 300
+
+        # Once it's no longer busy, a is evicted by the next charge.
+        # (The busy block was kept as the most recently used one, so make b more recent.)
+        a.busy = False
+        self.mgr.touch(b)
+        self.mgr.charge(b, 100, 'other')
+        assert a.evicted == [None]
+        assert self.mgr.chargedBytes() == 200
+
+    def testSetBudget(self):
+        a = FakeCache('a')
+        self.mgr.charge(a, 100, 0)
+        self.mgr.charge(a, 100, 1)
+        assert not self.mgr.isUnderPressure()
+
+        self.mgr.setBudget(210)
+        assert a.evicted == []
+        assert self.mgr.isUnderPressure()
+        
+        self.mgr.setBudget(150)
+        assert a.evicted == [0]
+        assert self.mgr.chargedBytes() == 100
+
+    def testRemove(self):
+        a = FakeCache('a')
+        b = FakeCache('b')
+        self.mgr.charge(a, 100, 0)
+        self.mgr.charge(a, 50, 1)
+        self.mgr.charge(b, 50)
+        self.mgr.remove(a)
+        assert self.mgr.chargedBytes() == 50
+
+class TestArrayCacheEviction(object):
+
+    def setUp(self):
+        self.data = numpy.random.randint(0, 255, (100,100)).astype(numpy.uint8)
+        self.data = vigra.taggedView(self.data, 'xy')
+        self.mgr = ArrayCacheMemoryMgr()
+
+        graph = Graph()
+        self.ops = []
+        for i in range(2):
+            op = OpArrayCache(graph=graph)
+            op._memory_manager = self.mgr
+            op.Input.setValue(self.data)
+            self.ops.append(op)
+
+    def testEviction(self):
+        # Room for one cache array only
+        self.mgr.setBudget( 1.5 * self.data.nbytes )
+        opA, opB = self.ops
+
+        assert (opA.Output[:].wait() == self.data).all()
+        assert opA.usedMemory() == self.data.nbytes
+        assert self.mgr.chargedBytes() == self.data.nbytes
+
+        # Filling the second cache evicts the first
+        assert (opB.Output[:].wait() == self.data).all()
+        assert opA.usedMemory() == 0
+        assert opB.usedMemory() == self.data.nbytes
+        assert self.mgr.chargedBytes() == self.data.nbytes
+
+        # The evicted cache is refilled on demand
+        assert (opA.Output[10:20, 10:20].wait() == self.data[10:20, 10:20]).all()
+        assert opB.usedMemory() == 0
+
+    def testCleanUp(self):
+        self.mgr.setBudget( 10 * self.data.nbytes )
+        for op in self.ops:
+            op.Output[:].wait()
+        assert self.mgr.chargedBytes() == 2 * self.data.nbytes
+        self.ops[0].cleanUp()
+        assert self.mgr.chargedBytes() == self.data.nbytes
+
+class OpSlowArrayPiper(OpArrayPiper):
+    """
+    An array piper that takes a while to produce its output.
+    """
+    def execute(self, slot, subindex, roi, result):
+        time.sleep(0.05)
+        return super(OpSlowArrayPiper, self).execute(slot, subindex, roi, result)
+
+class TestCostAwareEviction(object):
+
+    def testExpensiveCacheSurvives(self):
+        data = numpy.random.randint(0, 255, (100,100)).astype(numpy.uint8)
+        data = vigra.taggedView(data, 'xy')
+        mgr = ArrayCacheMemoryMgr()
+        # Room for two cache arrays
+        mgr.setBudget( 2.5 * data.nbytes )
+
+        graph = Graph()
+        ops = []
+        for opType in [OpSlowArrayPiper, OpArrayPiper, OpArrayPiper]:
+            opProvider = opType(graph=graph)
+            opProvider.Input.setValue(data)
+            op = OpArrayCache(graph=graph)
+            op._memory_manager = mgr
+            op.Input.connect(opProvider.Output)
+            ops.append(op)
+        opExpensive, opCheap, opNew = ops
+
+        opExpensive.Output[:].wait()
+        opCheap.Output[:].wait()
+
+        # The least recently used cache is the expensive one, but the cheap one is evicted.
+        opNew.Output[:].wait()
+        assert opExpensive.usedMemory() == data.nbytes
+        assert opCheap.usedMemory() == 0
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
@@ -0,0 +1,200 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import os
+import shutil
+import tempfile
+
+import numpy
+import vigra
+from lazyflow.graph import Graph
+from lazyflow.operators import OpArrayPiper, OpArrayCache
+from lazyflow.operators.arrayCacheMemoryMgr import ArrayCacheMemoryMgr
+from lazyflow.operators.blockSpillStore import BlockSpillStore
+
+class TestBlockSpillStore(object):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = BlockSpillStore(1000, self.tmpdir)
+        self.cache = object()
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmpdir)
+
+    def _numFiles(self):
+        return sum( len(files) for _, _, files in os.walk(self.tmpdir) )
+
+    def testPutTake(self):
+        data = numpy.arange(100, dtype=numpy.uint8).reshape(10,10)
+        self.store.put(self.cache, 3, data, 'info')
+        assert (self.cache, 3) in self.store
+        assert self.store.storedBytes() == 100
+        assert self._numFiles() == 1
+
+        restored, info = self.store.take(self.cache, 3)
+        assert info == 'info'
+        assert (restored == data).all()
+        assert restored.flags.writeable
+
+        # Taking a block removes it from disk
+        assert self.store.take(self.cache, 3) is None
+        assert self.store.storedBytes() == 0
+        assert self._numFiles() == 0
+
+    def testLRU(self):
+        data = numpy.zeros((400,), dtype=numpy.uint8)
+        for block in range(3):
+            self.store.put(self.cache, block, data)
+        assert self.store.storedBytes() == 1200 - 400
+
+        # The oldest block was deleted to stay within 1000 bytes
+        assert (self.cache, 0) not in self.store
+        assert (self.cache, 1) in self.store
+        assert (self.cache, 2) in self.store
+        assert self._numFiles() == 2
+
+        # Blocks larger than the store are not spilled at all
+        self.store.put(self.cache, 3, numpy.zeros((2000,), dtype=numpy.uint8))
+        assert (self.cache, 3) not in self.store
+
+    def testInvalidate(self):
+        other_cache = object()
+        data = numpy.zeros((100,), dtype=numpy.uint8)
+        self.store.put(self.cache, 0, data)
+        self.store.put(self.cache, 1, data)
+        self.store.put(other_cache, 0, data)
+
+        self.store.invalidate(self.cache, 0)
+        assert (self.cache, 0) not in self.store
+        assert self.store.storedBytes() == 200
+
+        self.store.remove(self.cache)
+        assert (self.cache, 1) not in self.store
+        assert (other_cache, 0) in self.store
+        assert self.store.storedBytes() == 100
+        assert self._numFiles() == 1
+
+    def testCompressed(self):
+        store = BlockSpillStore(10000, self.tmpdir, codec='zlib')
+        data = numpy.zeros((100,100), dtype=numpy.float32)
+        store.put(self.cache, None, data)
+        assert 0 < store.storedBytes() < data.nbytes
+        restored, _ = store.take(self.cache)
+        assert restored.shape == data.shape
+        assert (restored == data).all()
+        store.close()
+
+    def testWriteFailure(self):
+        """
+        Blocks that can't be written are dropped (including any older copy).
+        """
+        data = numpy.zeros((100,), dtype=numpy.uint8)
+        store = BlockSpillStore(1000, os.path.join(self.tmpdir, 'does-not-exist'))
+        store.put(self.cache, 0, data)
+        assert (self.cache, 0) not in store
+        assert store.storedBytes() == 0
+        assert store.take(self.cache, 0) is None
+        store.close()
+
+    def testUnreadableFile(self):
+        """
+        A block whose file has disappeared is treated as a miss.
+        """
+        data = numpy.zeros((100,), dtype=numpy.uint8)
+        self.store.put(self.cache, 0, data)
+        for dirpath, _, files in os.walk(self.tmpdir):
+            for filename in files:
+                os.remove( os.path.join(dirpath, filename) )
+        assert self.store.take(self.cache, 0) is None
+        assert (self.cache, 0) not in self.store
+        assert self.store.storedBytes() == 0
+
+class TestArrayCacheSpill(object):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.data = numpy.random.randint(0, 255, (100,100)).astype(numpy.uint8)
+        self.data = vigra.taggedView(self.data, 'xy')
+        self.mgr = ArrayCacheMemoryMgr()
+        self.mgr.setSpillStore( BlockSpillStore(10 * self.data.nbytes, self.tmpdir) )
+        # Room for one cache array only
+        self.mgr.setBudget( 1.5 * self.data.nbytes )
+
+        graph = Graph()
+        self.providers = []
+        self.ops = []
+        for i in range(2):
+            opProvider = OpArrayPiper(graph=graph)
+            opProvider.Input.setValue(self.data)
+            op = OpArrayCache(graph=graph)
+            op._memory_manager = self.mgr
+            op.Input.connect(opProvider.Output)
+            self.providers.append(opProvider)
+            self.ops.append(op)
+
+    def tearDown(self):
+        self.mgr.setSpillStore(None)
+        shutil.rmtree(self.tmpdir)
+
+    def testReload(self):
+        opA, opB = self.ops
+        opA.Output[:].wait()
+
+        # Filling the second cache spills the first one to disk
+        opB.Output[:].wait()
+        assert opA.usedMemory() == 0
+        assert (opA, None) in self.mgr.spillStore()
+
+        # The spilled cache is reloaded instead of being recomputed
+        def fail(*args):
+            assert False, "The spilled cache should have been reloaded, not recomputed."
+        self.providers[0].execute = fail
+        assert (opA.Output[10:20, 10:20].wait() == self.data[10:20, 10:20]).all()
+        assert opA.usedMemory() == self.data.nbytes
+        assert (opA, None) not in self.mgr.spillStore()
+
+    def testDirtyDiscardsSpilledCache(self):
+        opA, opB = self.ops
+        opA.Output[:].wait()
+        opB.Output[:].wait()
+        assert (opA, None) in self.mgr.spillStore()
+
+        self.providers[0].Input.setDirty( slice(None) )
+        assert (opA, None) not in self.mgr.spillStore()
+
+    def testCleanUp(self):
+        opA, opB = self.ops
+        opA.Output[:].wait()
+        opB.Output[:].wait()
+        assert self.mgr.spillStore().storedBytes() == self.data.nbytes
+
+        opA.cleanUp()
+        assert self.mgr.spillStore().storedBytes() == 0
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
@@ -0,0 +1,138 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import numpy
+from lazyflow.graph import Graph
+from lazyflow.operator import Operator, InputSlot, OutputSlot
+from lazyflow.operators.opArrayPiper import OpArrayPiper
+
+class OpSum(Operator):
+    """
+    Adds its two inputs.  Records each setup, and whether the inputs were consistent at that time.
+    """
+    A = InputSlot()
+    B = InputSlot()
+    Output = OutputSlot()
+
+    def __init__(self, setupLog, *args, **kwargs):
+        super(OpSum, self).__init__(*args, **kwargs)
+        self.setupLog = setupLog
+
+    def setupOutputs(self):
+        self.setupLog.append( (self, self.A.meta.shape == self.B.meta.shape) )
+        self.Output.meta.assignFrom( self.A.meta )
+
+    def execute(self, slot, subindex, roi, result):
+        result[:] = self.A(roi.start, roi.stop).wait() + self.B(roi.start, roi.stop).wait()
+        return result
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.Output.setDirty( roi )
+
+class OpWithInternalPiper(Operator):
+    """
+    Reads the metadata of an internal operator in setupOutputs().
+    """
+    Input = InputSlot()
+    Output = OutputSlot()
+
+    def __init__(self, *args, **kwargs):
+        super(OpWithInternalPiper, self).__init__(*args, **kwargs)
+        self._opPiper = OpArrayPiper( parent=self )
+
+    def setupOutputs(self):
+        self._opPiper.Input.connect( self.Input )
+        assert self._opPiper.Output.meta.shape == self.Input.meta.shape
+        self.Output.meta.assignFrom( self._opPiper.Output.meta )
+
+    def execute(self, slot, subindex, roi, result):
+        self._opPiper.Output(roi.start, roi.stop).writeInto(result).wait()
+        return result
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.Output.setDirty( roi )
+
+class TestConfigurationTransaction(object):
+
+    def setUp(self):
+        self.graph = Graph()
+        self.setupLog = []
+
+        # opSource -> opA -> opSum
+        #          -> opB ----^
+        self.opSource = OpArrayPiper( graph=self.graph )
+        self.opA = OpArrayPiper( graph=self.graph )
+        self.opB = OpWithInternalPiper( graph=self.graph )
+        self.opSum = OpSum( self.setupLog, graph=self.graph )
+
+    def _connect(self, values):
+        self.opA.Input.connect( self.opSource.Output )
+        self.opB.Input.connect( self.opSource.Output )
+        self.opSum.A.connect( self.opA.Output )
+        self.opSum.B.connect( self.opB.Output )
+        for value in values:
+            self.opSource.Input.setValue( value )
+
+    def testWithoutTransaction(self):
+        values = [ numpy.zeros( (i+1, 10) ) for i in range(3) ]
+        self._connect( values )
+        # opSum is set up each time one of its inputs changes,
+        # sometimes with inconsistent inputs (after only one of them was updated)
+        assert len(self.setupLog) > len(values)
+        assert (self.opSum, False) in self.setupLog
+
+    def testTransaction(self):
+        values = [ numpy.zeros( (i+1, 10) ) for i in range(3) ]
+        with self.graph.configuration_transaction():
+            self._connect( values[:2] )
+            # Nested transactions are committed with the outermost one
+            with self.graph.configuration_transaction():
+                self._connect( values[2:] )
+            assert self.setupLog == []
+            assert not self.opSum.Output.ready()
+
+        # Each operator was set up exactly once, after both inputs of opSum were updated
+        assert self.setupLog == [ (self.opSum, True) ]
+        for op in [self.opSource, self.opA, self.opB]:
+            assert op._setup_count == 1
+        assert self.opSum.Output.meta.shape == (3, 10)
+        assert (self.opSum.Output[:].wait() == 0).all()
+
+        # Later changes are propagated immediately
+        self.opSource.Input.setValue( numpy.ones( (5, 10) ) )
+        assert self.opSum.Output.meta.shape == (5, 10)
+        assert (self.opSum.Output[:].wait() == 2).all()
+
+    def testSetupFinishedCallback(self):
+        calls = []
+        with self.graph.configuration_transaction():
+            self._connect( [ numpy.zeros( (2, 10) ) ] )
+            self.graph.call_when_setup_finished( lambda: calls.append( self.opSum.Output.meta.shape ) )
+            assert calls == []
+        assert calls == [ (2, 10) ]
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
@@ -0,0 +1,123 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import numpy
+from lazyflow.graph import Graph
+from lazyflow.roi import sliceToRoi
+from lazyflow.operators.opArrayPiper import OpArrayPiper
+from lazyflow.utility.dirtyRoiBatch import mergeBoxes
+
+class TestDirtyRoiBatch(object):
+
+    def setUp(self):
+        self.graph = Graph()
+        self.data = numpy.zeros( (100,100), dtype=numpy.uint8 )
+        self.op1 = OpArrayPiper( graph=self.graph )
+        self.op1.Input.setValue( self.data )
+        self.op2 = OpArrayPiper( graph=self.graph )
+        self.op2.Input.connect( self.op1.Output )
+
+        self.dirtyRois = []
+        def handleDirty(slot, roi):
+            self.dirtyRois.append( (list(roi.start), list(roi.stop)) )
+        self.op2.Output.notifyDirty( handleDirty )
+
+    def testUnbatched(self):
+        self.op1.Input.setDirty( numpy.s_[0:10, 0:10] )
+        self.op1.Input.setDirty( numpy.s_[5:15, 5:15] )
+        assert self.dirtyRois == [ ([0,0], [10,10]), ([5,5], [15,15]) ]
+
+    def testBrushStroke(self):
+        with self.graph.batch_dirty_notifications():
+            # A diagonal stroke of overlapping dabs...
+            for i in range(50):
+                self.op1.Input.setDirty( numpy.s_[i:i+3, i:i+3] )
+            # ...and a separate dab
+            self.op1.Input.setDirty( numpy.s_[90:95, 0:5] )
+
+            # Nested batches are flushed with the outermost one
+            with self.graph.batch_dirty_notifications():
+                self.op1.Input.setDirty( numpy.s_[91:96, 0:5] )
+
+            assert self.dirtyRois == []
+
+        # The stroke is propagated as a few boxes that cover it without much extra volume.
+        strokeRois = [ (start, stop) for start, stop in self.dirtyRois if start[0] < 90 ]
+        assert 1 < len(strokeRois) < 50
+        dirty = numpy.zeros( (100,100), dtype=bool )
+        for start, stop in strokeRois:
+            dirty[start[0]:stop[0], start[1]:stop[1]] = True
+        for i in range(50):
+            assert dirty[i:i+3, i:i+3].all()
+        assert dirty.sum() <= 1.5 * 50*3*3
+
+        assert ([90,0], [96,5]) in self.dirtyRois
+        assert len(self.dirtyRois) == len(strokeRois) + 1
+
+        # Not batched any more
+        self.dirtyRois = []
+        self.op1.Input.setDirty( numpy.s_[0:1, 0:1] )
+        assert self.dirtyRois == [ ([0,0], [1,1]) ]
+
+    def testFlushedOnException(self):
+        try:
+            with self.graph.batch_dirty_notifications():
+                self.op1.Input.setDirty( numpy.s_[0:10, 0:10] )
+                raise RuntimeError("Expected")
+        except RuntimeError:
+            pass
+        assert self.dirtyRois == [ ([0,0], [10,10]) ]
+
+    def testMergeBoxes(self):
+        boxes = [ sliceToRoi( numpy.s_[0:2, 0:2], (10,10) ),
+                  sliceToRoi( numpy.s_[4:6, 0:2], (10,10) ),
+                  sliceToRoi( numpy.s_[2:4, 0:2], (10,10) ), # connects the other two
+                  sliceToRoi( numpy.s_[8:9, 0:1], (10,10) ),
+                  sliceToRoi( numpy.s_[9:10, 1:2], (10,10) ) ] # only shares a corner with the previous one
+        merged = mergeBoxes( boxes )
+        assert sorted(merged) == [ ([0,0], [6,2]), ([8,0], [9,1]), ([9,1], [10,2]) ]
+
+    def testDiagonalStroke(self):
+        """
+        Merging must not inflate a diagonal stroke into its (mostly clean) bounding box.
+        """
+        # Dabs that only share corners aren't merged at all.
+        dabs = [ ([10*i, 10*i], [10*i+10, 10*i+10]) for i in range(100) ]
+        merged = mergeBoxes( dabs )
+        assert sorted(merged) == sorted(dabs)
+
+        # Overlapping dabs are merged, but into boxes that stay close to the painted volume.
+        dabs = [ ([5*i, 5*i], [5*i+10, 5*i+10]) for i in range(100) ]
+        merged = mergeBoxes( dabs )
+        assert len(merged) < len(dabs)
+        mergedVolume = sum( (stop[0]-start[0]) * (stop[1]-start[1]) for start, stop in merged )
+        assert mergedVolume <= 1.5 * 100*10*10
+        for start, stop in dabs:
+            assert any( (numpy.array(start) >= s).all() and (numpy.array(stop) <= t).all()
+                        for s, t in merged ), "Dab {} is not covered".format( (start, stop) )
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
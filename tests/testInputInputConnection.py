@@ -20,6 +20,7 @@
 #		   http://ilastik.org/license/
 ###############################################################################
 import nose
+import numpy
 from lazyflow.graph import Graph, Operator, InputSlot, OutputSlot, OperatorWrapper
 from lazyflow import stype
 from lazyflow import operators
@@ -88,6 +89,30 @@ class TestInputInputConnection(object):
         self.op.internalOp.Input.disconnect()
         self.op.internalOp.Input.connect(self.op.Input)
 
+    def test_upstream_source(self):
+        """
+        Requests to a chain of relay slots go straight to the slot at its upstream end.
+        The resolved source is updated when the chain is reconnected.
+        """
+        opSource1 = operators.OpArrayPiper(graph=self.g)
+        opSource1.Input.setValue( numpy.array([1]) )
+        opSource2 = operators.OpArrayPiper(graph=self.g)
+        opSource2.Input.setValue( numpy.array([2]) )
+
+        self.op.Input.connect( opSource1.Output )
+        internalInput = self.op.internalOp.Input
+        assert internalInput._upstreamSource() is opSource1.Output
+        assert self.op.Output[:].wait()[0] == 1
+
+        self.op.Input.connect( opSource2.Output )
+        assert internalInput._upstreamSource() is opSource2.Output
+        assert self.op.Output[:].wait()[0] == 2
+
+        self.op.Input.disconnect()
+        assert internalInput._upstreamSource() is self.op.Input
+        self.op.Input.setValue( numpy.array([3]) )
+        assert self.op.Output[:].wait()[0] == 3
+
     def test_wrapping(self):
         opm = operators.Op5ToMulti(graph=self.g)
         opm.Input0.setValue(1)
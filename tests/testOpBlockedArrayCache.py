@@ -20,11 +20,16 @@
 #		   http://ilastik.org/license/
 ###############################################################################
 import threading
+import shutil
+import tempfile
 import numpy
 import vigra
 from lazyflow.graph import Graph
 from lazyflow.roi import sliceToRoi, roiToSlice
+from lazyflow.request import Request
 from lazyflow.operators import OpArrayPiper, OpBlockedArrayCache
+from lazyflow.operators.arrayCacheMemoryMgr import ArrayCacheMemoryMgr
+from lazyflow.operators.blockSpillStore import BlockSpillStore
 
 class KeyMaker():
     def __getitem__(self, *args):
@@ -46,6 +51,37 @@ class OpArrayPiperWithAccessCount(OpArrayPiper):
         super(OpArrayPiperWithAccessCount, self).execute(slot, subindex, roi, result)
         
 
+class OpFailsOnce(OpArrayPiper):
+    """
+    Provides 7s everywhere, but the first request fails.
+    """
+    def __init__(self, *args, **kwargs):
+        super(OpFailsOnce, self).__init__(*args, **kwargs)
+        self.failed = False
+
+    def execute(self, slot, subindex, roi, result):
+        if not self.failed:
+            self.failed = True
+            raise RuntimeError("Expected failure")
+        result[:] = 7
+        return result
+
+class OpChangesDuringFetch(OpArrayPiper):
+    """
+    Provides a constant value everywhere.  The first request returns the old value,
+    but the value changes (and the output is marked dirty) before that request completes.
+    """
+    def __init__(self, *args, **kwargs):
+        super(OpChangesDuringFetch, self).__init__(*args, **kwargs)
+        self.value = 1
+
+    def execute(self, slot, subindex, roi, result):
+        result[:] = self.value
+        if self.value == 1:
+            self.value = 2
+            self.Output.setDirty( roi.start, roi.stop )
+        return result
+
 class TestOpBlockedArrayCache(object):
 
     def setUp(self):
@@ -303,6 +339,151 @@ class TestOpBlockedArrayCache(object):
         assert opProvider.accessCount <= maxAccess
         oldAccessCount = opProvider.accessCount
 
+    def testPrefetch(self):
+        opCache = self.opCache
+        opProvider = self.opProvider
+        opCache.prefetchSteps.setValue(2)
+
+        # Scroll through y, one (outer) block at a time
+        for y in [0, 20, 40]:
+            opCache.Output( make_key[0:1, 0:20, y:y+20, 0:10, 0:1] ).wait()
+
+        # The next two blocks are prefetched in the background
+        prefetched = opCache._prefetcher._prefetched
+        assert sorted( prefetched.keys() ) == [ ((0,0,3,0,0), (1,1,4,1,1)), ((0,0,4,0,0), (1,1,5,1,1)) ]
+        for requests in prefetched.values():
+            for req in requests:
+                assert req.priority_class == Request.BACKGROUND
+                assert req.parent_request is None
+                req.wait()
+
+        # Prefetched blocks are already in the cache
+        oldAccessCount = opProvider.accessCount
+        data = opCache.Output( make_key[0:1, 0:20, 60:100, 0:10, 0:1] ).wait()
+        assert (data == self.data[0:1, 0:20, 60:100, 0:10, 0:1]).all()
+        assert opProvider.accessCount == oldAccessCount
+
+        # A different access pattern stops prefetching
+        opCache.Output( make_key[0:1, 40:60, 0:20, 0:10, 0:1] ).wait()
+        assert opCache._prefetcher._prefetched == {}
+
+    def testFailedFetchIsRetried(self):
+        """
+        If the upstream request fails, the affected blocks must stay dirty (instead of caching zeros).
+        """
+        graph = Graph()
+        opSource = OpFailsOnce(graph=graph)
+        opSource.Input.setValue( vigra.taggedView( numpy.zeros( (100,100), dtype=numpy.uint8 ), 'xy' ) )
+
+        opCache = OpBlockedArrayCache(graph=graph)
+        opCache.Input.connect( opSource.Output )
+        opCache.innerBlockShape.setValue( (10,10) )
+        opCache.outerBlockShape.setValue( (20,20) )
+        opCache.fixAtCurrent.setValue(False)
+
+        try:
+            opCache.Output[0:10, 0:10].wait()
+        except RuntimeError:
+            pass
+        else:
+            assert False, "Expected the upstream failure to be propagated."
+
+        data = opCache.Output[0:10, 0:10].wait()
+        assert (data == 7).all()
+
+    def testDirtyDuringFetch(self):
+        """
+        Data that became dirty while it was fetched must not be returned from the cache.
+        """
+        graph = Graph()
+        opSource = OpChangesDuringFetch(graph=graph)
+        opSource.Input.setValue( vigra.taggedView( numpy.zeros( (100,100), dtype=numpy.uint8 ), 'xy' ) )
+
+        opCache = OpBlockedArrayCache(graph=graph)
+        opCache.Input.connect( opSource.Output )
+        opCache.innerBlockShape.setValue( (10,10) )
+        opCache.outerBlockShape.setValue( (20,20) )
+        opCache.fixAtCurrent.setValue(False)
+
+        data = opCache.Output[0:10, 0:10].wait()
+        assert (data == 2).all()
+
+    def testBlockEviction(self):
+        opCache = self.opCache
+        opProvider = self.opProvider
+
+        # A private memory manager with room for 3 (outer) blocks
+        mgr = ArrayCacheMemoryMgr()
+        blockBytes = 20*20*10 * self.data.dtype.itemsize
+        mgr.setBudget( 3.5 * blockBytes )
+        mgr.setEvictionPolicy( ArrayCacheMemoryMgr.LRU )
+        opCache._memory_manager = mgr
+
+        # The blocks are stored directly (no child operators)
+        assert len(opCache.children) == 0
+
+        for y in [0, 20, 40]:
+            opCache.Output( make_key[0:1, 0:20, y:y+20, 0:10, 0:1] ).wait()
+        assert opCache.usedMemory() == 3 * blockBytes
+        assert mgr.chargedBytes() == 3 * blockBytes
+
+        # The least recently used block is evicted, the others stay cached.
+        data = opCache.Output( make_key[0:1, 0:20, 60:80, 0:10, 0:1] ).wait()
+        assert (data == self.data[0:1, 0:20, 60:80, 0:10, 0:1]).all()
+        assert opCache.usedMemory() == 3 * blockBytes
+        assert mgr.chargedBytes() == 3 * blockBytes
+
+        oldAccessCount = opProvider.accessCount
+        data = opCache.Output( make_key[0:1, 0:20, 20:80, 0:10, 0:1] ).wait()
+        assert (data == self.data[0:1, 0:20, 20:80, 0:10, 0:1]).all()
+        assert opProvider.accessCount == oldAccessCount
+
+        # The evicted block is refilled on demand
+        data = opCache.Output( make_key[0:1, 0:20, 0:20, 0:10, 0:1] ).wait()
+        assert (data == self.data[0:1, 0:20, 0:20, 0:10, 0:1]).all()
+        assert opProvider.accessCount > oldAccessCount
+
+        opCache.cleanUp()
+        assert mgr.chargedBytes() == 0
+
+    def testSpillToDisk(self):
+        opCache = self.opCache
+        opProvider = self.opProvider
+
+        # Room for 2 (outer) blocks in RAM, and more on disk
+        tmpdir = tempfile.mkdtemp()
+        mgr = ArrayCacheMemoryMgr()
+        blockBytes = 20*20*10 * self.data.dtype.itemsize
+        mgr.setBudget( 2.5 * blockBytes )
+        mgr.setSpillStore( BlockSpillStore(10 * blockBytes, tmpdir) )
+        mgr.setEvictionPolicy( ArrayCacheMemoryMgr.LRU )
+        opCache._memory_manager = mgr
+
+        try:
+            for y in [0, 20, 40]:
+                opCache.Output( make_key[0:1, 0:20, y:y+20, 0:10, 0:1] ).wait()
+            assert opCache.usedMemory() == 2 * blockBytes
+            assert mgr.spillStore().storedBytes() == blockBytes
+
+            # The evicted block is reloaded from disk, not recomputed
+            oldAccessCount = opProvider.accessCount
+            data = opCache.Output( make_key[0:1, 0:20, 0:20, 0:10, 0:1] ).wait()
+            assert (data == self.data[0:1, 0:20, 0:20, 0:10, 0:1]).all()
+            assert opProvider.accessCount == oldAccessCount
+
+            # A dirty notification discards the spilled copy of the block
+            # (that's now the block at y=20..40)
+            assert mgr.spillStore().storedBytes() == blockBytes
+            opProvider.Input.setDirty( make_key[0:1, 0:20, 25:30, 0:10, 0:1] )
+            assert mgr.spillStore().storedBytes() == 0
+
+            data = opCache.Output( make_key[0:1, 0:20, 20:40, 0:10, 0:1] ).wait()
+            assert (data == self.data[0:1, 0:20, 20:40, 0:10, 0:1]).all()
+            assert opProvider.accessCount > oldAccessCount
+        finally:
+            mgr.setSpillStore(None)
+            shutil.rmtree(tmpdir)
+
 if __name__ == "__main__":
     import sys
     import nose
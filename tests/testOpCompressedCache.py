@@ -26,10 +26,12 @@ import functools
 
 import numpy
 import vigra
+import h5py
 
 from lazyflow.graph import Graph
 from lazyflow.operators import OpCompressedCache, OpArrayPiper
 from lazyflow.utility.slicingtools import slicing2shape
+from lazyflow.utility.blockCodecs import availableCodecs
 
 logger = logging.getLogger("tests.testOpCompressedCache")
 cacheLogger = logging.getLogger("lazyflow.operators.opCompressedCache")
@@ -300,6 +302,79 @@ class TestOpCompressedCache( object ):
         assert (readData == expectedData).all(), "Incorrect output!"
         
 
+    def testCodecs(self):
+        sampleData = numpy.indices((100, 200, 150), dtype=numpy.float32).sum(0)
+        sampleData = sampleData.view( vigra.VigraArray )
+        sampleData.axistags = vigra.defaultAxistags('xyz')
+        
+        graph = Graph()
+        opData = OpArrayPiper( graph=graph )
+        opData.Input.setValue( sampleData )
+        
+        op = OpCompressedCache( parent=None, graph=graph )
+        op.BlockShape.setValue( [100, 75, 50] )
+        op.Input.connect( opData.Output )
+
+        slicing = numpy.s_[ 0:100, 50:150, 75:150 ]
+        expectedData = sampleData[slicing].view(numpy.ndarray)
+        for codec in availableCodecs():
+            # Changing the codec only affects new blocks
+            op.Codec.setValue( codec )
+            opData.Input.setDirty( slice(None) )
+            readData = op.Output[slicing].wait()
+            assert (readData == expectedData).all(), "Incorrect output for codec {}".format( codec )
+
+            # Memory accounting is exact: the size of the compressed blocks
+            stored_bytes = sum( block.nbytes for block in op._blocks.values() )
+            assert stored_bytes > 0
+            assert op.usedMemory() == stored_bytes
+            if codec == 'none':
+                assert stored_bytes == 4 * 100*75*50 * 4
+            else:
+                assert stored_bytes < 4 * 100*75*50 * 4
+
+        try:
+            op.Codec.setValue( 'no-such-codec' )
+        except ValueError:
+            pass
+        else:
+            assert False, "Expected a ValueError for an unknown codec."
+
+    def testHdf5RoundTrip(self):
+        sampleData = numpy.indices((100, 200, 150), dtype=numpy.float32).sum(0)
+        sampleData = sampleData.view( vigra.VigraArray )
+        sampleData.axistags = vigra.defaultAxistags('xyz')
+        
+        graph = Graph()
+        opData = OpArrayPiper( graph=graph )
+        opData.Input.setValue( sampleData )
+        
+        op = OpCompressedCache( parent=None, graph=graph )
+        op.BlockShape.setValue( [100, 75, 50] )
+        op.Input.connect( opData.Output )
+
+        # Export one block as an hdf5 dataset (converted on demand)
+        mem_file = h5py.File('testHdf5RoundTrip', driver='core', backing_store=False, mode='w')
+        block_slicing = numpy.s_[ 0:100, 75:150, 50:100 ]
+        op.OutputHdf5[block_slicing].writeInto( mem_file ).wait()
+        block_name = mem_file.keys()[0]
+        assert (mem_file[block_name][:] == sampleData[block_slicing].view(numpy.ndarray)).all()
+
+        # Import it into a fresh cache (with a different input)
+        zeroData = numpy.zeros_like( sampleData ).view( vigra.VigraArray )
+        zeroData.axistags = vigra.defaultAxistags('xyz')
+        opData2 = OpArrayPiper( graph=graph )
+        opData2.Input.setValue( zeroData )
+        op2 = OpCompressedCache( parent=None, graph=graph )
+        op2.BlockShape.setValue( [100, 75, 50] )
+        op2.Input.connect( opData2.Output )
+        op2.InputHdf5[block_slicing] = mem_file[block_name]
+
+        assert (op2.Output[block_slicing].wait() == sampleData[block_slicing].view(numpy.ndarray)).all()
+        assert op2.CleanBlocks.value == [ [(0,75,50), (100,150,100)] ]
+        mem_file.close()
+        
+
 if __name__ == "__main__":
     # Set up logging for debug
     logHandler = logging.StreamHandler( sys.stdout )
@@ -0,0 +1,159 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import numpy
+import vigra
+from lazyflow.graph import Graph
+from lazyflow.operators.opArrayPiper import OpArrayPiper
+from lazyflow.operators.generic import OpPixelOperator, OpDtypeView, OpSingleChannelSelector, _tileSlicings
+
+class OpPixelOperatorWithAccessCount(OpPixelOperator):
+    def __init__(self, *args, **kwargs):
+        super(OpPixelOperatorWithAccessCount, self).__init__(*args, **kwargs)
+        self.accessCount = 0
+
+    def execute(self, slot, subindex, roi, result):
+        self.accessCount += 1
+        return super(OpPixelOperatorWithAccessCount, self).execute(slot, subindex, roi, result)
+
+    # Counting accesses doesn't change what execute() computes, so this operator is still fusable.
+    _elementwiseStage = OpPixelOperator._elementwiseStage
+
+class OpPixelOperatorWithOffset(OpPixelOperator):
+    """
+    Overrides execute() to compute something different than its Function, 
+    so it must not be fused with its neighbors.
+    """
+    def execute(self, slot, subindex, roi, result):
+        super(OpPixelOperatorWithOffset, self).execute(slot, subindex, roi, result)
+        result += 10
+        return result
+
+class TestOpPixelOperator(object):
+
+    def setUp(self):
+        self.graph = Graph()
+        self.data = numpy.random.randint( 0, 100, size=(2,30,40,3) ).astype(numpy.uint8)
+        self.data = vigra.taggedView( self.data, 'txyc' )
+        self.opProvider = OpArrayPiper( graph=self.graph )
+        self.opProvider.Input.setValue( self.data )
+
+    def _pixelOp(self, upstream, function, op_type=OpPixelOperator):
+        op = op_type( graph=self.graph )
+        op.Input.connect( upstream )
+        op.Function.setValue( function )
+        return op
+
+    def testBasic(self):
+        op = self._pixelOp( self.opProvider.Output, lambda a: a*2 )
+        assert op.Output.meta.dtype == numpy.uint8
+        result = op.Output[:, 5:10, 10:20, :].wait()
+        assert (result == self.data[:, 5:10, 10:20, :]*2).all()
+
+    def testFusedChain(self):
+        """
+        In a chain of pixel-wise operators, only the last one executes.
+        The upstream operators' functions are applied in the same pass.
+        """
+        op1 = self._pixelOp( self.opProvider.Output, lambda a: numpy.asarray(a, numpy.float32) + 1, OpPixelOperatorWithAccessCount )
+
+        opView = OpDtypeView( graph=self.graph )
+        opView.Input.connect( op1.Output )
+        opView.OutputDtype.setValue( numpy.int32 )
+
+        op2 = self._pixelOp( opView.Output, lambda a: a % 7, OpPixelOperatorWithAccessCount )
+        assert op2.Output.meta.dtype == numpy.int32
+
+        # Small tiles, to make sure the chain is processed in several tiles.
+        OpPixelOperator.fusedTileSize = 100
+        try:
+            result = op2.Output[:, 5:25, :, 1:3].wait()
+        finally:
+            OpPixelOperator.fusedTileSize = 2**16
+
+        expected = ( numpy.asarray(self.data[:, 5:25, :, 1:3], numpy.float32) + 1 ).view(numpy.int32) % 7
+        assert result.dtype == numpy.int32
+        assert (result == expected).all()
+        assert op1.accessCount == 0, "Upstream operator should have been fused."
+        assert op2.accessCount == 1
+
+        # Results are the same without fusion.
+        OpPixelOperator.fuseElementwiseChains = False
+        try:
+            unfused = op2.Output[:, 5:25, :, 1:3].wait()
+        finally:
+            OpPixelOperator.fuseElementwiseChains = True
+        assert (unfused == result).all()
+        assert op1.accessCount == 1
+
+    def testChannelSelectionInChain(self):
+        op1 = self._pixelOp( self.opProvider.Output, lambda a: a + 1 )
+
+        opSelector = OpSingleChannelSelector( graph=self.graph )
+        opSelector.Input.connect( op1.Output )
+        opSelector.Index.setValue( 2 )
+
+        op2 = self._pixelOp( opSelector.Output, lambda a: a * 3 )
+        result = op2.Output[:, 5:25, 0:10, :].wait()
+        assert result.shape == (2,20,10,1)
+        assert (result == (self.data[:, 5:25, 0:10, 2:3] + 1) * 3).all()
+
+    def testNonFusableOperatorBreaksChain(self):
+        op1 = self._pixelOp( self.opProvider.Output, lambda a: a + 1, OpPixelOperatorWithAccessCount )
+        opPiper = OpArrayPiper( graph=self.graph )
+        opPiper.Input.connect( op1.Output )
+        op2 = self._pixelOp( opPiper.Output, lambda a: a * 2, OpPixelOperatorWithAccessCount )
+
+        result = op2.Output[:].wait()
+        assert (result == (self.data + 1) * 2).all()
+        assert op1.accessCount == 1
+        assert op2.accessCount == 1
+
+    def testOverriddenExecuteBreaksChain(self):
+        """
+        Subclasses that override execute() don't inherit the _elementwiseStage of their base class.
+        """
+        assert OpPixelOperatorWithOffset._elementwiseStage is None
+        op1 = self._pixelOp( self.opProvider.Output, lambda a: a + 1, OpPixelOperatorWithOffset )
+        op2 = self._pixelOp( op1.Output, lambda a: a * 2 )
+
+        result = op2.Output[:].wait()
+        assert (result == (self.data + 11) * 2).all()
+
+        op3 = self._pixelOp( op2.Output, lambda a: a + 1, OpPixelOperatorWithOffset )
+        result = op3.Output[:].wait()
+        assert (result == (self.data + 11) * 2 + 11).all()
+
+    def testTileSlicings(self):
+        for shape in [ (10,), (3,4,5), (7,1,300), (2,2000) ]:
+            coverage = numpy.zeros( shape, dtype=int )
+            for tileSlicing in _tileSlicings( shape, 100 ):
+                coverage[tileSlicing] += 1
+                assert coverage[tileSlicing].size <= max( 100, shape[-1] )
+            assert (coverage == 1).all(), "Tiles must cover the whole array exactly once."
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
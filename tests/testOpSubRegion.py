@@ -20,10 +20,28 @@
 #		   http://ilastik.org/license/
 ###############################################################################
 import numpy
-from lazyflow.graph import Graph
+from lazyflow.graph import Graph, Operator, InputSlot, OutputSlot
 from lazyflow.operators.opArrayPiper import OpArrayPiper
 from lazyflow.operators.generic import OpSubRegion
 
+class OpStoredArraySource(Operator):
+    """
+    Provides views of an internal array (like a cache does).
+    """
+    Shape = InputSlot()
+    Output = OutputSlot()
+
+    def setupOutputs(self):
+        self.data = numpy.random.random( self.Shape.value )
+        self.Output.meta.shape = self.data.shape
+        self.Output.meta.dtype = self.data.dtype
+
+    def execute(self, slot, subindex, roi, result):
+        return self.data[roi.toSlice()]
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.Output.setDirty()
+
 class TestOpSubRegion(object):
     
     def testOutput(self):
@@ -40,6 +58,56 @@ class TestOpSubRegion(object):
         subData = opSubRegion.Output( start=( 0,5,10,1,0 ), stop=( 1,10,20,3,1 ) ).wait()
         assert (subData == data[0:1, 25:30, 40:50, 6:8, 0:1]).all()
 
+    def testPassthrough(self):
+        """
+        OpArrayPiper and OpSubRegion are passthrough operators:
+        Without a destination, the result is a view of the upstream data (no copies).
+        With a destination, the data is written directly into it.
+        """
+        graph = Graph()
+        opProvider = OpStoredArraySource(graph=graph)
+        opProvider.Shape.setValue( (1,100,100,10,1) )
+        data = opProvider.data
+        
+        opSubRegion = OpSubRegion( graph=graph )
+        opSubRegion.Input.connect( opProvider.Output )
+        opSubRegion.Roi.setValue( ((0,20,30,5,0), (1,30,50,8,1)) )
+
+        opPiper = OpArrayPiper(graph=graph)
+        opPiper.Input.connect( opSubRegion.Output )
+
+        expected = data[0:1, 25:30, 40:50, 6:8, 0:1]
+        subData = opPiper.Output( start=( 0,5,10,1,0 ), stop=( 1,10,20,3,1 ) ).wait()
+        assert type(subData) is numpy.ndarray
+        assert (subData == expected).all()
+        assert numpy.may_share_memory( subData, data )
+
+        destination = numpy.zeros_like( expected )
+        result = opPiper.Output( start=( 0,5,10,1,0 ), stop=( 1,10,20,3,1 ) ).writeInto( destination ).wait()
+        assert result is destination
+        assert (destination == expected).all()
+
+    def testPassthroughDoesNotExposeInputValue(self):
+        """
+        A pass-through result must not be a view of an array that was passed to setValue(),
+        since modifying the result in-place would silently change the user's input data.
+        """
+        graph = Graph()
+        data = numpy.random.random( (1,100,100,10,1) )
+        original = data.copy()
+        opProvider = OpArrayPiper(graph=graph)
+        opProvider.Input.setValue(data)
+
+        opSubRegion = OpSubRegion( graph=graph )
+        opSubRegion.Input.connect( opProvider.Output )
+        opSubRegion.Roi.setValue( ((0,20,30,5,0), (1,30,50,8,1)) )
+
+        for op in (opProvider, opSubRegion):
+            subData = op.Output( start=( 0,5,10,1,0 ), stop=( 1,10,20,3,1 ) ).wait()
+            assert not numpy.may_share_memory( subData, data )
+            subData[:] = -1
+            assert (data == original).all(), "Modifying the result changed the input value."
+
     def testDirtyPropagation(self):
         graph = Graph()
         data = numpy.random.random( (1,100,100,10,1) )
@@ -337,6 +337,31 @@ class OpDirectConnection(graph.Operator):
     def setupOutputs(self):
         self.Output.connect( self.Input )
 
+class TestPassthroughOutputs(object):
+
+    def test_not_inherited_by_overridden_execute(self):
+        """
+        A passthroughOutputs declaration belongs to the execute() implementation it was written for.
+        """
+        from lazyflow.operators.opArrayPiper import OpArrayPiper
+
+        class OpSubclassWithOwnExecute(OpArrayPiper):
+            def execute(self, slot, subindex, roi, result):
+                assert result is not None
+                result[:] = 1
+                return result
+
+        class OpSubclassWithoutExecute(OpArrayPiper):
+            pass
+
+        assert OpArrayPiper.passthroughOutputs == ('Output',)
+        assert OpSubclassWithoutExecute.passthroughOutputs == ('Output',)
+        assert OpSubclassWithOwnExecute.passthroughOutputs == ()
+
+        op = OpSubclassWithOwnExecute( graph=graph.Graph() )
+        op.Input.setValue( numpy.zeros( (10,10) ) )
+        assert (op.Output[:].wait() == 1).all()
+
 class TestSlotStates(object):
 
     def setup(self):
@@ -0,0 +1,140 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import gc
+import numpy
+from lazyflow.graph import Graph
+from lazyflow.request import RequestLock
+from lazyflow.operators.opArrayPiper import OpArrayPiper
+
+class TestOperatorProfiler(object):
+
+    def setUp(self):
+        self.graph = Graph()
+        self.data = numpy.random.random( (10,20,30) ).astype( numpy.float32 )
+        self.op1 = OpArrayPiper( graph=self.graph )
+        self.op1.Input.setValue( self.data )
+        self.op2 = OpArrayPiper( graph=self.graph )
+        self.op2.Input.connect( self.op1.Output )
+
+    def testDisabledByDefault(self):
+        self.op2.Output[:].wait()
+        report = self.graph.profiling_report()
+        assert report['classes'] == {}
+        assert report['instances'] == []
+
+    def testReport(self):
+        self.graph.enable_profiling()
+        try:
+            for _ in range(3):
+                self.op2.Output[:].wait()
+        finally:
+            self.graph.enable_profiling(False)
+
+        report = self.graph.profiling_report()
+        class_stats = report['classes']['OpArrayPiper']
+        assert class_stats['calls'] == 6
+        assert class_stats['output_bytes'] == 6 * self.data.nbytes
+
+        instances = report['instances']
+        assert len(instances) == 2
+        assert set( d['id'] for d in instances ) == set( [id(self.op1), id(self.op2)] )
+        for d in instances:
+            assert d['calls'] == 3
+            assert d['wall_time'] >= d['wait_time'] >= 0.0
+
+        # op2 spends its time waiting for op1
+        op2_stats = filter( lambda d: d['id'] == id(self.op2), instances )[0]
+        assert op2_stats['wait_time'] > 0.0
+
+        # Nothing is recorded after profiling was disabled
+        self.op2.Output[:].wait()
+        assert self.graph.profiling_report()['classes']['OpArrayPiper']['calls'] == 6
+
+        self.graph.reset_profiling()
+        assert self.graph.profiling_report()['instances'] == []
+
+    def testDeletedOperator(self):
+        """
+        The stats of a deleted operator must not show up as (or be merged into) the stats of a new operator.
+        """
+        self.graph.enable_profiling()
+        try:
+            op3 = OpArrayPiper( graph=self.graph )
+            op3.Input.setValue( self.data )
+            op3.Output[:].wait()
+            op3.cleanUp()
+            del op3
+            gc.collect()
+
+            op4 = OpArrayPiper( graph=self.graph )
+            op4.name = "op4"
+            op4.Input.setValue( self.data )
+            op4.Output[:].wait()
+        finally:
+            self.graph.enable_profiling(False)
+
+        report = self.graph.profiling_report()
+        assert report['classes']['OpArrayPiper']['calls'] == 2
+
+        instances = report['instances']
+        assert len(instances) == 1
+        op4_stats = filter( lambda d: d['id'] == id(op4), instances )[0]
+        assert op4_stats['operator'] == "op4"
+        assert op4_stats['calls'] == 1
+
+    def testSharedRegistry(self):
+        """
+        The profiler shares its per-operator registry with the RequestLock instrumentation,
+        but each of them only reports (and resets) its own statistics.
+        """
+        graph2 = Graph()
+        op3 = OpArrayPiper( graph=graph2 )
+        op3.Input.setValue( self.data )
+
+        self.graph.enable_profiling()
+        graph2.enable_profiling()
+        RequestLock.reset_instrumentation()
+        RequestLock.enable_instrumentation()
+        try:
+            self.op2.Output[:].wait()
+            op3.Output[:].wait()
+        finally:
+            RequestLock.enable_instrumentation(False)
+            graph2.enable_profiling(False)
+            self.graph.enable_profiling(False)
+
+        assert len( self.graph.profiling_report()['instances'] ) == 2
+        assert [ d['id'] for d in graph2.profiling_report()['instances'] ] == [ id(op3) ]
+
+        self.graph.reset_profiling()
+        assert self.graph.profiling_report()['instances'] == []
+        assert [ d['id'] for d in graph2.profiling_report()['instances'] ] == [ id(op3) ]
+        RequestLock.reset_instrumentation()
+        assert [ d['id'] for d in graph2.profiling_report()['instances'] ] == [ id(op3) ]
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
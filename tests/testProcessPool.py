@@ -0,0 +1,139 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import os
+import time
+import threading
+import numpy
+from lazyflow.request import Request, ProcessBoundRequest
+
+# Workloads must be defined at module level so they can be pickled.
+def _pid():
+    return os.getpid()
+
+def _sum_of_squares(n):
+    return sum( i*i for i in xrange(n) )
+
+def _fill(value, destination):
+    destination[...] = value
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+def _fail():
+    raise ValueError("Expected failure")
+
+def _die():
+    os._exit(1)
+
+class TestProcessBoundRequest(object):
+
+    @classmethod
+    def setupClass(cls):
+        ProcessBoundRequest.reset_process_pool(2)
+
+    @classmethod
+    def teardownClass(cls):
+        ProcessBoundRequest.reset_process_pool()
+
+    def testBasic(self):
+        assert ProcessBoundRequest( _sum_of_squares, 1000 ).wait() == _sum_of_squares(1000)
+        assert ProcessBoundRequest( _pid ).wait() != os.getpid()
+
+    def testWriteInto(self):
+        destination = numpy.zeros( (10,20), dtype=numpy.float32 )
+        result = ProcessBoundRequest( _fill, 3.5 ).writeInto(destination).wait()
+        assert result is destination
+        assert (destination == 3.5).all()
+
+    def testWithinRequest(self):
+        """
+        Process-bound requests can be spawned and waited for from ordinary requests.
+        """
+        def spawn_many():
+            reqs = [ ProcessBoundRequest( _sum_of_squares, n ) for n in range(10) ]
+            for req in reqs:
+                req.submit()
+            return [ req.wait() for req in reqs ]
+
+        results = Request( spawn_many ).wait()
+        assert results == [ _sum_of_squares(n) for n in range(10) ]
+
+    def testFailure(self):
+        failures = []
+        req = ProcessBoundRequest( _fail )
+        req.notify_failed( lambda ex, exc_info: failures.append(ex) )
+        try:
+            req.wait()
+        except ValueError:
+            pass
+        else:
+            assert False, "Expected the workload's exception to be re-raised."
+        assert len(failures) == 1
+        assert isinstance( failures[0], ValueError )
+
+    def testWorkerDies(self):
+        """
+        If the worker process dies, the request fails instead of waiting forever.
+        """
+        req = ProcessBoundRequest( _die )
+        try:
+            req.wait()
+        except RuntimeError:
+            pass
+        else:
+            assert False, "Expected the lost workload to be reported as a failure."
+
+        # The pool replaces the dead worker, so later workloads still run.
+        assert ProcessBoundRequest( _sum_of_squares, 10 ).wait() == sum( i*i for i in range(10) )
+
+    def testCancel(self):
+        """
+        If a process-bound request is cancelled while its workload runs, the result is discarded.
+        """
+        started = threading.Event()
+        child_cancelled = threading.Event()
+        def parent():
+            # (Long enough that it can't finish before it's cancelled.)
+            child = ProcessBoundRequest( _sleep, 2.0 )
+            child.notify_cancelled( child_cancelled.set )
+            # (Submit before signalling: A child that was never submitted would never be notified.)
+            child.submit()
+            started.set()
+            child.wait()
+
+        req = Request( parent )
+        req.submit()
+        started.wait()
+        req.cancel()
+        assert req.finished_event.wait(10.0)
+        assert req.cancelled
+        # The child only notices the cancellation once its workload has returned from the other process.
+        assert child_cancelled.wait(10.0)
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
@@ -0,0 +1,104 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import time
+from functools import partial
+
+import nose
+
+from lazyflow.request import Request, RequestPool
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+class TestRequestAsyncio(object):
+
+    def setUp(self):
+        if asyncio is None:
+            raise nose.SkipTest
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def testResult(self):
+        def f(x):
+            time.sleep(0.01)
+            return 2*x
+        futures = [ Request( partial(f, i) ).as_future(self.loop) for i in range(100) ]
+        results = self.loop.run_until_complete( asyncio.gather(*futures) )
+        assert list(results) == [ 2*i for i in range(100) ]
+
+    def testFailure(self):
+        def f():
+            raise ValueError("Expected failure")
+        future = Request( f ).as_future(self.loop)
+        try:
+            self.loop.run_until_complete( future )
+        except ValueError:
+            pass
+        else:
+            assert False, "Expected the request's exception to be raised."
+
+    def testCancelFuture(self):
+        """
+        Cancelling the future cancels the request.
+        """
+        def f():
+            while True:
+                time.sleep(0.01)
+                Request.raise_if_cancelled()
+
+        req = Request( f )
+        future = req.as_future(self.loop)
+        self.loop.call_later( 0.1, future.cancel )
+        try:
+            self.loop.run_until_complete( future )
+        except asyncio.CancelledError:
+            pass
+        else:
+            assert False, "Expected the future to be cancelled."
+        assert req.finished_event.wait(10.0)
+        assert req.cancelled
+
+    def testPool(self):
+        results = []
+        def f(i):
+            time.sleep(0.01)
+            results.append(i)
+
+        pool = RequestPool()
+        for i in range(20):
+            pool.add( Request( partial(f, i) ) )
+        assert self.loop.run_until_complete( pool.as_future(self.loop) ) is None
+        assert sorted(results) == range(20)
+
+if __name__ == "__main__":
+    import sys
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
@@ -0,0 +1,127 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import threading
+import numpy
+from lazyflow.graph import Graph, Operator, InputSlot, OutputSlot
+from lazyflow.request import Request
+from lazyflow.roi import roiToSlice
+
+class OpBlockingSource(Operator):
+    """
+    Produces a fixed array, but each execute() call blocks until the test lets it proceed.
+    """
+    Input = InputSlot() # Unused.  Just here so the operator gets configured.
+    Output = OutputSlot()
+
+    def __init__(self, *args, **kwargs):
+        super(OpBlockingSource, self).__init__(*args, **kwargs)
+        self.data = numpy.arange(100*100, dtype=numpy.uint32).reshape((100,100))
+        self.execution_count = 0
+        self.started = threading.Event()
+        self.proceed = threading.Event()
+
+    def setupOutputs(self):
+        self.Output.meta.shape = self.data.shape
+        self.Output.meta.dtype = self.data.dtype
+
+    def execute(self, slot, subindex, roi, result):
+        self.execution_count += 1
+        self.started.set()
+        self.proceed.wait()
+        Request.raise_if_cancelled()
+        result[:] = self.data[roiToSlice(roi.start, roi.stop)]
+        return result
+
+    def propagateDirty(self, slot, subindex, roi):
+        pass
+
+class TestRequestCoalescing(object):
+
+    def setUp(self):
+        self.op = OpBlockingSource( graph=Graph() )
+        self.op.Input.setValue(True)
+        self.op.Output.enableRequestCoalescing()
+
+    def testContainedRoiIsReused(self):
+        req1 = self.op.Output[0:100, 0:100]
+        req1.submit()
+        assert self.op.started.wait(10.0)
+
+        req2 = self.op.Output[10:20, 30:40]
+        req2.submit()
+        self.op.proceed.set()
+
+        assert (req2.wait() == self.op.data[10:20, 30:40]).all()
+        assert (req1.wait() == self.op.data).all()
+        assert self.op.execution_count == 1
+
+        # Once the first request is finished, nothing is reused anymore.
+        assert (self.op.Output[10:20, 30:40].wait() == self.op.data[10:20, 30:40]).all()
+        assert self.op.execution_count == 2
+
+    def testWriteIntoAttachedRequest(self):
+        req1 = self.op.Output[0:100, 0:100]
+        req1.submit()
+        assert self.op.started.wait(10.0)
+
+        destination = numpy.zeros( (10,10), dtype=numpy.uint32 )
+        req2 = self.op.Output[50:60, 50:60].writeInto(destination)
+        self.op.proceed.set()
+        req2.wait()
+        assert (destination == self.op.data[50:60, 50:60]).all()
+        assert self.op.execution_count == 1
+
+    def testOverlappingRoiIsNotReused(self):
+        req1 = self.op.Output[0:50, 0:50]
+        req1.submit()
+        assert self.op.started.wait(10.0)
+
+        req2 = self.op.Output[40:60, 40:60]
+        self.op.proceed.set()
+        assert (req2.wait() == self.op.data[40:60, 40:60]).all()
+        req1.wait()
+        assert self.op.execution_count == 2
+
+    def testOriginalCancelled(self):
+        req1 = self.op.Output[0:100, 0:100]
+        req1.submit()
+        assert self.op.started.wait(10.0)
+
+        # Attached, but not waiting yet.
+        req2 = self.op.Output[10:20, 30:40]
+
+        req1.cancel()
+        self.op.proceed.set()
+        assert req1.finished_event.wait(10.0)
+        assert req1.cancelled
+
+        # The original was cancelled, so the data is computed from scratch.
+        assert (req2.wait() == self.op.data[10:20, 30:40]).all()
+        assert self.op.execution_count == 2
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
@@ -19,7 +19,7 @@
 # This information is also available on the ilastik web site at:
 #		   http://ilastik.org/license/
 ###############################################################################
-from lazyflow.request.request import Request, RequestLock, SimpleRequestCondition, RequestPool
+from lazyflow.request.request import Request, RequestLock, SimpleRequestCondition, RequestPool, WaitTimer
 import os
 import time
 import random
@@ -309,6 +309,29 @@ class TestRequest(object):
         else:
             assert False, "Expected a Request.InvalidRequestException because we're waiting for a request that's already been cancelled."
  
+    @traceLogged(traceLogger)
+    def test_cancel_after_finish(self):
+        """
+        Cancelling a request that has already finished has no effect: Its result is still available.
+        """
+        def child():
+            return 42
+
+        def parent():
+            c = Request(child)
+            c.wait()
+            c.cancel()
+            assert not c.cancelled
+            return c.wait()
+
+        assert Request(parent).wait() == 42
+
+        req = Request(child)
+        req.wait()
+        req.cancel()
+        assert not req.cancelled
+        assert req.wait() == 42
+
     @traceLogged(traceLogger)
     def test_uncancellable(self):
         """
@@ -616,6 +639,108 @@ class TestRequest(object):
         logger.debug( "consumed: {}".format(consumed) )
         assert set(consumed) == set( range(N_ELEMENTS) ), "Expected set(range(N_ELEMENTS)), got {}".format( consumed )
  
+    def testRequestLockInstrumentation(self):
+        """
+        With instrumentation enabled, RequestLocks count acquisitions and wait times,
+        and aggregate them per operator.
+        """
+        class FakeOperator(object):
+            name = "FakeOperator"
+        class FakeSlot(object):
+            name = "Output"
+            operator = FakeOperator()
+        class SlotWorkload(object):
+            # Mimics the workload of a request created by Slot.get()
+            slot = FakeSlot()
+            def __init__(self, fn):
+                self.fn = fn
+            def __call__(self):
+                return self.fn()
+
+        lock = RequestLock()
+        cond = SimpleRequestCondition()
+        def hold_lock():
+            # The lock is acquired by a child request, which is attributed to its parent's slot.
+            def child():
+                with lock:
+                    assert lock.stats.holder == "FakeOperator.Output"
+                    time.sleep(0.01)
+                with cond:
+                    pass
+            Request( child ).wait()
+
+        RequestLock.reset_instrumentation()
+        RequestLock.enable_instrumentation()
+        try:
+            reqs = [ Request( SlotWorkload(hold_lock) ) for _ in range(10) ]
+            for req in reqs:
+                req.submit()
+            for req in reqs:
+                req.wait()
+        finally:
+            RequestLock.enable_instrumentation(False)
+
+        # Nothing is recorded while instrumentation is disabled
+        with lock:
+            pass
+
+        stats = lock.stats
+        assert stats.acquisitions == 10
+        assert stats.holder is None
+        assert stats.max_hold_time >= 0.01
+        assert stats.slowest_holder == "FakeOperator.Output"
+        assert stats.total_wait_time >= stats.max_wait_time >= 0.0
+        assert cond.stats.acquisitions == 10
+
+        report = RequestLock.contention_report()
+        assert len(report) == 1
+        assert report[0]['operator'] == "FakeOperator"
+        assert report[0]['acquisitions'] == 20 # lock and cond
+        RequestLock.reset_instrumentation()
+        assert RequestLock.contention_report() == []
+
+    def testRequestLockStatsOfDeletedOperator(self):
+        """
+        The per-operator lock statistics are discarded when the operator is deleted,
+        so they can't be attributed to a new operator that gets the same id().
+        """
+        class FakeOperator(object):
+            name = "FakeOperator"
+        class FakeSlot(object):
+            name = "Output"
+            def __init__(self, operator):
+                self.operator = operator
+        class SlotWorkload(object):
+            def __init__(self, slot, fn):
+                self.slot = slot
+                self.fn = fn
+            def __call__(self):
+                return self.fn()
+
+        lock = RequestLock()
+        def acquire():
+            with lock:
+                pass
+
+        RequestLock.reset_instrumentation()
+        RequestLock.enable_instrumentation()
+        try:
+            op = FakeOperator()
+            req = Request( SlotWorkload( FakeSlot(op), acquire ) )
+            req.submit()
+            req.wait()
+            del req
+            report = [ d for d in RequestLock.contention_report() if d['operator'] is not None ]
+            assert len(report) == 1
+            assert report[0]['id'] == id(op)
+            assert report[0]['acquisitions'] == 1
+
+            del op
+            gc.collect()
+            assert [ d for d in RequestLock.contention_report() if d['operator'] is not None ] == []
+        finally:
+            RequestLock.enable_instrumentation(False)
+
     def testRequestLockSemantics(self):
         """
         To be used with threading.Condition, RequestLock objects MUST NOT have RLock semantics.
@@ -702,6 +827,173 @@ class TestRequest(object):
          
         # Set it back to what it was
         Request.reset_thread_pool()
+
+    def testWorkStealingThreadPool(self):
+        Request.reset_thread_pool(num_workers=4, work_stealing=True)
+        try:
+            def leaf(i):
+                return i
+
+            def branch(n):
+                reqs = [ Request( partial(leaf, i) ) for i in range(n) ]
+                for req in reqs:
+                    req.submit()
+                return sum( req.wait() for req in reqs )
+
+            def root():
+                reqs = [ Request( partial(branch, 100) ) for _ in range(20) ]
+                for req in reqs:
+                    req.submit()
+                return sum( req.wait() for req in reqs )
+
+            assert Request( root ).wait() == 20 * sum(range(100))
+        finally:
+            # Set it back to what it was
+            Request.reset_thread_pool()
+
+    def testInlineChildRequests(self):
+        """
+        Child requests that are waited for by their creator run inline,
+        and the parent doesn't hold on to them once they're finished.
+        """
+        def child(i):
+            return i
+
+        def parent():
+            current = Request._current_request()
+            total = 0
+            for i in range(100):
+                req = Request( partial(child, i) )
+                total += req.wait()
+                assert req.greenlet is None
+                assert req.parent_request is None
+                assert req not in current.child_requests
+            assert len(current.child_requests) == 0
+            assert len(current.blocking_requests) == 0
+            return total
+
+        req = Request( parent )
+        req.submit()
+        assert req.wait() == sum(range(100))
+
+        # The finished_event is created on demand, even after the request has finished.
+        assert req.finished_event.is_set()
+
+    def testSubmitMany(self):
+        """
+        Requests submitted as a batch are all executed, whether they are submitted 
+        from a foreign thread or from within another request.
+        """
+        def square(i):
+            return i*i
+
+        requests = [ Request( partial(square, i) ) for i in range(200) ]
+        requests[0].submit() # Already started requests are skipped.
+        Request.submit_many( requests )
+        assert all( req.started for req in requests )
+        assert [ req.wait() for req in requests ] == [ i*i for i in range(200) ]
+
+        def parent():
+            children = [ Request( partial(square, i) ) for i in range(200) ]
+            Request.submit_many( children )
+            return sum( req.wait() for req in children )
+
+        assert Request( parent ).wait() == sum( i*i for i in range(200) )
+
+    def testPriorityClasses(self):
+        """
+        Requests of a more urgent priority class are started first, and a running 
+        request of a less urgent class gives up its worker at its next wait().
+        """
+        Request.reset_thread_pool(num_workers=1)
+        try:
+            events = []
+            background_started = threading.Event()
+
+            def noop():
+                pass
+
+            def background():
+                background_started.set()
+                for _ in range(50):
+                    time.sleep(0.01)
+                    Request( noop ).wait()
+                events.append('background')
+
+            def interactive():
+                events.append('interactive')
+
+            with Request.priority_class_context(Request.BACKGROUND):
+                background_req = Request( background )
+            assert background_req.priority_class == Request.BACKGROUND
+            background_req.submit()
+            background_started.wait()
+
+            with Request.priority_class_context(Request.INTERACTIVE):
+                interactive_req = Request( interactive )
+            assert interactive_req.priority_class == Request.INTERACTIVE
+            interactive_req.submit()
+
+            background_req.wait()
+            interactive_req.wait()
+            assert events == ['interactive', 'background'], "Wrong order: {}".format( events )
+
+            # Outside of any context, the default class is NORMAL
+            assert Request( noop ).priority_class == Request.NORMAL
+        finally:
+            # Set it back to what it was
+            Request.reset_thread_pool()
+
+    def testDetachedPriorityClassContext(self):
+        """
+        Requests created in a detached context are root requests, even within another request.
+        """
+        def noop():
+            pass
+
+        def f():
+            child = Request( noop )
+            with Request.priority_class_context(Request.BACKGROUND, detached=True):
+                detached = Request( noop )
+            assert child.parent_request is Request._current_request()
+            assert child.priority_class == Request.INTERACTIVE
+            assert detached.parent_request is None
+            assert detached.priority_class == Request.BACKGROUND
+            detached.submit()
+            return detached
+
+        with Request.priority_class_context(Request.INTERACTIVE):
+            req = Request( f )
+        req.submit()
+        detached = req.wait()
+        req.clean()
+        assert detached.wait() is None
+        assert not detached.cancelled
+
+    def testWaitTimer(self):
+        """
+        While wait times are tracked, the innermost WaitTimer of the waiting request is charged.
+        """
+        def slow():
+            time.sleep(0.2)
+
+        def f():
+            with WaitTimer() as outer:
+                with WaitTimer() as inner:
+                    Request( slow ).wait()
+                time.sleep(0.1) # Not waiting for a request
+            return outer.seconds, inner.seconds
+
+        Request._track_wait_time = True
+        try:
+            outer_seconds, inner_seconds = Request( f ).wait()
+        finally:
+            Request._track_wait_time = False
+        assert inner_seconds >= 0.2
+        assert outer_seconds == 0.0
+
+        # When wait times aren't tracked, the timers aren't charged.
+        assert Request( f ).wait() == (0.0, 0.0)
  
  
 class TestRequestExceptions(object):
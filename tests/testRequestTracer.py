@@ -0,0 +1,113 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import os
+import json
+import shutil
+import tempfile
+import numpy
+from lazyflow.graph import Graph
+from lazyflow.request import Request
+from lazyflow.operators.opArrayPiper import OpArrayPiper
+from lazyflow.utility import RequestTracer
+
+class TestRequestTracer(object):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree( self.tmpdir )
+
+    def testRequestLifeCycle(self):
+        def child():
+            return 42
+
+        def parent():
+            # Executed inline
+            a = Request( child ).wait()
+            # Executed on a worker while the parent is suspended
+            req = Request( child )
+            req.submit()
+            b = req.wait()
+            return a + b
+
+        with RequestTracer() as tracer:
+            root = Request( parent )
+            root.submit()
+            assert root.wait() == 84
+
+        # Nothing is recorded after the tracer was stopped.
+        num_events = len(tracer.events)
+        Request( child ).wait()
+        assert len(tracer.events) == num_events
+
+        events = tracer.events
+        spans = [ e for e in events if e['ph'] == 'b' ]
+        assert len(spans) == 3
+        assert len( [ e for e in events if e['ph'] == 'e' ] ) == 3
+        assert all( e['args']['status'] == 'finished' for e in events if e['ph'] == 'e' )
+
+        root_id = [ e['id'] for e in spans if e['name'] == 'parent' ][0]
+        assert [ e['args']['parent'] for e in spans if e['name'] == 'child' ] == [root_id, root_id]
+
+        instants = [ e['name'] for e in events if e['ph'] == 'n' ]
+        assert 'executed inline' in instants
+        assert 'assigned' in instants
+
+        # The root request executes on a worker thread (named in the trace metadata).
+        slices = [ e for e in events if e['ph'] == 'X' ]
+        assert slices
+        assert all( e['dur'] >= 0 for e in slices )
+        thread_names = dict( (e['tid'], e['args']['name']) for e in events if e['ph'] == 'M' )
+        assert any( thread_names[e['tid']].startswith('Worker') for e in slices if e['name'] == 'parent' )
+
+        filename = os.path.join( self.tmpdir, 'trace.json' )
+        tracer.save( filename )
+        with open( filename ) as f:
+            assert len( json.load(f)['traceEvents'] ) == len(events)
+
+    def testSlotLabels(self):
+        graph = Graph()
+        op = OpArrayPiper( graph=graph )
+        op.Input.setValue( numpy.zeros( (10,20), dtype=numpy.uint8 ) )
+        with RequestTracer() as tracer:
+            op.Output[2:4, 5:10].wait()
+
+        spans = [ e for e in tracer.events if e['ph'] == 'b' ]
+        assert len(spans) == 1
+        assert spans[0]['name'] == "{}.Output".format( op.name )
+        assert spans[0]['args']['roi_size'] == 10
+
+    def testMaxEvents(self):
+        tracer = RequestTracer( max_events=10 )
+        with tracer:
+            for _ in range(20):
+                Request( lambda: None ).wait()
+        assert len( [ e for e in tracer.events if e['ph'] != 'M' ] ) == 10
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
@@ -0,0 +1,123 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import numpy
+import vigra
+from lazyflow.graph import Graph
+from lazyflow.operators.opArrayPiper import OpArrayPiper
+from lazyflow.operators.generic import OpSubRegion, OpPixelOperator
+from lazyflow.operators.vigraOperators import OpPixelFeaturesPresmoothed
+from lazyflow.utility import planUpstreamRois
+
+class OpArrayPiperWithoutMapping(OpArrayPiper):
+    def execute(self, slot, subindex, roi, result):
+        return super(OpArrayPiperWithoutMapping, self).execute(slot, subindex, roi, result)
+
+class TestRoiPlanner(object):
+
+    def setUp(self):
+        self.graph = Graph()
+        self.data = numpy.random.random( (100,100) ).astype( numpy.float32 )
+        self.data = vigra.taggedView( self.data, 'xy' )
+
+        # opSource -> opSubRegion -> opPixel
+        self.opSource = OpArrayPiper( graph=self.graph )
+        self.opSource.Input.setValue( self.data )
+
+        self.opSubRegion = OpSubRegion( graph=self.graph )
+        self.opSubRegion.Input.connect( self.opSource.Output )
+        self.opSubRegion.Roi.setValue( ((10,20), (60,80)) )
+
+        self.opPixel = OpPixelOperator( graph=self.graph )
+        self.opPixel.Input.connect( self.opSubRegion.Output )
+        self.opPixel.Function.setValue( lambda a: a+1 )
+
+    def testPlan(self):
+        plan = planUpstreamRois( self.opPixel.Output, ((0,0), (10,10)) )
+        assert plan.rois.keys() == [ self.opPixel.Output, self.opSubRegion.Output, self.opSource.Output, self.opSource.Input ]
+        assert plan.sources == [ self.opSource.Input ]
+        assert plan.boundingRoi( self.opSource.Input ) == ( (10,20), (20,30) )
+        assert plan.boundingRoi( self.opSubRegion.Roi ) is None
+
+        requests = plan.prefetch()
+        assert len(requests) == 1
+        assert (requests[0].wait() == self.data[10:20, 20:30]).all()
+
+    def testMergedBranches(self):
+        # A second branch reads from opSource directly
+        opPixel2 = OpPixelOperator( graph=self.graph )
+        opPixel2.Input.connect( self.opSource.Output )
+        opPixel2.Function.setValue( lambda a: a+1 )
+
+        opSubRegion2 = OpSubRegion( graph=self.graph )
+        opSubRegion2.Input.connect( opPixel2.Output )
+        opSubRegion2.Roi.setValue( ((0,0), (50,50)) )
+
+        plan1 = planUpstreamRois( self.opPixel.Output, ((0,0), (10,10)) )
+        plan2 = planUpstreamRois( opSubRegion2.Output, ((40,40), (50,50)) )
+        for plan in [plan1, plan2]:
+            assert plan.sources == [ self.opSource.Input ]
+        assert plan2.boundingRoi( self.opSource.Input ) == ( (40,40), (50,50) )
+
+    def testOperatorWithoutMapping(self):
+        """
+        Planning stops at operators that don't declare a roi mapping.
+        Subclasses that override execute() don't inherit the mapping of their base class.
+        """
+        opOpaque = OpArrayPiperWithoutMapping( graph=self.graph )
+        opOpaque.Input.connect( self.opSource.Output )
+        self.opSubRegion.Input.connect( opOpaque.Output )
+
+        plan = planUpstreamRois( self.opPixel.Output, ((0,0), (10,10)) )
+        assert plan.sources == [ opOpaque.Output ]
+        assert self.opSource.Output not in plan.rois
+        assert plan.boundingRoi( opOpaque.Output ) == ( (10,20), (20,30) )
+
+    def testPixelFeatures(self):
+        """
+        The features operator plans its input region with the same halo it uses in execute().
+        """
+        data = vigra.taggedView( numpy.random.random( (100,100,1) ).astype( numpy.float32 ), 'xyc' )
+        opSource = OpArrayPiper( graph=self.graph )
+        opSource.Input.setValue( data )
+
+        opFeatures = OpPixelFeaturesPresmoothed( graph=self.graph )
+        opFeatures.Input.connect( opSource.Output )
+        opFeatures.Scales.setValue( [1.0] )
+        opFeatures.FeatureIds.setValue( ['GaussianSmoothing'] )
+        opFeatures.Matrix.setValue( numpy.ones( (1,1), dtype=bool ) )
+
+        # Halo: ceil(3.5*0.7) for the features plus ceil(3.5*1.0) for the presmoothing
+        plan = planUpstreamRois( opFeatures.Output, ((20,30,0), (40,50,1)) )
+        assert plan.sources == [ opSource.Input ]
+        assert plan.boundingRoi( opSource.Input ) == ( (13,23,0), (47,57,1) )
+
+        # The halo is clipped at the image border
+        plan = planUpstreamRois( opFeatures.Features[0], ((0,95,0), (10,100,1)) )
+        assert plan.boundingRoi( opSource.Input ) == ( (0,88,0), (17,100,1) )
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
@@ -1,5 +1,5 @@
 import numpy
-from lazyflow.roi import determineBlockShape, getIntersection
+from lazyflow.roi import determineBlockShape, getIntersection, getIntersectingBlocks, getIntersectingBlockStarts
 
 class Test_determineBlockShape(object):
     
@@ -56,6 +56,19 @@ class Test_getIntersection(object):
         intersection = getIntersection( roiA, roiB , assertIntersect=False)
         assert intersection is None, "Expected None because {} doesn't intersect with {}".format(  )
 
+class Test_getIntersectingBlockStarts(object):
+
+    def testMatchesGetIntersectingBlocks(self):
+        blockshape = (1, 10, 20, 7, 3)
+        rois = [ ((0,0,0,0,0), (1,10,20,7,3)),
+                 ((0,5,15,3,1), (1,31,20,22,3)),
+                 ((0,-12,-3,0,0), (1,4,1,1,2)),
+                 ((0,10,10,5,1), (1,10,20,7,2)) ]
+        for roi in rois:
+            expected = map( tuple, getIntersectingBlocks( blockshape, roi ) )
+            block_starts = getIntersectingBlockStarts( blockshape, roi )
+            assert block_starts == expected, "{} != {}".format( block_starts, expected )
+
 if __name__ == "__main__":
     # Run nose
     import sys
@@ -21,7 +21,8 @@
 ###############################################################################
 import time
 import threading
-from lazyflow.request.threadPool import ThreadPool
+import greenlet
+from lazyflow.request.threadPool import ThreadPool, ThreadPoolAutoTuner
 
 class TestThreadPool(object):
     """
@@ -62,6 +63,28 @@ class TestThreadPool(object):
     def test(self):
         for _ in range(10):
             self._testAssignmentConsistency()
+
+    def testWakeUpMany(self):
+        lock = threading.Lock()
+        finished = []
+        num_tasks = 500
+        all_finished = threading.Event()
+
+        class Task(object):
+            def __init__(self, index):
+                self.index = index
+            def __lt__(self, other):
+                return self.index < other.index
+            def __call__(self):
+                with lock:
+                    finished.append( self.index )
+                    if len(finished) == num_tasks:
+                        all_finished.set()
+
+        self.thread_pool.wake_up_many( [ Task(i) for i in range(num_tasks) ] )
+        assert all_finished.wait(10.0), "Not all tasks were executed."
+        assert sorted(finished) == range(num_tasks)
+        self.thread_pool._wait_for_idle()
  
     def _testAssignmentConsistency(self):
         """
@@ -129,6 +152,336 @@ class TestThreadPool(object):
         # (avoid interfering with other tests in this suite).
         self.thread_pool._wait_for_idle()
 
+class TestWorkStealingThreadPool(TestThreadPool):
+    """
+    Same tests as above, but with the work-stealing scheduler.
+    """
+
+    @classmethod
+    def setupClass(cls):
+        cls.thread_pool = ThreadPool(num_workers = 4, work_stealing=True)
+
+    def testLocalTasksAreStolen(self):
+        """
+        Tasks that are spawned from within a worker are queued locally, 
+        but must still be executed by the other (idle) workers.
+        """
+        num_tasks = 4 # Same as num_workers
+        counter_lock = threading.Lock()
+        started = [0]
+        all_started = threading.Event()
+        thread_ids = set()
+
+        class Child(object):
+            def __call__(self):
+                with counter_lock:
+                    thread_ids.add( threading.current_thread() )
+                    started[0] += 1
+                    if started[0] == num_tasks:
+                        all_started.set()
+                # Block this worker until the other children are running, too.
+                # (Only possible if they were stolen by the other workers.)
+                all_started.wait(10.0)
+
+        # All children are spawned from the same worker, so they all land in its local queue.
+        def parent():
+            for _ in range(num_tasks):
+                TestWorkStealingThreadPool.thread_pool.wake_up( Child() )
+
+        self.thread_pool.wake_up( parent )
+
+        assert all_started.wait(10.0), "Local tasks were not stolen by the idle workers."
+        assert len(thread_ids) == num_tasks
+        self.thread_pool._wait_for_idle()
+
+class TestMemoryBudgetThreadPool(object):
+    """
+    Tasks with an estimated cost are only started while their summed cost fits into the pool's memory budget.
+    """
+    def testBudgetIsRespected(self):
+        thread_pool = ThreadPool(num_workers=4, memory_budget=100)
+        try:
+            lock = threading.Lock()
+            in_flight = [0]
+            max_in_flight = [0]
+            finished = []
+            all_finished = threading.Event()
+            num_tasks = 8
+
+            class Task(object):
+                def __init__(self, index):
+                    self.index = index
+                    self.estimated_bytes = 40
+
+                def __lt__(self, other):
+                    return self.index < other.index
+
+                def __call__(self):
+                    with lock:
+                        in_flight[0] += 1
+                        max_in_flight[0] = max( max_in_flight[0], in_flight[0] )
+                    time.sleep(0.05)
+                    with lock:
+                        in_flight[0] -= 1
+                        finished.append( self.index )
+                    thread_pool.release_budget( self )
+                    if len(finished) == num_tasks:
+                        all_finished.set()
+
+            for i in range(num_tasks):
+                thread_pool.wake_up( Task(i) )
+
+            assert all_finished.wait(10.0), "Held-back tasks were never released."
+            assert sorted(finished) == range(num_tasks)
+            assert max_in_flight[0] == 2, "Expected 2 tasks at a time, got {}".format( max_in_flight[0] )
+        finally:
+            thread_pool.stop()
+
+    def testOversizedTaskStillRuns(self):
+        """
+        A task that is bigger than the whole budget is started as soon as nothing else is in flight.
+        """
+        thread_pool = ThreadPool(num_workers=2, memory_budget=10)
+        try:
+            done = threading.Event()
+            def f():
+                thread_pool.release_budget( f )
+                done.set()
+            f.estimated_bytes = 1000
+            thread_pool.wake_up( f )
+            assert done.wait(10.0)
+        finally:
+            thread_pool.stop()
+
+    def testRetiredWorkerHandsOverAdmittedTasks(self):
+        """
+        When a work-stealing worker retires, its locally queued tasks are handed to the other workers.
+        They were already charged against the budget, so they must not be charged a second time.
+        """
+        thread_pool = ThreadPool(num_workers=1, work_stealing=True, memory_budget=100)
+        try:
+            lock = threading.Lock()
+            finished = []
+            all_finished = threading.Event()
+            num_tasks = 2
+
+            class Task(object):
+                def __init__(self, index):
+                    self.index = index
+                    self.estimated_bytes = 40
+
+                def __lt__(self, other):
+                    return self.index < other.index
+
+                def __call__(self):
+                    thread_pool.release_budget( self )
+                    with lock:
+                        finished.append( self.index )
+                        if len(finished) == num_tasks:
+                            all_finished.set()
+
+            def parent():
+                # The children land in this worker's local queue...
+                for i in range(num_tasks):
+                    thread_pool.wake_up( Task(i) )
+                # ...and this worker retires before it gets to them.
+                threading.current_thread().retire()
+
+            thread_pool.wake_up( parent )
+
+            # Only start a new worker once the retired one has handed over its tasks.
+            timeout = time.time() + 10.0
+            while len(thread_pool.workers) > 0 and time.time() < timeout:
+                time.sleep(0.01)
+            thread_pool.resize(1)
+
+            assert all_finished.wait(10.0), "The retired worker's local tasks were lost."
+            assert sorted(finished) == range(num_tasks)
+            assert thread_pool._in_flight_bytes == 0, \
+                "Budget leaked: {} bytes still in flight".format( thread_pool._in_flight_bytes )
+        finally:
+            thread_pool.stop()
+
+class TestResizableThreadPool(object):
+    """
+    The number of workers can be changed while tasks are running, without losing any tasks.
+    """
+    def _wait_for_worker_count(self, thread_pool, count):
+        timeout = time.time() + 10.0
+        while len(thread_pool.workers) != count and time.time() < timeout:
+            time.sleep(0.01)
+        return len(thread_pool.workers) == count
+
+    def testGrowAndShrink(self):
+        thread_pool = ThreadPool(num_workers=2)
+        try:
+            lock = threading.Lock()
+            finished = []
+            num_tasks = 100
+            all_finished = threading.Event()
+
+            class Task(object):
+                def __init__(self, index):
+                    self.index = index
+                def __lt__(self, other):
+                    return self.index < other.index
+                def __call__(self):
+                    time.sleep(0.005)
+                    with lock:
+                        finished.append( self.index )
+                        if len(finished) == num_tasks:
+                            all_finished.set()
+
+            for i in range(num_tasks):
+                thread_pool.wake_up( Task(i) )
+                if i == 20:
+                    thread_pool.resize(6)
+                    assert len(thread_pool.workers) == 6
+                if i == 60:
+                    thread_pool.resize(1)
+
+            assert all_finished.wait(10.0), "Some tasks were lost while resizing the pool."
+            assert sorted(finished) == range(num_tasks)
+            assert self._wait_for_worker_count( thread_pool, 1 ), "Retired workers did not exit."
+        finally:
+            thread_pool.stop()
+
+    def testRetiringWorkerFinishesItsTasks(self):
+        """
+        A suspended task can only be resumed by the worker it started on,
+        so that worker must stay alive until the task is complete, even after it was retired.
+        """
+        thread_pool = ThreadPool(num_workers=2)
+        try:
+            suspended = threading.Event()
+            finished = threading.Event()
+            thread_ids = []
+
+            class SuspendableTask(object):
+                """
+                Mimics a Request: The first call starts a greenlet, which suspends itself.
+                The second call resumes it.
+                """
+                def __init__(self):
+                    self._assigned_worker = None
+                    self.greenlet = None
+
+                @property
+                def assigned_worker(self):
+                    return self._assigned_worker
+    
+                @assigned_worker.setter
+                def assigned_worker(self, worker):
+                    self._assigned_worker = worker
+                    self.greenlet = greenlet.greenlet( self._run )
+
+                def _run(self):
+                    thread_ids.append( threading.current_thread() )
+                    suspended.set()
+                    self.greenlet.parent.switch()
+                    thread_ids.append( threading.current_thread() )
+                    finished.set()
+
+                def __call__(self):
+                    self.greenlet.switch()
+
+            task = SuspendableTask()
+            thread_pool.wake_up( task )
+            assert suspended.wait(10.0)
+
+            # Retire all workers but one, and make sure the task's worker is among the retired ones.
+            task.assigned_worker.retire()
+            thread_pool.num_workers = 1
+            time.sleep(0.1)
+            assert task.assigned_worker in thread_pool.workers, "Worker exited before its task was complete."
+
+            thread_pool.wake_up( task )
+            assert finished.wait(10.0), "Suspended task was lost after its worker was retired."
+            assert thread_ids[0] == thread_ids[1]
+            assert self._wait_for_worker_count( thread_pool, 1 )
+        finally:
+            thread_pool.stop()
+
+    def testAutoTuner(self):
+        thread_pool = ThreadPool(num_workers=2)
+        try:
+            release = threading.Event()
+            started = threading.Semaphore(0)
+            def make_blocked_task():
+                def blocked():
+                    started.release()
+                    release.wait(10.0)
+                return blocked
+
+            # Both workers are blocked without using the CPU, and more work is waiting.
+            for _ in range(4):
+                thread_pool.wake_up( make_blocked_task() )
+            started.acquire()
+            started.acquire()
+
+            tuner = ThreadPoolAutoTuner( thread_pool, min_workers=2, max_workers=3 )
+            tuner.adjust( cores_used=0.0 )
+            assert thread_pool.num_workers == 3
+            tuner.adjust( cores_used=0.0 )
+            assert thread_pool.num_workers == 3, "Exceeded max_workers"
+
+            # CPU saturated: shrink, but not below min_workers.
+            tuner.adjust( cores_used=tuner.num_cores )
+            assert thread_pool.num_workers == 2
+            tuner.adjust( cores_used=tuner.num_cores )
+            assert thread_pool.num_workers == 2, "Went below min_workers"
+
+            release.set()
+            thread_pool._wait_for_idle()
+        finally:
+            thread_pool.stop()
+
+    def testAutoTunerWorkStealing(self):
+        """
+        In work-stealing mode, tasks spawned by a worker wait in its local queue (not in the shared queue).
+        The auto-tuner must count them as waiting, too.
+        """
+        thread_pool = ThreadPool(num_workers=2, work_stealing=True)
+        try:
+            release = threading.Event()
+            all_started = threading.Event()
+            started = threading.Semaphore(0)
+            spawned = threading.Semaphore(0)
+            def make_blocked_task():
+                def blocked():
+                    release.wait(10.0)
+                return blocked
+            def make_spawner_task():
+                def spawner():
+                    # Don't spawn anything until both workers are busy, so no idle worker can steal the new tasks.
+                    started.release()
+                    all_started.wait(10.0)
+                    thread_pool.wake_up( make_blocked_task() )
+                    thread_pool.wake_up( make_blocked_task() )
+                    spawned.release()
+                    release.wait(10.0)
+                return spawner
+
+            # Both workers are blocked without using the CPU, and the tasks they spawned are waiting.
+            for _ in range(2):
+                thread_pool.wake_up( make_spawner_task() )
+            started.acquire()
+            started.acquire()
+            all_started.set()
+            spawned.acquire()
+            spawned.acquire()
+            assert len(thread_pool.unassigned_tasks) == 0
+            assert thread_pool.tasks_waiting() == 4
+
+            tuner = ThreadPoolAutoTuner( thread_pool, min_workers=2, max_workers=3 )
+            tuner.adjust( cores_used=0.0 )
+            assert thread_pool.num_workers == 3
+
+            release.set()
+            thread_pool._wait_for_idle()
+            assert thread_pool.tasks_waiting() == 0
+        finally:
+            thread_pool.stop()
 
 if __name__ == "__main__":
     import sys
@@ -22,7 +22,7 @@
 import copy
 import operator # This is the Python standard operator module, not lazyflow.operator!
 import numpy
-from lazyflow.roi import TinyVector
+from lazyflow.roi import TinyVector, TinyPoint
 
 class TestTinyVector(object):
     
@@ -185,6 +185,33 @@ class TestTinyVector(object):
         self._checkUnaryOperation(operator.abs)
         self._checkUnaryOperation(operator.invert)
 
+    def testMismatchedLengths(self):
+        # Like zip(), the result is truncated to the shorter operand.
+        assert self.v1 + [1,1] == [2,3]
+        assert [1,1] - self.v1 == [0,-1]
+
+class TestTinyPoint(object):
+
+    def testArithmetic(self):
+        p = TinyPoint((10, 20, 30))
+        a = numpy.array(p)
+        for op in [operator.add, operator.sub, operator.mul, operator.floordiv, operator.mod]:
+            result = op(p, (3, 4, 5))
+            assert isinstance( result, TinyPoint )
+            assert tuple(result) == tuple(op(a, (3, 4, 5)))
+        assert tuple(p * 2) == (20, 40, 60)
+        assert tuple(100 - p) == (90, 80, 70)
+        assert tuple(-p) == (-10, -20, -30)
+
+    def testHashing(self):
+        p = TinyPoint((10, 20, 30))
+        assert p == (10, 20, 30)
+        assert hash(p) == hash((10, 20, 30))
+
+        d = { (10, 20, 30) : 'a' }
+        assert d[p] == 'a'
+        assert d[TinyPoint((0,0,0)) + p] == 'a'
+
 if __name__ == "__main__":
     import sys
     import nose